@@ -0,0 +1,115 @@
+"""Micro benchmark of building match records, to_dict walks against stores.extract key paths
+
+    python -m bench.extract [matches] [rounds]
+
+Matches come from bench.fake_source without latency, both paths build the record of the match owner and the
+10 participant entries and must give the same json.
+"""
+import copy
+import json
+import logging
+import statistics
+import sys
+import time
+
+from stores import riot
+from stores.constants import LOG, DATE_FORMAT_HOUR
+from stores.extract import extractor
+from bench import fake_source
+
+
+def recursive_fill_template_from_dict(data: dict, template: dict):
+    for f_key in data:
+        if f_key in template:
+            template[f_key] = data[f_key]
+        if isinstance(data[f_key], dict):
+            recursive_fill_template_from_dict(data[f_key], template)
+
+
+def build_walk(player, match, summoners):
+    """The previous path, deepcopy of the templates filled from full to_dict trees"""
+    participant = [x.summoner.name for x in match.participants].index(player.username)
+    match_template = copy.deepcopy(player.match_template)
+    recursive_fill_template_from_dict(match.participants[participant].to_dict(), match_template['player_stats'])
+
+    for f_side in match.teams:
+        side_info = f_side.to_dict()
+        recursive_fill_template_from_dict(side_info, match_template['match_info']['sides'][f_side.side.name])
+        if player.username in [x['summonerName'] for x in side_info['participants']]:
+            match_template['match_info']['match_win'] = side_info['isWinner']
+            match_template['match_info']['player_side'] = f_side.side.name
+
+    recursive_fill_template_from_dict(match.to_dict(), match_template['match_info'])
+    match_template['match_info']['queue'] = match.queue.name
+    match_template['match_info']['duration'] = match.duration.seconds
+    match_template['match_info']['creation'] = match.creation.strftime(DATE_FORMAT_HOUR)
+
+    for f_player, summoner in zip(match.participants, summoners):
+        participant_stats = copy.deepcopy(player.participant_template)
+        recursive_fill_template_from_dict(f_player.to_dict(), participant_stats)
+        recursive_fill_template_from_dict(summoner.to_dict(), participant_stats)
+        match_template['match_ranks'][f_player.side.name].append(participant_stats)
+
+    return match_template
+
+
+def build_paths(player, match, summoners):
+    """The transform and enrich stages without riot calls"""
+    item = player.transform_match({'match': match, 'status': 'new'})
+    template = item['template']
+
+    for (f_player, participant_stats), summoner in zip(item['participants'], summoners):
+        extractor(player.participant_template).fill(summoner, participant_stats)
+        template['match_ranks'][f_player.side.name].append(participant_stats)
+
+    return template
+
+
+def main():
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 20
+    rounds = int(sys.argv[2]) if len(sys.argv) > 2 else 5
+
+    riot.PIPELINE = fake_source.pipeline(latency=0)
+
+    # transform_match logs every match
+    LOG.setLevel(logging.ERROR)
+
+    import stores.player
+    from stores.rate_limiter import riot_limiter
+
+    # the fake source has no limits
+    riot_limiter.app_windows = []
+    riot_limiter.method_windows = {}
+
+    class Database:
+        def save_player(self, data):
+            pass
+
+    player = stores.player.Player('Fake Summoner 0', Database())
+
+    matches = []
+    for match in player.get_match_list(count):
+        match.load()
+        summoners = [x.summoner for x in match.participants]
+        for summoner in summoners:
+            summoner.load()
+        matches.append((match, summoners))
+
+    # both paths must store the same json, objective entries come from sets so they are compared sorted
+    for match, summoners in matches:
+        walked = json.dumps(build_walk(player, match, summoners), sort_keys=True)
+        extracted = json.dumps(build_paths(player, match, summoners), sort_keys=True)
+        assert walked == extracted, f'records differ for {match.id}'
+
+    for name, build in [('to_dict walk', build_walk), ('key paths', build_paths)]:
+        timings = []
+        for _ in range(rounds):
+            start = time.perf_counter()
+            for match, summoners in matches:
+                build(player, match, summoners)
+            timings.append((time.perf_counter() - start) / len(matches) * 1000)
+        print(f'{name:>14}: {statistics.median(timings):8.3f} ms per match')
+
+
+if __name__ == '__main__':
+    main()
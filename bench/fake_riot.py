@@ -0,0 +1,142 @@
+"""Local fake Riot server enforcing rate limits, used to check the shared limiter and LimitedClient
+
+    python -m bench.fake_riot
+"""
+import logging
+import threading
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+
+from cassiopeia.datastores.common import HTTPClient, HTTPError
+from flask import Flask, request
+from werkzeug.serving import make_server
+
+from stores.rate_limiter import RateLimiter
+from stores.riot import LimitedClient, riot_endpoint
+
+# scaled down limits so a run takes seconds
+APP_LIMITS = [(10, 1), (40, 6)]
+METHOD_LIMITS = {
+    'summoner': [(30, 6)],
+    'league': [(8, 1)],
+    'match_list': [(30, 6)],
+    'match': [(30, 6)],
+}
+
+# riot api paths of the endpoints, formatted with the key
+PATHS = {
+    'summoner': '/lol/summoner/v4/summoners/by-name/{}',
+    'league': '/lol/league/v4/entries/by-summoner/{}',
+    'match_list': '/lol/match/v5/matches/by-puuid/{}/ids',
+    'match': '/lol/match/v5/matches/{}',
+}
+
+
+class FakeRiot:
+    def __init__(self, app_limits=None, method_limits=None, latency=0.02, port=5055):
+        """port 0 picks a free one"""
+        self.app_limits = APP_LIMITS if app_limits is None else app_limits
+        self.method_limits = METHOD_LIMITS if method_limits is None else method_limits
+        self.latency = latency
+        self.port = port
+
+        self.lock = threading.Lock()
+        self.history = {'app': deque()}
+        self.counts = {'ok': 0, 'limited': 0}
+        # requests that reached the server per path
+        self.requests = {}
+
+        self.app = Flask(__name__)
+        self.app.add_url_rule('/lol/<path:path>', view_func=self.handle)
+        self.server = None
+
+    def check(self, name, limits, now):
+        """Return seconds until the call fits in the windows, 0 if it fits"""
+        history = self.history.setdefault(name, deque())
+        if not limits:
+            return 0
+
+        while history and history[0] <= now - max(window for _, window in limits):
+            history.popleft()
+
+        for permits, window in limits:
+            in_window = [x for x in history if x > now - window]
+            if len(in_window) >= permits:
+                return in_window[0] + window - now
+        return 0
+
+    def handle(self, path):
+        endpoint = riot_endpoint(request.path) or 'other'
+
+        with self.lock:
+            self.requests[request.path] = self.requests.get(request.path, 0) + 1
+            now = time.monotonic()
+            retry = max(self.check('app', self.app_limits, now),
+                        self.check(endpoint, self.method_limits.get(endpoint, []), now))
+
+            if retry > 0:
+                self.counts['limited'] += 1
+                return {'status': {'status_code': 429}}, 429, {'Retry-After': str(int(retry) + 1)}
+
+            self.history['app'].append(now)
+            self.history[endpoint].append(now)
+            self.counts['ok'] += 1
+
+        time.sleep(self.latency)
+        return {'endpoint': endpoint, 'path': path}
+
+    def start(self):
+        self.server = make_server('127.0.0.1', self.port, self.app, threaded=True)
+        self.port = self.server.server_port
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        return f'http://127.0.0.1:{self.port}'
+
+    def stop(self):
+        self.server.shutdown()
+
+
+def fetch(client, url, endpoint, key):
+    """Status of one riot call made through the client"""
+    try:
+        client.get(url + PATHS[endpoint].format(key))
+    except HTTPError as e:
+        return e.code
+    return 200
+
+
+def drill(limiter, url, calls, workers=8):
+    """Fire calls through the limiter and LimitedClient as cassiopeia would, each (endpoint, key) pair
+
+    Returns elapsed seconds and the status of every call.
+    """
+    client = LimitedClient(HTTPClient(), limiter)
+
+    start = time.monotonic()
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        futures = [pool.submit(limiter.call, endpoint, key, lambda e=endpoint, k=key: fetch(client, url, e, k))
+                   for endpoint, key in calls]
+        codes = [x.result() for x in futures]
+
+    return time.monotonic() - start, codes
+
+
+if __name__ == '__main__':
+    logging.getLogger('werkzeug').setLevel(logging.ERROR)
+
+    fake = FakeRiot()
+    url = fake.start()
+
+    # 11 players asking for overlapping participants
+    calls = [('summoner', f'player_{i}') for i in range(11)]
+    calls += [('league', f'summoner_{i // 4}') for i in range(120)]
+    calls += [('match', f'match_{i // 2}') for i in range(60)]
+
+    limiter = RateLimiter(APP_LIMITS, METHOD_LIMITS)
+    elapsed, codes = drill(limiter, url, calls)
+    fake.stop()
+
+    print(f'{len(calls)} calls in {elapsed:.2f}s')
+    print(f'server: {fake.counts}')
+    print(f'limiter: {limiter.stats()}')
+    print(f'429 responses seen by callers: {codes.count(429)}')
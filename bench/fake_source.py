@@ -0,0 +1,376 @@
+"""Offline cassiopeia data source serving generated summoners, league entries and matches
+
+Plugged into the pipeline through stores.riot.PIPELINE, see pipeline()
+"""
+import itertools
+import random
+import threading
+import time
+import zlib
+from collections import Counter
+from typing import Type, TypeVar, MutableMapping, Any, Iterable
+
+from datapipelines import DataSource, PipelineContext, NotFoundError
+
+from cassiopeia.data import Platform, Region, Continent
+from cassiopeia.dto.summoner import SummonerDto
+from cassiopeia.dto.league import LeagueSummonerEntriesDto
+from cassiopeia.dto.match import MatchDto, MatchListDto
+from cassiopeia.dto.staticdata.realm import RealmDto
+
+from stores.constants import RIOT_METHOD_LIMITS
+from stores.rate_limiter import riot_limiter
+
+T = TypeVar('T')
+
+# every generated summoner uses this icon, synthetic databases save it so refreshes skip the download
+PROFILE_ICON_ID = 29
+
+TIERS = ['IRON', 'BRONZE', 'SILVER', 'GOLD', 'PLATINUM', 'EMERALD', 'DIAMOND']
+DIVISIONS = ['IV', 'III', 'II', 'I']
+CHAMPIONS = ['Ahri', 'Jinx', 'LeeSin', 'Thresh', 'Garen', 'Lux', 'Yasuo', 'Ezreal', 'Leona', 'Darius',
+             'Vi', 'Orianna', 'Caitlyn', 'Nautilus', 'Sett', 'Viktor', 'Kaisa', 'Sejuani', 'Renekton', 'Lulu']
+POSITIONS = ['TOP', 'JUNGLE', 'MIDDLE', 'BOTTOM', 'UTILITY']
+QUEUE_IDS = [420, 440, 400]
+PATCH = '13.10.1'
+
+# seconds between two generated games of the same summoner
+GAME_INTERVAL = 3 * 3600
+
+
+def summoner_id(name):
+    return f'fake-id-{name}'
+
+
+def summoner_puuid(name):
+    return f'fake-puuid-{name}'
+
+
+def name_from_key(key):
+    return key.split('-', 2)[2]
+
+
+def seeded(*parts):
+    return random.Random(zlib.crc32('/'.join(str(x) for x in parts).encode()))
+
+
+def league_entry(name):
+    rng = seeded('league', name)
+    wins = rng.randint(10, 300)
+    return {
+        'leagueId': 'fake-league',
+        'queueType': 'RANKED_SOLO_5x5',
+        'tier': rng.choice(TIERS),
+        'rank': rng.choice(DIVISIONS),
+        'summonerId': summoner_id(name),
+        'summonerName': name,
+        'leaguePoints': rng.randint(0, 99),
+        'wins': wins,
+        'losses': wins + rng.randint(-20, 20),
+        'veteran': False,
+        'inactive': False,
+        'freshBlood': False,
+        'hotStreak': False,
+    }
+
+
+def participant_stats(rng, name, team_id, slot, win, duration):
+    minutes = duration / 60
+    kills, deaths, assists = rng.randint(0, 15), rng.randint(0, 12), rng.randint(0, 20)
+    return {
+        'summonerName': name,
+        'summonerId': summoner_id(name),
+        'puuid': summoner_puuid(name),
+        'summonerLevel': rng.randint(30, 500),
+        'participantId': slot + 1,
+        'teamId': team_id,
+        'win': win,
+        'championName': rng.choice(CHAMPIONS),
+        'championId': rng.randint(1, 900),
+        'champLevel': rng.randint(8, 18),
+        'teamPosition': POSITIONS[slot % 5],
+        'individualPosition': POSITIONS[slot % 5],
+        'lane': POSITIONS[slot % 5],
+        'role': 'SOLO',
+        'kills': kills,
+        'deaths': deaths,
+        'assists': assists,
+        'doubleKills': rng.randint(0, 2),
+        'tripleKills': rng.randint(0, 1),
+        'quadraKills': 0,
+        'pentaKills': 0,
+        'firstBloodKill': rng.random() < 0.1,
+        'totalMinionsKilled': int(rng.uniform(0, 8) * minutes),
+        'totalAllyJungleMinionsKilled': rng.randint(0, 80),
+        'totalEnemyJungleMinionsKilled': rng.randint(0, 20),
+        'totalDamageTaken': rng.randint(5000, 40000),
+        'totalDamageDealt': rng.randint(20000, 200000),
+        'totalDamageDealtToChampions': rng.randint(5000, 50000),
+        'damageSelfMitigated': rng.randint(1000, 40000),
+        'totalHeal': rng.randint(0, 15000),
+        'totalHealsOnTeammates': rng.randint(0, 5000),
+        'totalDamageShieldedOnTeammates': rng.randint(0, 5000),
+        'totalTimeSpentDead': rng.randint(0, 300),
+        'totalTimeCCDealt': rng.randint(0, 600),
+        'timeCCingOthers': rng.randint(0, 60),
+        'turretTakedowns': rng.randint(0, 5),
+        'damageDealtToTurrets': rng.randint(0, 8000),
+        'objectivesStolen': 0,
+        'dragonTakedowns': rng.randint(0, 4),
+        'detectorWardsPlaced': rng.randint(0, 6),
+        'wardsPlaced': rng.randint(0, 30),
+        'visionScore': rng.randint(5, 80),
+        'enemyMissingPings': rng.randint(0, 10),
+        'baitPings': rng.randint(0, 3),
+        'goldEarned': rng.randint(6000, 18000),
+        'challenges': {
+            'goldPerMinute': round(rng.uniform(250, 550), 2),
+            'dodgeSkillShotsSmallWindow': rng.randint(0, 30),
+            'maxCsAdvantageOnLaneOpponent': rng.randint(0, 60),
+            'maxLevelLeadLaneOpponent': rng.randint(0, 3),
+            'visionScoreAdvantageLaneOpponent': round(rng.uniform(-1, 1), 3),
+            'teamDamagePercentage': round(rng.uniform(0.1, 0.35), 3),
+            'takedownOnFirstTurret': rng.randint(0, 1),
+            'epicMonsterStolenWithoutSmite': 0,
+            'teamRiftHeraldKills': rng.randint(0, 1),
+            'teamBaronKills': rng.randint(0, 2),
+            'teamElderDragonKills': 0,
+        },
+    }
+
+
+class FakeRiotSource(DataSource):
+    """Answers the riot calls the server makes from generated data, sleeping latency seconds per call"""
+
+    def __init__(self, latency=0.0, new_matches=5, history_size=100, pool_size=500, seed=0, group_size=1,
+                 group_games=0.0):
+        super().__init__()
+        self.latency = latency
+        self.new_matches = new_matches
+        self.history_size = history_size
+        self.pool = [f'Fake Summoner {i}' for i in range(pool_size)]
+        self.seed = seed
+
+        # summoners i // group_size play together, that share of their new games is listed for the whole group
+        self.group_size = group_size
+        self.group_games = group_games
+        self.group_rng = random.Random(seed)
+        # group -> [(match id, creation, members it was listed for)]
+        self.group_matches = {}
+
+        # match id -> (owners, creation timestamp)
+        self.matches = {}
+        self.ids = itertools.count(6_000_000_000)
+        self.lock = threading.Lock()
+
+        self.calls = Counter()
+
+    def call(self, name):
+        # stands in for the riot api services, so it spends limiter permits like stores.riot.LimitedClient
+        if name in RIOT_METHOD_LIMITS:
+            riot_limiter.request(name)
+
+        with self.lock:
+            self.calls[name] += 1
+        if self.latency:
+            time.sleep(self.latency)
+
+    @DataSource.dispatch
+    def get(self, type: Type[T], query: MutableMapping[str, Any], context: PipelineContext = None) -> T:
+        pass
+
+    @DataSource.dispatch
+    def get_many(self, type: Type[T], query: MutableMapping[str, Any],
+                 context: PipelineContext = None) -> Iterable[T]:
+        pass
+
+    @get.register(SummonerDto)
+    def get_summoner(self, query: MutableMapping[str, Any], context: PipelineContext = None) -> SummonerDto:
+        self.call('summoner')
+
+        if 'name' in query:
+            name = query['name']
+        elif 'id' in query:
+            name = name_from_key(query['id'])
+        elif 'puuid' in query:
+            name = name_from_key(query['puuid'])
+        else:
+            raise NotFoundError('fake source only knows summoners by name, id or puuid')
+
+        return SummonerDto({
+            'id': summoner_id(name),
+            'accountId': f'fake-account-{name}',
+            'puuid': summoner_puuid(name),
+            'name': name,
+            'profileIconId': PROFILE_ICON_ID,
+            'revisionDate': int(time.time() * 1000),
+            'summonerLevel': 100,
+            'region': platform_of(query).region.value,
+        })
+
+    @get.register(RealmDto)
+    def get_realms(self, query: MutableMapping[str, Any], context: PipelineContext = None) -> RealmDto:
+        return RealmDto({
+            'v': PATCH,
+            'l': 'en_US',
+            'n': {name: PATCH for name in ['item', 'rune', 'mastery', 'summoner', 'champion', 'profileicon',
+                                           'map', 'language', 'sticker']},
+            'dd': PATCH,
+            'cdn': 'https://ddragon.leagueoflegends.com/cdn',
+            'lg': PATCH,
+            'css': PATCH,
+            'profileiconmax': 28,
+            'store': None,
+            'region': platform_of(query).region.value,
+        })
+
+    @get.register(LeagueSummonerEntriesDto)
+    def get_league_entries(self, query: MutableMapping[str, Any],
+                           context: PipelineContext = None) -> LeagueSummonerEntriesDto:
+        self.call('league')
+
+        region = platform_of(query).region.value
+        entry = dict(league_entry(name_from_key(query['summoner.id'])), region=region)
+        return LeagueSummonerEntriesDto(entries=[entry], region=region, summonerId=query['summoner.id'])
+
+    @get.register(MatchListDto)
+    def get_match_list(self, query: MutableMapping[str, Any], context: PipelineContext = None) -> MatchListDto:
+        """Without startTime the newest history_size games, with it new_matches games after it, all on euw"""
+        self.call('match_list')
+
+        owner = name_from_key(query['puuid'])
+        now = int(time.time())
+        start_time = query.get('startTime')
+
+        if start_time is None:
+            creations = [now - i * GAME_INTERVAL for i in range(self.history_size)]
+        else:
+            start_time = int(getattr(start_time, 'int_timestamp', start_time))
+            step = max(1, (now - start_time) // (self.new_matches + 1))
+            creations = [now - i * step for i in range(self.new_matches)]
+
+        creations = creations[query.get('start', 0):][:int(query.get('count', 100))]
+
+        ids = []
+        with self.lock:
+            for creation in creations:
+                match_id, creation = self.list_match(owner, creation, start_time)
+                ids.append(f'{Platform.europe_west.value}_{match_id}')
+
+        continent = query.get('continent') or platform_of(query).continent
+        return MatchListDto({
+            'match_ids': ids,
+            'continent': Continent(continent).value,
+            'puuid': query['puuid'],
+            'type': None,
+            'queue': None,
+            'start': query.get('start', 0),
+            'pulled_match_count': int(min(100, query.get('count', 100))),
+        })
+
+    def group_of(self, name):
+        index = name.rsplit(' ', 1)[-1]
+        return int(index) // self.group_size if index.isdigit() else None
+
+    def list_match(self, owner, creation, start_time):
+        """Id and creation of a listed match, a game of the owner's group it wasn't listed for yet when one is left"""
+        group = self.group_of(owner)
+        if start_time is not None and self.group_games and self.group_size > 1 and group is not None:
+            games = self.group_matches.setdefault(group, [])
+            for match_id, group_creation, listed in games:
+                if owner not in listed and group_creation > start_time:
+                    listed.add(owner)
+                    return match_id, group_creation
+
+            # the whole group is in the game from the start, like participants of a real match
+            if self.group_rng.random() < self.group_games:
+                match_id = next(self.ids)
+                members = [self.pool[x] for x in range(group * self.group_size, (group + 1) * self.group_size)]
+                self.matches[match_id] = ([owner] + [x for x in members if x != owner], creation)
+                games.append((match_id, creation, {owner}))
+                return match_id, creation
+
+        match_id = next(self.ids)
+        self.matches[match_id] = ([owner], creation)
+        return match_id, creation
+
+    @get.register(MatchDto)
+    def get_match(self, query: MutableMapping[str, Any], context: PipelineContext = None) -> MatchDto:
+        self.call('match')
+
+        match_id = int(query['id'])
+        if match_id not in self.matches:
+            raise NotFoundError(f'fake source never listed match {match_id}')
+        owners, creation = self.matches[match_id]
+
+        rng = seeded(self.seed, match_id)
+        duration = rng.randint(15 * 60, 45 * 60)
+        blue_wins = rng.random() < 0.5
+
+        names = owners + rng.sample([x for x in self.pool if x not in owners], 10 - len(owners))
+        rng.shuffle(names)
+
+        participants = []
+        for slot, name in enumerate(names):
+            team_id = 100 if slot < 5 else 200
+            stats = participant_stats(rng, name, team_id, slot, blue_wins == (team_id == 100), duration)
+            participants.append(stats)
+
+        teams = [{
+            'teamId': team_id,
+            'win': blue_wins == (team_id == 100),
+            'bans': [],
+            'objectives': {name: {'first': False, 'kills': rng.randint(0, 10)}
+                           for name in ['baron', 'champion', 'dragon', 'inhibitor', 'riftHerald', 'tower']},
+        } for team_id in [100, 200]]
+
+        platform = platform_of(query)
+        return MatchDto({
+            'gameId': match_id,
+            'matchId': match_id,
+            'platformId': platform.value,
+            'continent': platform.continent.value,
+            'gameCreation': creation * 1000,
+            'gameStartTimestamp': creation * 1000,
+            'gameEndTimestamp': (creation + duration) * 1000,
+            'gameDuration': duration,
+            'gameMode': 'CLASSIC',
+            'gameType': 'MATCHED_GAME',
+            'gameVersion': '13.10.505.6063',
+            'mapId': 11,
+            'queueId': rng.choice(QUEUE_IDS),
+            'participants': participants,
+            'teams': teams,
+        })
+
+
+def platform_of(query):
+    if 'platform' in query:
+        return Platform(query['platform'])
+    return Region(query['region']).platform
+
+
+def pipeline(latency=0.0, new_matches=5, history_size=100, pool_size=500, group_size=1, group_games=0.0):
+    """Pipeline settings for stores.riot.PIPELINE, cassiopeia's in memory cache in front of the fake source"""
+    return {
+        'Cache': {},
+        'FakeRiotSource': {
+            'package': 'bench.fake_source',
+            'latency': latency,
+            'new_matches': new_matches,
+            'history_size': history_size,
+            'pool_size': pool_size,
+            'group_size': group_size,
+            'group_games': group_games,
+        },
+    }
+
+
+def active_source():
+    """The FakeRiotSource of the configured pipeline, None when riot calls go elsewhere"""
+    from stores import riot
+
+    for source, _ in riot.cass().configuration.settings.pipeline._sources:
+        if isinstance(source, FakeRiotSource):
+            return source
+    return None
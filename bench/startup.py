@@ -0,0 +1,56 @@
+"""Cold start benchmark, fresh interpreter to first /player/get_all response
+
+    python -m bench.startup [runs] [database dir]
+"""
+import json
+import os
+import statistics
+import subprocess
+import sys
+import time
+
+from stores.constants import BASE_PATH
+
+CHILD = """
+import json, time
+start = time.perf_counter()
+
+import stores.manager
+# icons download in the background and would race the measured request, the scheduler stays on as in
+# production so its startup cost is measured
+stores.manager.ICON_PREWARM = False
+
+from main import app
+imported = time.perf_counter()
+
+response = app.test_client().get('/player/get_all')
+done = time.perf_counter()
+
+print(json.dumps({'import': imported - start, 'first_get_all': done - imported, 'status': response.status_code}))
+"""
+
+
+def run_once(env):
+    start = time.perf_counter()
+    output = subprocess.run([sys.executable, '-c', CHILD], cwd=os.path.join(BASE_PATH, '..'), env=env,
+                            capture_output=True, text=True, check=True).stdout
+    total = time.perf_counter() - start
+
+    result = json.loads(output.strip().splitlines()[-1])
+    result['total'] = total
+    return result
+
+
+if __name__ == '__main__':
+    runs = int(sys.argv[1]) if len(sys.argv) > 1 else 5
+
+    env = dict(os.environ)
+    if len(sys.argv) > 2:
+        env['DATABASE_PATH'] = os.path.abspath(sys.argv[2])
+
+    results = [run_once(env) for _ in range(runs)]
+
+    for key in ['import', 'first_get_all', 'total']:
+        values = [x[key] for x in results]
+        print(f'{key:>14}: median {statistics.median(values) * 1000:8.1f} ms, '
+              f'min {min(values) * 1000:8.1f} ms, max {max(values) * 1000:8.1f} ms')
@@ -0,0 +1,230 @@
+"""Server benchmark on a synthetic database, riot calls answered offline by bench.fake_source
+
+    python -m bench.suite --preset small --save small
+    python -m bench.suite --players 100 --matches 1000 --latency 0.05 --compare medium
+
+Each run copies a generated database (kept under bench/data) into a temp dir and measures a fresh
+interpreter: load_players time, get_all latency, one full refresh and peak memory. Baselines are
+saved to bench/baselines, --compare flags metrics that got worse than the tolerance.
+"""
+import argparse
+import json
+import os
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+from stores.constants import BASE_PATH
+
+BENCH_PATH = os.path.normpath(os.path.join(BASE_PATH, '../bench'))
+
+PRESETS = {
+    'small': (10, 40),
+    'medium': (100, 1000),
+    'stress': (1000, 10000),
+}
+
+# metrics where a bigger number is better, every other one is a duration or a size
+HIGHER_IS_BETTER = ['refresh_players_per_s', 'refresh_matches_per_s']
+
+
+def measure(config):
+    """Runs in the child interpreter, DATABASE_PATH and STORAGE_BACKEND already point at the copy"""
+    import resource
+
+    from stores import riot
+    from bench import fake_source
+
+    riot.PIPELINE = fake_source.pipeline(latency=config['latency'], new_matches=config['new_matches'],
+                                         group_size=5, group_games=config.get('group_games', 0.0))
+
+    import stores.manager
+    from stores.rate_limiter import riot_limiter
+    from bench.synthetic import usernames
+
+    # the fake source has no limits, what we measure is its latency
+    stores.manager.ICON_PREWARM = False
+    stores.manager.SCHEDULER_ENABLED = False
+    riot_limiter.app_windows = []
+    riot_limiter.method_windows = {}
+
+    from main import app
+    client = app.test_client()
+    results = {}
+
+    manager = stores.manager.get_manager()
+    manager.usernames = usernames(config['players'])
+
+    start = time.perf_counter()
+    manager.load_players()
+    results['load_players_s'] = time.perf_counter() - start
+
+    def get_all():
+        start = time.perf_counter()
+        response = client.get('/player/get_all', headers={'Accept-Encoding': 'gzip'})
+        assert response.status_code == 200, response.status_code
+        return (time.perf_counter() - start) * 1000
+
+    results['get_all_cold_ms'] = get_all()
+    warm = [get_all() for _ in range(config['requests'])]
+    results['get_all_warm_ms'] = statistics.median(warm)
+    results['get_all_warm_p95_ms'] = sorted(warm)[int(len(warm) * 0.95)]
+
+    matches_before = sum(len(x.match_history) for x in manager.all_players())
+
+    start = time.perf_counter()
+    job, _ = manager.add_rank_to_history()
+    while not job.done:
+        time.sleep(0.01)
+    refresh = time.perf_counter() - start
+
+    matches_added = sum(len(x.match_history) for x in manager.all_players()) - matches_before
+    results['refresh_s'] = refresh
+    results['refresh_players_per_s'] = config['players'] / refresh
+    results['refresh_matches_per_s'] = matches_added / refresh
+    results['refresh_failed'] = sum(x['status'] == 'failed' for x in job.to_json()['progress'].values())
+    results['matches_added'] = matches_added
+    results['riot_calls'] = dict(fake_source.active_source().calls)
+
+    # every player was saved so the body is built again
+    results['get_all_rebuild_ms'] = get_all()
+
+    # linux reports kilobytes
+    results['peak_rss_mb'] = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+    return results
+
+
+def database(players, matches, backend):
+    """Copy of the generated database in a new temp dir, generated on first use"""
+    from bench.synthetic import generate_database
+    from stores.storage import migrate_json_to_sqlite
+
+    source = os.path.join(BENCH_PATH, 'data', f'{players}x{matches}', 'players_db.json')
+    if not os.path.exists(source):
+        print(f'generating {players} players with {matches} matches each')
+        generate_database(source, players, matches)
+
+    database_dir = tempfile.mkdtemp(prefix='bench-')
+    json_path = os.path.join(database_dir, 'players_db.json')
+    shutil.copyfile(source, json_path)
+
+    if backend == 'sqlite':
+        migrate_json_to_sqlite(json_path, os.path.join(database_dir, 'players.sqlite3'))
+
+    return database_dir
+
+
+def run_once(config):
+    database_dir = database(config['players'], config['matches'], config['backend'])
+    env = dict(os.environ, DATABASE_PATH=database_dir, STORAGE_BACKEND=config['backend'])
+
+    try:
+        output = subprocess.run([sys.executable, '-m', 'bench.suite', '--child', json.dumps(config)],
+                                cwd=os.path.join(BASE_PATH, '..'), env=env,
+                                capture_output=True, text=True, check=True).stdout
+    finally:
+        shutil.rmtree(database_dir, ignore_errors=True)
+
+    return json.loads(output.strip().splitlines()[-1])
+
+
+def summarize(runs):
+    """Median of every numeric metric over the runs"""
+    summary = {}
+    for key, value in runs[0].items():
+        if isinstance(value, (int, float)):
+            summary[key] = statistics.median(x[key] for x in runs)
+        else:
+            summary[key] = value
+    return summary
+
+
+def compare(results, baseline, tolerance):
+    """Print every metric next to the baseline, returns the names of the regressed ones"""
+    regressions = []
+
+    for key, value in results.items():
+        if not isinstance(value, (int, float)) or key not in baseline['results']:
+            continue
+
+        old = baseline['results'][key]
+        change = (value - old) / old if old else 0
+        worse = -change if key in HIGHER_IS_BETTER else change
+
+        flag = ''
+        if worse > tolerance:
+            flag = '  <- regression'
+            regressions.append(key)
+
+        print(f'{key:>24}: {value:12.3f}  baseline {old:12.3f}  {change * 100:+7.1f}%{flag}')
+
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark the server against a synthetic database')
+    parser.add_argument('--preset', choices=PRESETS)
+    parser.add_argument('--players', type=int, default=10)
+    parser.add_argument('--matches', type=int, default=40, help='matches per player in the database')
+    parser.add_argument('--new-matches', type=int, default=5, help='new matches per player found by the refresh')
+    parser.add_argument('--latency', type=float, default=0.02, help='seconds per fake riot call')
+    parser.add_argument('--group-games', type=float, default=0.0,
+                        help='share of new matches played together by groups of 5 tracked players')
+    parser.add_argument('--backend', choices=['tinydb', 'sqlite'], default='tinydb')
+    parser.add_argument('--requests', type=int, default=20, help='warm get_all requests')
+    parser.add_argument('--runs', type=int, default=3)
+    parser.add_argument('--save', metavar='NAME', help='save the results as bench/baselines/NAME.json')
+    parser.add_argument('--compare', metavar='NAME', help='compare against bench/baselines/NAME.json')
+    parser.add_argument('--tolerance', type=float, default=0.2, help='allowed slowdown before flagging')
+    parser.add_argument('--child', help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child:
+        print(json.dumps(measure(json.loads(args.child))))
+        return
+
+    if args.preset:
+        args.players, args.matches = PRESETS[args.preset]
+
+    config = {
+        'players': args.players,
+        'matches': args.matches,
+        'new_matches': args.new_matches,
+        'latency': args.latency,
+        'backend': args.backend,
+        'requests': args.requests,
+    }
+    # left out when unused so older baselines keep matching
+    if args.group_games:
+        config['group_games'] = args.group_games
+    print(f'config {config}')
+
+    results = summarize([run_once(config) for _ in range(args.runs)])
+
+    if args.compare:
+        with open(os.path.join(BENCH_PATH, 'baselines', f'{args.compare}.json')) as f:
+            baseline = json.load(f)
+        if baseline['config'] != config:
+            print(f'baseline config differs: {baseline["config"]}')
+        regressions = compare(results, baseline, args.tolerance)
+    else:
+        regressions = []
+        for key, value in results.items():
+            print(f'{key:>24}: {value:12.3f}' if isinstance(value, float) else f'{key:>24}: {value}')
+
+    if args.save:
+        path = os.path.join(BENCH_PATH, 'baselines', f'{args.save}.json')
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path, 'w') as f:
+            json.dump({'config': config, 'results': results}, f, indent=2, sort_keys=True)
+        print(f'saved baseline to {path}')
+
+    if regressions:
+        sys.exit(f'{len(regressions)} metrics regressed: {", ".join(regressions)}')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,148 @@
+"""Synthetic players_db.json in the layout Player.save_to_json writes
+
+    python -m bench.synthetic [players] [matches per player] [output path]
+"""
+import json
+import os
+import sys
+import time
+from datetime import datetime, timedelta
+
+from stores.constants import DATE_FORMAT, DATE_FORMAT_HOUR
+from stores.player import Player
+from bench.fake_source import PROFILE_ICON_ID, GAME_INTERVAL, POSITIONS, QUEUE_IDS, participant_stats, seeded, \
+    league_entry
+import stores.utils as utils
+
+# cassiopeia queue names the server stores
+QUEUE_NAMES = {420: 'ranked_solo_fives', 440: 'ranked_flex_fives', 400: 'normal_draft_fives'}
+
+# days between two rank history points
+RANK_INTERVAL = 3
+
+
+def usernames(players):
+    return [f'Fake Summoner {i}' for i in range(players)]
+
+
+def flatten(stats):
+    return dict(stats, **stats['challenges'])
+
+
+def fill(template, values):
+    return {key: values.get(key, default) for key, default in template.items()}
+
+
+def generate_match(template, username, match_id, creation, rng):
+    duration = rng.randint(15 * 60, 45 * 60)
+    blue_wins = rng.random() < 0.5
+    slot = rng.randrange(10)
+    player_side = 'blue' if slot < 5 else 'red'
+
+    ranks = {'blue': [], 'red': []}
+    player_stats = None
+    for i in range(10):
+        side = 'blue' if i < 5 else 'red'
+        name = username if i == slot else f'Fake Summoner {rng.randrange(100000)}'
+        stats = flatten(participant_stats(rng, name, 100 if side == 'blue' else 200, i, blue_wins == (side == 'blue'),
+                                          duration))
+        if i == slot:
+            player_stats = fill(template['player_stats'], stats)
+
+        entry = league_entry(name)
+        ranks[side].append({
+            'summonerName': name,
+            'rank': utils.convert_to_rank_val(dict(entry, division=entry['rank'])),
+            'winrate': [entry['wins'], entry['losses']],
+            'level': stats['summonerLevel'],
+            'championName': stats['championName'],
+            'individualPosition': POSITIONS[i % 5],
+            'lane': stats['lane'],
+            'role': stats['role'],
+            'kills': stats['kills'],
+            'deaths': stats['deaths'],
+            'assists': stats['assists'],
+            'goldPerMinute': stats['goldPerMinute'],
+            'totalAllyJungleMinionsKilled': stats['totalAllyJungleMinionsKilled'],
+            'totalEnemyJungleMinionsKilled': stats['totalEnemyJungleMinionsKilled'],
+            'totalMinionsKilled': stats['totalMinionsKilled'],
+        })
+
+    sides = {side: {'isWinner': blue_wins == (side == 'blue'),
+                    'objectives': {name: {'first': False, 'kills': rng.randint(0, 10)}
+                                   for name in ['baron', 'champion', 'dragon', 'inhibitor', 'riftHerald', 'tower']}}
+             for side in ['red', 'blue']}
+
+    return {
+        'match_info': {
+            'player_username': username,
+            'queue': QUEUE_NAMES[rng.choice(QUEUE_IDS)],
+            'match_win': sides[player_side]['isWinner'],
+            'player_side': player_side,
+            'duration': duration,
+            'creation': datetime.fromtimestamp(creation).strftime(DATE_FORMAT_HOUR),
+            'id': match_id,
+            'sides': sides,
+        },
+        'player_stats': player_stats,
+        'match_ranks': ranks,
+    }
+
+
+def generate_player(index, username, matches, now):
+    """One player document, matches newest last like the server appends them"""
+    rng = seeded('player', username)
+    template = Player(username, None).match_template
+
+    # newest game a day ago so a refresh has something new to find
+    newest = now - 86400
+    history = []
+    for i in reversed(range(matches)):
+        match_id = 5_000_000_000 + index * 100_000 + i
+        history.append(generate_match(template, username, match_id, newest - i * GAME_INTERVAL, rng))
+
+    entry = league_entry(username)
+    rank = utils.convert_to_rank_val(dict(entry, division=entry['rank']))
+    days = max(1, matches * GAME_INTERVAL // 86400)
+    rank_history = {(datetime.fromtimestamp(now) - timedelta(days=day)).strftime(DATE_FORMAT):
+                    max(0, rank + rng.randint(-150, 150)) for day in range(1, days + 1, RANK_INTERVAL)}
+
+    empty_queue = {'rank': 0, 'winrate': [0, 0], 'nearest_rank': ['', 0], 'rank_history': {}}
+    return {
+        'username': username,
+        'ranked': {
+            'RANKED_SOLO_5x5': {'rank': rank, 'winrate': [entry['wins'], entry['losses']],
+                                'nearest_rank': ['', 0], 'rank_history': rank_history},
+            'RANKED_FLEX_SR': empty_queue,
+        },
+        'match_history': history,
+        'invalid_matches': [],
+        'sync_cursor': {'creation': newest, 'id': history[-1]['match_info']['id']} if history else None,
+        'profile_icon_id': PROFILE_ICON_ID,
+    }
+
+
+def generate_database(path, players, matches):
+    """Write a tinydb file, one document at a time so stress sizes don't sit in memory"""
+    os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+    now = int(time.time())
+
+    with open(path, 'w') as f:
+        f.write('{"_default": {')
+        for i, username in enumerate(usernames(players)):
+            if i:
+                f.write(', ')
+            f.write(f'"{i + 1}": ')
+            json.dump(generate_player(i, username, matches, now), f, separators=(',', ':'))
+        f.write('}}')
+
+    return os.path.getsize(path)
+
+
+if __name__ == '__main__':
+    players = int(sys.argv[1]) if len(sys.argv) > 1 else 10
+    matches = int(sys.argv[2]) if len(sys.argv) > 2 else 40
+    path = sys.argv[3] if len(sys.argv) > 3 else f'bench/data/{players}x{matches}/players_db.json'
+
+    size = generate_database(path, players, matches)
+    print(f'wrote {players} players with {matches} matches each to {path}, {size / 1e6:.1f} MB')
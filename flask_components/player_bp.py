@@ -1,37 +1,242 @@
-from flask import Blueprint, request
-from stores.manager import summ_manager
-import time
+from flask import Blueprint, request, Response, g
+from stores.manager import get_manager
+from stores.aggregates import GROUP_KEYS
+from stores.stats_engine import CATEGORIES, AGGREGATIONS
+from stores.constants import GET_ALL_MAX_AGE, MATCH_PAGE_SIZE, MATCH_PAGE_MAX, ICON_SIZES, ICON_MAX_AGE, \
+    EVENT_HEARTBEAT
+from perf import Profiler
 
 player_bp = Blueprint('player', __name__)
-add_history_busy = False
+
+
+# every route is timed under its rule, not the raw path
+@player_bp.before_request
+def start_timer():
+    rule = request.url_rule.rule if request.url_rule else 'unmatched'
+    g.profiler = Profiler('http_request', route=rule, method=request.method)
+    g.profiler.start()
+
+
+@player_bp.teardown_request
+def stop_timer(exc):
+    if 'profiler' in g:
+        g.profiler.stop()
 
 
 @player_bp.route("/get_all", methods=["GET"])
 def get_all():
-    return summ_manager.all()
+    """Every player with its newest MATCH_HOT_SIZE matches
+
+    Older matches were archived, archived_matches counts them and matches_url pages through the whole history.
+    """
+    cached = get_manager().all_response()
+
+    # each encoding has its own etag so caches never revalidate one against the other
+    if 'gzip' in request.accept_encodings:
+        response = Response(cached['gzip'], mimetype='application/json')
+        response.content_encoding = 'gzip'
+        response.set_etag(cached['etag'] + '-gz')
+    else:
+        response = Response(cached['body'], mimetype='application/json')
+        response.set_etag(cached['etag'])
+
+    response.cache_control.public = True
+    response.cache_control.max_age = GET_ALL_MAX_AGE
+    response.vary.add('Accept-Encoding')
+
+    # answers If-None-Match with an empty 304
+    return response.make_conditional(request)
+
+
+@player_bp.route("/summary", methods=["GET"])
+def get_summary():
+    return get_manager().summary()
+
+
+@player_bp.route("/leaderboard", methods=["GET"])
+def get_leaderboard():
+    queue = request.args.get('queue', 'RANKED_SOLO_5x5')
+    limit = request.args.get('limit', type=int)
+
+    if queue not in ['RANKED_SOLO_5x5', 'RANKED_FLEX_SR']:
+        return {'error': f'unknown queue {queue}'}, 400
+
+    return get_manager().get_leaderboard(queue, limit)
+
+
+@player_bp.route("/group_stats", methods=["GET"])
+def get_group_stats():
+    stat = request.args.get('stat', 'kills')
+    agg = request.args.get('agg', 'mean')
+    group_by = request.args.get('group_by')
+    days = request.args.get('days', type=float)
+
+    engine = get_manager().get_stats_engine()
+    if stat not in engine.columns or stat in CATEGORIES:
+        return {'error': f'unknown stat {stat}'}, 400
+    if group_by is not None and group_by not in CATEGORIES:
+        return {'error': f'group_by must be one of {CATEGORIES}'}, 400
+    if agg not in AGGREGATIONS and not (agg[:1] == 'p' and agg[1:].isdigit() and int(agg[1:]) <= 100):
+        return {'error': f'agg must be one of {AGGREGATIONS} or pN'}, 400
+
+    filters = {name: request.args.getlist(name) or None for name in CATEGORIES}
+    return get_manager().get_group_stats(stat, agg=agg, group_by=group_by, days=days, **filters)
+
+
+def int_arg(name, default=None):
+    """Integer query argument, a ValueError naming it when it doesn't parse"""
+    value = request.args.get(name)
+    if value is None:
+        return default
+
+    try:
+        return int(value)
+    except ValueError:
+        raise ValueError(f'{name} must be an integer') from None
+
+
+@player_bp.route("/<username>/matches", methods=["GET"])
+def get_matches(username):
+    if username not in get_manager().usernames:
+        return {}, 404
+
+    fields = request.args.get('fields')
+    try:
+        since = int_arg('since')
+        cursor = int_arg('cursor')
+        limit = min(int_arg('limit', MATCH_PAGE_SIZE), MATCH_PAGE_MAX)
+    except ValueError as e:
+        return {'error': str(e)}, 400
+
+    if limit < 1:
+        return {'error': 'limit must be positive'}, 400
+
+    if fields is not None:
+        fields = [x.strip() for x in fields.split(',') if x.strip()]
+        unknown = sorted(set(fields) - get_manager().get_player(username).match_fields())
+        if unknown:
+            return {'error': f'unknown fields {unknown}'}, 400
+
+    return get_manager().get_matches(username, since=since, cursor=cursor, limit=limit, fields=fields)
+
+
+@player_bp.route("/<username>/stats", methods=["GET"])
+def get_stats(username):
+    if username not in get_manager().usernames:
+        return {}, 404
+
+    group_by = request.args.get('group_by')
+    if group_by is not None and group_by not in GROUP_KEYS:
+        return {'error': f'group_by must be one of {GROUP_KEYS}'}, 400
+
+    return get_manager().get_stats(username, group_by=group_by, queue=request.args.get('queue'),
+                                   champion=request.args.get('champion'), position=request.args.get('position'))
 
 
 @player_bp.route("/add_rank_to_history", methods=["GET"])
 def add_rank_to_history():
-    global add_history_busy
-    if not add_history_busy:
-        add_history_busy = True
-        summ_manager.add_rank_to_history()
-        # time.sleep(60)
-        add_history_busy = False
-        return {}, 200
-    else:
+    manager = get_manager()
+    job, created = manager.add_rank_to_history()
+
+    # a refresh is already running here or in another worker
+    if not created:
+        lease = manager.refresh_lease.current()
+        job_id = job.id if job is not None else lease['info'].get('id') if lease else None
+        return {'job_id': job_id, 'lease': lease}, 409
+
+    return {'job_id': job.id}, 202
+
+
+@player_bp.route("/jobs/<job_id>", methods=["GET"])
+def get_job(job_id):
+    job = get_manager().get_job(job_id)
+
+    if job is None:
         return {}, 404
 
+    return job
+
+
+@player_bp.route("/schedule", methods=["GET"])
+def get_schedule():
+    return get_manager().schedule_stats()
+
+
+@player_bp.route("/ingest_stats", methods=["GET"])
+def get_ingest_stats():
+    return get_manager().ingest_stats()
+
+
+@player_bp.route("/cache_stats", methods=["GET"])
+def get_cache_stats():
+    return get_manager().cache_stats()
+
+
+@player_bp.route("/events", methods=["GET"])
+def events():
+    """Server sent events: refresh, job, rank_changed, match_added, store_changed and reset"""
+    manager = get_manager()
+
+    # EventSource sends Last-Event-ID when it reconnects, the query arg covers the first connection
+    last_id = request.headers.get('Last-Event-ID', request.args.get('last_event_id'))
+    if last_id is not None and not last_id.isdigit():
+        return {'error': 'last_event_id must be an event id'}, 400
+
+    types = request.args.get('types')
+    if types is not None:
+        types = {x.strip() for x in types.split(',') if x.strip()}
+
+    subscriber = manager.events.subscribe(int(last_id) if last_id is not None else None)
+
+    def stream():
+        try:
+            yield from manager.events.stream(subscriber, EVENT_HEARTBEAT, types, on_idle=manager.check_store_events)
+        finally:
+            # the server closes the generator once the client went away
+            manager.events.unsubscribe(subscriber)
+
+    response = Response(stream(), mimetype='text/event-stream')
+    response.cache_control.no_cache = True
+    response.headers['X-Accel-Buffering'] = 'no'
+    return response
+
 
 @player_bp.route("/update", methods=["GET"])
 def update():
-    time.sleep(10)
-    print('update')
-    return {}, 200
+    """Events after since without holding a connection, for clients that can't keep a stream open"""
+    manager = get_manager()
+    since = request.args.get('since', type=int)
+
+    manager.check_store_events()
+    events = manager.events.since(since) if since is not None else []
+    return {
+        'last_event_id': manager.events.last_id(),
+        'missed': since is not None and manager.events.missed(since),
+        'events': [{'id': x[0], 'event': x[1], 'data': x[2]} for x in events],
+    }, 200
 
 
 @player_bp.route("/profile_icon", methods=["GET"])
 def get_profile_icon():
     player = request.args.get('player')
-    return summ_manager.get_profile_icon(player)
+    size = request.args.get('size', type=int)
+
+    if player not in get_manager().usernames:
+        return {}, 404
+
+    if size is not None and size not in ICON_SIZES:
+        return {'error': f'size must be one of {ICON_SIZES}'}, 400
+
+    icon = get_manager().get_profile_icon(player, size)
+
+    # the download is tried again on the next request, nothing may keep this answer
+    if icon is None:
+        return {'error': f'no profile icon for {player}, riot could not be reached'}, 502, {'Cache-Control': 'no-store'}
+
+    response = Response(icon['body'], mimetype='image/jpeg')
+    response.set_etag(icon['etag'])
+    response.last_modified = icon['last_modified']
+    response.cache_control.public = True
+    response.cache_control.max_age = ICON_MAX_AGE
+
+    return response.make_conditional(request)
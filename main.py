@@ -1,8 +1,18 @@
-from flask import Flask
+from flask import Flask, Response
 from flask_cors import CORS
 from flask_components.player_bp import player_bp
+from stores.manager import start_scheduler
+from perf import registry
 
 app = Flask(__name__)
 CORS(app)
 
 app.register_blueprint(player_bp, url_prefix='/player')
+
+# refreshes run from startup instead of from the first request
+start_scheduler()
+
+
+@app.route('/metrics')
+def metrics():
+    return Response(registry.render(), mimetype='text/plain; version=0.0.4')
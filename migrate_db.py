@@ -0,0 +1,11 @@
+import os
+
+from stores.constants import BASE_PATH
+from stores.storage import migrate_json_to_sqlite
+
+database_dir = os.path.join(BASE_PATH, '../database')
+json_path = os.path.join(database_dir, 'players_db.json')
+sqlite_path = os.path.join(database_dir, 'players.sqlite3')
+
+count = migrate_json_to_sqlite(json_path, sqlite_path)
+print(f'migrated {count} players to {sqlite_path}, start the server with STORAGE_BACKEND=sqlite')
@@ -1,18 +1,138 @@
+import functools
+import threading
 import time
+from bisect import bisect_left
+
+# upper bounds in seconds, the last bucket is +Inf
+BUCKETS = [0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30]
+
+HELP = {
+    'http_request': 'Flask route handling time',
+    'riot_call': 'Riot calls through cassiopeia, cache hits included',
+    'riot_wait': 'Time spent waiting for a rate limit permit',
+    'db_read': 'Player store reads',
+    'db_write': 'Player store writes and flushes',
+    'serialize': 'Encoding responses',
+    'refresh': 'Steps of a player refresh',
+    'ingest': 'Match ingest stages, per item',
+}
+
+
+class Histogram:
+    def __init__(self, buckets=BUCKETS):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.sum = 0.0
+        self.count = 0
+        self.lock = threading.Lock()
+
+    def observe(self, seconds):
+        index = bisect_left(self.buckets, seconds)
+        with self.lock:
+            self.counts[index] += 1
+            self.sum += seconds
+            self.count += 1
+
+    def snapshot(self):
+        with self.lock:
+            return list(self.counts), self.sum, self.count
+
+
+class Registry:
+    """Latency histograms by metric name and labels"""
+
+    def __init__(self):
+        # name -> labels tuple -> histogram
+        self.histograms = {}
+        self.lock = threading.Lock()
+
+    def histogram(self, name, labels=()):
+        series = self.histograms.get(name, {})
+        histogram = series.get(labels)
+        if histogram is not None:
+            return histogram
+
+        with self.lock:
+            return self.histograms.setdefault(name, {}).setdefault(labels, Histogram())
+
+    def observe(self, name, seconds, **labels):
+        self.histogram(name, tuple(sorted(labels.items()))).observe(seconds)
+
+    def render(self):
+        """Every histogram in the prometheus text format"""
+        lines = []
+
+        with self.lock:
+            metrics = {name: dict(series) for name, series in sorted(self.histograms.items())}
+
+        for name, series in metrics.items():
+            metric = f'{name}_seconds'
+            lines.append(f'# HELP {metric} {HELP.get(name, name)}')
+            lines.append(f'# TYPE {metric} histogram')
+
+            for labels, histogram in sorted(series.items()):
+                counts, total, count = histogram.snapshot()
+                label_text = ','.join(f'{k}="{v}"' for k, v in labels)
+                prefix = f'{label_text},' if label_text else ''
+
+                cumulative = 0
+                for bound, bucket_count in zip(histogram.buckets + ['+Inf'], counts):
+                    cumulative += bucket_count
+                    lines.append(f'{metric}_bucket{{{prefix}le="{bound}"}} {cumulative}')
+                lines.append(f'{metric}_sum{{{label_text}}} {total}')
+                lines.append(f'{metric}_count{{{label_text}}} {count}')
+
+        return '\n'.join(lines) + '\n'
+
+
+registry = Registry()
 
 
 class Profiler:
-    def __init__(self, name):
+    """Times a block or a function on the monotonic clock into a registry histogram
+
+        with Profiler('riot_call', endpoint='match'):
+            ...
+
+        @Profiler('db_read', op='get_player')
+        def get_player(...):
+    """
+
+    def __init__(self, name, verbose=False, registry=registry, **labels):
         self.name = name
+        self.labels = labels
+        self.verbose = verbose
+        self.registry = registry
 
         self.start_time = None
         self.end_time = None
 
     def start(self):
-        self.start_time = time.time()
+        self.start_time = time.perf_counter()
 
     def stop(self):
-        self.end_time = time.time()
+        self.end_time = time.perf_counter()
 
         time_passed = self.end_time - self.start_time
-        print(f'{self.name} - {time_passed} seconds have passed')
+        self.registry.observe(self.name, time_passed, **self.labels)
+
+        if self.verbose:
+            print(f'{self.name} - {time_passed} seconds have passed')
+        return time_passed
+
+    def __enter__(self):
+        self.start()
+        return self
+
+    def __exit__(self, *exc):
+        self.stop()
+        return False
+
+    def __call__(self, func):
+        # a fresh timer per call so threads don't share start times
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            with Profiler(self.name, self.verbose, self.registry, **self.labels):
+                return func(*args, **kwargs)
+
+        return wrapper
@@ -1,4 +1,5 @@
 import requests
 
 api = ["http://localhost:5000", "https://ttt-trustyfox.pythonanywhere.com"]
-requests.get(f'{api[1]}/player/add_rank_to_history')
+response = requests.get(f'{api[1]}/player/add_rank_to_history')
+print(response.status_code, response.json())
@@ -0,0 +1,99 @@
+from stores.constants import LOG
+
+GROUP_KEYS = ['queue', 'champion', 'position']
+
+
+class MatchAggregates:
+    """Running sums of player stats bucketed by queue, champion and teamPosition"""
+
+    def __init__(self, fields):
+        self.fields = fields
+
+        # (queue, champion, position) -> bucket
+        self.buckets = {}
+
+    def add(self, match):
+        info = match['match_info']
+        stats = match['player_stats']
+        key = (info['queue'], stats['championName'], stats['teamPosition'])
+
+        bucket = self.buckets.get(key)
+        if bucket is None:
+            bucket = {'games': 0, 'wins': 0, 'duration': 0, 'sums': dict.fromkeys(self.fields, 0)}
+            self.buckets[key] = bucket
+
+        bucket['games'] += 1
+        bucket['wins'] += 1 if info['match_win'] else 0
+        bucket['duration'] += info['duration'] or 0
+
+        sums = bucket['sums']
+        for field in self.fields:
+            sums[field] += stats.get(field) or 0
+
+    def rebuild(self, matches):
+        self.buckets = {}
+        self.extend(matches)
+
+    def extend(self, matches):
+        for match in matches:
+            try:
+                self.add(match)
+            except (KeyError, TypeError):
+                LOG.warning(f'(aggregates) - skipping malformed match {match.get("match_info", {}).get("id")}')
+
+    def to_json(self):
+        return [list(key) + [bucket] for key, bucket in self.buckets.items()]
+
+    def merge(self, buckets):
+        """Add buckets in the to_json layout, like the archived matches of a player"""
+        for *key, other in buckets:
+            bucket = self.buckets.get(tuple(key))
+            if bucket is None:
+                bucket = {'games': 0, 'wins': 0, 'duration': 0, 'sums': dict.fromkeys(self.fields, 0)}
+                self.buckets[tuple(key)] = bucket
+
+            bucket['games'] += other['games']
+            bucket['wins'] += other['wins']
+            bucket['duration'] += other['duration']
+            for field, value in other['sums'].items():
+                bucket['sums'][field] = bucket['sums'].get(field, 0) + value
+
+    def query(self, group_by=None, queue=None, champion=None, position=None):
+        """Summaries of the buckets matching the filters, one per group_by value or a single total"""
+        filters = dict(zip(GROUP_KEYS, [queue, champion, position]))
+        groups = {}
+
+        for key, bucket in self.buckets.items():
+            values = dict(zip(GROUP_KEYS, key))
+            if any(f is not None and values[name] != f for name, f in filters.items()):
+                continue
+
+            group = values[group_by] if group_by else 'all'
+            merged = groups.setdefault(group, {'games': 0, 'wins': 0, 'duration': 0,
+                                               'sums': dict.fromkeys(self.fields, 0)})
+            merged['games'] += bucket['games']
+            merged['wins'] += bucket['wins']
+            merged['duration'] += bucket['duration']
+            for field, value in bucket['sums'].items():
+                merged['sums'][field] += value
+
+        return [self.summarize(group, merged) for group, merged in
+                sorted(groups.items(), key=lambda x: x[1]['games'], reverse=True)]
+
+    @staticmethod
+    def summarize(group, bucket):
+        games = bucket['games']
+        sums = bucket['sums']
+        minutes = bucket['duration'] / 60
+
+        return {
+            'group': group,
+            'games': games,
+            'wins': bucket['wins'],
+            'losses': games - bucket['wins'],
+            'winrate': round(bucket['wins'] / games, 4),
+            'kda': round((sums.get('kills', 0) + sums.get('assists', 0)) / max(1, sums.get('deaths', 0)), 3),
+            'cs_per_minute': round((sums.get('totalMinionsKilled', 0) + sums.get('totalAllyJungleMinionsKilled', 0)
+                                    + sums.get('totalEnemyJungleMinionsKilled', 0)) / minutes, 3) if minutes else 0,
+            'averages': {field: round(value / games, 3) for field, value in sums.items()},
+        }
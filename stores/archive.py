@@ -0,0 +1,188 @@
+import gzip
+import heapq
+import json
+import os
+import tempfile
+import threading
+from operator import itemgetter
+from urllib.parse import quote
+
+from stores.constants import LOG
+from stores.storage import creation_timestamp, MATCH_SECTIONS
+from stores.utils import replace_file
+
+
+class MatchArchive:
+    """Matches that left a player's hot history, appended to one compressed file and read back by streaming
+
+    <name>.jsonl.gz   gzip members, one per archived batch, json lines newest first inside a member
+    <name>.idx        json line per member: offset, length, newest and oldest creation, match ids
+    <name>.sum.json   aggregate buckets of everything archived, loaded at startup instead of the matches
+
+    A match is archived once its index line is written, the summary names the number of members it counts
+    so a reader can tell it lags the index. Only the worker holding the refresh lease appends, readers pick
+    new index lines up as they appear.
+    """
+
+    def __init__(self, directory, username):
+        self.directory = directory
+        base = os.path.join(directory, quote(username, safe=''))
+        self.data_path = base + '.jsonl.gz'
+        self.index_path = base + '.idx'
+        self.summary_path = base + '.sum.json'
+
+        # index entries, loaded on the first read that needs them
+        self.entries = []
+        self.ids = set()
+        self.index_offset = 0
+        self.lock = threading.RLock()
+
+    def summary(self):
+        """Number of archived matches, members counted and their aggregate buckets"""
+        try:
+            with open(self.summary_path) as f:
+                return json.load(f)
+        except FileNotFoundError:
+            return {'count': 0, 'buckets': []}
+        except ValueError:
+            LOG.warning(f'(archive) - could not read {self.summary_path}')
+            return {'count': 0, 'buckets': []}
+
+    def load_index(self):
+        """Read index lines written since the last call"""
+        with self.lock:
+            try:
+                with open(self.index_path, 'rb') as f:
+                    f.seek(self.index_offset)
+                    for line in f:
+                        # a crash mid append leaves half a line, the next append starts a fresh one
+                        if not line.endswith(b'\n'):
+                            break
+                        self.index_offset += len(line)
+
+                        try:
+                            entry = json.loads(line)
+                        except ValueError:
+                            LOG.warning(f'(archive) - skipping broken index line in {self.index_path}')
+                            continue
+                        self.entries.append(entry)
+                        self.ids.update(entry['ids'])
+            except FileNotFoundError:
+                pass
+
+            return self.entries
+
+    def __contains__(self, match_id):
+        self.load_index()
+        return match_id in self.ids
+
+    def __len__(self):
+        self.load_index()
+        return len(self.ids)
+
+    def match_ids(self):
+        self.load_index()
+        return self.ids
+
+    def summary_current(self, summary):
+        """Whether summary counts every indexed member, a crash or a reader racing an append leaves it behind"""
+        entries = self.load_index()
+        # summaries from before members were counted only trail the index after a crash
+        return summary.get('members', len(entries)) == len(entries)
+
+    def append(self, matches, buckets):
+        """Archive matches as one member, buckets are the summary with these matches added
+
+        Returns the number of compressed bytes written.
+        """
+        matches = sorted(matches, key=creation_timestamp, reverse=True)
+        body = ''.join(json.dumps(x, separators=(',', ':')) + '\n' for x in matches).encode()
+        member = gzip.compress(body)
+
+        with self.lock:
+            os.makedirs(self.directory, exist_ok=True)
+            members = len(self.load_index()) + 1
+
+            # data first, a member the index doesn't point to is never read
+            with open(self.data_path, 'ab') as f:
+                offset = f.seek(0, os.SEEK_END)
+                f.write(member)
+                f.flush()
+                os.fsync(f.fileno())
+
+            entry = {
+                'offset': offset,
+                'length': len(member),
+                'newest': creation_timestamp(matches[0]),
+                'oldest': creation_timestamp(matches[-1]),
+                'ids': [x['match_info']['id'] for x in matches],
+            }
+            with open(self.index_path, 'ab+') as f:
+                # end a line left half written by a crash so it is skipped on its own
+                start = b''
+                if f.seek(0, os.SEEK_END):
+                    f.seek(-1, os.SEEK_END)
+                    start = b'' if f.read(1) == b'\n' else b'\n'
+                f.write(start + json.dumps(entry).encode() + b'\n')
+
+            summary = {'count': len(self), 'members': members, 'buckets': buckets}
+            fd, tmp_path = tempfile.mkstemp(dir=self.directory, suffix='.tmp')
+            with os.fdopen(fd, 'w') as f:
+                json.dump(summary, f)
+            replace_file(tmp_path, self.summary_path)
+
+        return len(member)
+
+    def stream(self, since=None, before=None, sections=MATCH_SECTIONS):
+        """Archived matches newest first as (creation, match) pairs, members outside the range aren't read"""
+        # a batch is older than the hot history it left, but a late sync can add matches older than one
+        # archived before, so members are read newest first and overlapping ones are merged
+        entries = sorted(self.load_index(), key=lambda x: x['newest'], reverse=True)
+        if not entries:
+            return
+
+        with open(self.data_path, 'rb') as f:
+            run = []
+            for entry in entries:
+                if since is not None and entry['newest'] <= since:
+                    break
+                if before is not None and entry['oldest'] >= before:
+                    continue
+
+                if run and entry['newest'] <= min(x['oldest'] for x in run):
+                    yield from self.merge_members(f, run, since, before, sections)
+                    run = []
+                run.append(entry)
+
+            yield from self.merge_members(f, run, since, before, sections)
+
+    def merge_members(self, f, entries, since, before, sections):
+        members = [self.read_member(f, x, since, before, sections) for x in entries]
+        if len(members) == 1:
+            return members[0]
+        return heapq.merge(*members, key=itemgetter(0), reverse=True)
+
+    def read_member(self, f, entry, since, before, sections):
+        # read whole before the first match so merged members can share the file
+        f.seek(entry['offset'])
+        lines = gzip.decompress(f.read(entry['length'])).splitlines()
+
+        for line in lines:
+            match = json.loads(line)
+            creation = creation_timestamp(match)
+            if since is not None and creation <= since:
+                continue
+            if before is not None and creation >= before:
+                continue
+            yield creation, {k: match[k] for k in sections if k in match}
+
+    def get_matches(self, since=None, before=None, limit=None, sections=None):
+        """Same pages as PlayerStore.get_matches"""
+        sections = MATCH_SECTIONS if sections is None else sections
+
+        matches = []
+        for pair in self.stream(since, before, sections):
+            matches.append(pair)
+            if limit is not None and len(matches) >= limit:
+                break
+        return matches
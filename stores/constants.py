@@ -9,3 +9,84 @@ LOG = logging.getLogger('my_logger')
 LOG.setLevel(logging.WARNING)
 
 BASE_PATH = os.path.dirname(__file__)
+
+# Refresh
+REFRESH_WORKERS = 4
+
+# Match ingest, threads per stage and items held between two stages
+INGEST_WORKERS = {
+    'fetch': 4,
+    'transform': 1,
+    'enrich': 4,
+}
+INGEST_QUEUE_SIZE = 8
+
+# Matches walked per sync, invalid ones are not counted
+MATCH_SYNC_LIMIT = 40
+
+# Riot api limits as (permits, seconds), app level is shared by every endpoint
+RIOT_APP_LIMITS = [(20, 1), (100, 120)]
+RIOT_METHOD_LIMITS = {
+    'summoner': [(1600, 60)],
+    'league': [(100, 60)],
+    'match_list': [(2000, 10)],
+    'match': [(2000, 10)],
+}
+
+# Participant rank cache
+RANK_CACHE_SIZE = 5000
+RANK_CACHE_TTL = 60 * 60 * 6
+RANK_CACHE_PERSIST = True
+
+# Matches kept in memory per player, older ones go to the compressed archive in batches
+MATCH_HOT_SIZE = 100
+MATCH_ARCHIVE_BATCH = 50
+
+# Sides and participant ranks stored once per match, entries kept in memory and seconds to wait on another
+# player building the same match
+SHARED_MATCH_CACHE = 2000
+SHARED_MATCH_WAIT = 60
+
+# Responses
+GET_ALL_MAX_AGE = 10
+MATCH_PAGE_SIZE = 20
+MATCH_PAGE_MAX = 100
+# get_all only carries the hot history, every player links to the pages reaching the archive
+MATCHES_URL = '/player/{}/matches'
+
+# Server sent events, events kept for clients resuming with Last-Event-ID, events queued per client before it
+# is dropped and seconds between keep alive comments
+EVENT_BACKLOG = 200
+EVENT_CLIENT_QUEUE = 500
+EVENT_HEARTBEAT = 15
+
+# Profile icons
+ICON_CACHE_BYTES = 8 * 1024 * 1024
+ICON_SIZES = [32, 64, 128]
+ICON_MAX_AGE = 60 * 60 * 24
+ICON_PREWARM = True
+
+# Riot payloads kept on disk, matches and timelines never expire
+RIOT_CACHE_PERSIST = True
+RIOT_CACHE_TTLS = {
+    'summoner': 60 * 60 * 24,
+    'league': 60 * 60 * 6,
+}
+
+# cross process leases, renewed every third of the ttl while held
+LEASE_TTL = 120
+
+# In process refresh scheduler, players with recent games are refreshed more often
+SCHEDULER_ENABLED = True
+SCHEDULER_MAX_CONCURRENT = 2
+# (seconds since the last game, seconds between refreshes), first match wins
+SCHEDULER_INTERVALS = [
+    (60 * 60 * 3, 60 * 20),
+    (60 * 60 * 24, 60 * 60),
+    (60 * 60 * 24 * 7, 60 * 60 * 6),
+]
+SCHEDULER_IDLE_INTERVAL = 60 * 60 * 24
+# share of the interval added or removed at random
+SCHEDULER_JITTER = 0.2
+# delay before trying again when another worker is writing
+SCHEDULER_RETRY = 60
@@ -0,0 +1,125 @@
+import itertools
+import json
+import queue
+import threading
+import time
+from collections import deque
+
+from stores.constants import LOG, EVENT_BACKLOG, EVENT_CLIENT_QUEUE
+
+
+class EventBus:
+    """Fans out server events to every connected stream, recent ones are kept so clients can resume
+
+    Events are (id, type, data) tuples, ids only go up within a process.
+    """
+
+    def __init__(self, backlog=EVENT_BACKLOG, client_queue=EVENT_CLIENT_QUEUE):
+        self.ids = itertools.count(1)
+        self.recent = deque(maxlen=backlog)
+        self.client_queue = client_queue
+
+        self.subscribers = set()
+        self.lock = threading.Lock()
+
+        self.published = 0
+        self.dropped = 0
+
+    def publish(self, event_type, data):
+        with self.lock:
+            event = (next(self.ids), event_type, data)
+            self.recent.append(event)
+            self.published += 1
+            subscribers = list(self.subscribers)
+
+        for subscriber in subscribers:
+            try:
+                subscriber.put_nowait(event)
+            except queue.Full:
+                # a client that stopped reading is cut off instead of holding events in memory
+                self.drop(subscriber)
+
+    def drop(self, subscriber):
+        with self.lock:
+            if subscriber not in self.subscribers:
+                return
+            self.subscribers.discard(subscriber)
+            self.dropped += 1
+
+        # room for the end marker, a publish racing for the slot just ends the stream later
+        try:
+            subscriber.get_nowait()
+        except queue.Empty:
+            pass
+        try:
+            subscriber.put_nowait(None)
+        except queue.Full:
+            pass
+        LOG.warning('(events) - dropped a stream that fell behind')
+
+    def last_id(self):
+        with self.lock:
+            return self.recent[-1][0] if self.recent else 0
+
+    def since(self, last_id):
+        """Kept events newer than last_id"""
+        with self.lock:
+            return [x for x in self.recent if x[0] > last_id]
+
+    def missed(self, last_id):
+        """Whether events after last_id already left the backlog, the client has to reload everything"""
+        with self.lock:
+            newest = self.recent[-1][0] if self.recent else 0
+            oldest = self.recent[0][0] if self.recent else newest + 1
+            # ids from before a restart are past the newest one
+            return last_id > newest or last_id < oldest - 1
+
+    def subscribe(self, last_id=None):
+        """Queue receiving every new event, starting with the kept ones after last_id"""
+        subscriber = queue.Queue(self.client_queue)
+        if last_id is not None and self.missed(last_id):
+            subscriber.put_nowait((None, 'reset', {'last_id': self.last_id()}))
+
+        with self.lock:
+            if last_id is not None:
+                for event in self.recent:
+                    if event[0] > last_id:
+                        subscriber.put_nowait(event)
+            self.subscribers.add(subscriber)
+        return subscriber
+
+    def unsubscribe(self, subscriber):
+        with self.lock:
+            self.subscribers.discard(subscriber)
+
+    def stream(self, subscriber, heartbeat, types=None, on_idle=None):
+        """SSE lines from a subscription, a comment every heartbeat seconds keeps proxies from closing it
+
+        Ends when the bus drops the subscriber, the caller unsubscribes once the client is gone.
+        """
+        while True:
+            try:
+                event = subscriber.get(timeout=heartbeat)
+            except queue.Empty:
+                if on_idle is not None:
+                    on_idle()
+                yield f': {int(time.time())}\n\n'
+                continue
+
+            if event is None:
+                return
+
+            event_id, event_type, data = event
+            if types is not None and event_type not in types:
+                continue
+            lines = f'event: {event_type}\ndata: {json.dumps(data, separators=(",", ":"))}\n\n'
+            yield lines if event_id is None else f'id: {event_id}\n' + lines
+
+    def stats(self):
+        with self.lock:
+            return {
+                'subscribers': len(self.subscribers),
+                'published': self.published,
+                'dropped': self.dropped,
+                'last_id': self.recent[-1][0] if self.recent else 0,
+            }
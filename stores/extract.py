@@ -0,0 +1,118 @@
+"""Template filling from cassiopeia objects by precomputed key paths instead of walking to_dict() trees"""
+import threading
+
+# values stored as they are, anything else is converted the way cassiopeia's to_dict does
+SCALARS = (str, int, float, bool, type(None))
+
+
+def plain(value):
+    """Value as CoreData.to_dict would have returned it"""
+    from cassiopeia.core.common import CoreData
+
+    if isinstance(value, CoreData):
+        return value.to_dict()
+    if isinstance(value, dict):
+        return {k: x.to_dict() if isinstance(x, CoreData) else x for k, x in value.items()}
+    if hasattr(value, '__iter__') and not isinstance(value, str):
+        return [x.to_dict() if isinstance(x, CoreData) else x for x in value]
+    return value
+
+
+def copier(template):
+    """Function returning fresh copies of a json template, a fraction of the cost of deepcopy"""
+    if isinstance(template, dict):
+        # nested values are replaced in place so the keys keep the template order
+        static = dict(template)
+        nested = [(k, copier(v)) for k, v in template.items() if not isinstance(v, SCALARS)]
+        if not nested:
+            return static.copy
+
+        def copy():
+            record = static.copy()
+            for k, f in nested:
+                record[k] = f()
+            return record
+
+        return copy
+
+    if isinstance(template, list):
+        items = [copier(x) for x in template]
+        return lambda: [f() for f in items]
+
+    return lambda: template
+
+
+class Extractor:
+    """Copies the fields of a flat template out of cassiopeia objects
+
+    The first object of every shape is walked once like recursive_fill_template_from_dict walked its to_dict(),
+    the paths to each field are kept and later objects only follow those. When a field sits at several depths
+    the shallowest one wins.
+    """
+
+    def __init__(self, fields):
+        self.fields = list(fields)
+
+        # shape -> [(field, [(core index, steps)])], steps are (is attribute, name)
+        self.plans = {}
+        self.lock = threading.Lock()
+
+    def shape(self, cores):
+        return tuple((type(x), frozenset(vars(x))) for x in cores)
+
+    def compile(self, cores):
+        from cassiopeia.core.common import CoreData
+
+        found = {x: [] for x in self.fields}
+
+        def walk(index, node, steps):
+            is_attr = isinstance(node, CoreData)
+            for name, value in (vars(node) if is_attr else node).items():
+                path = steps + ((is_attr, name),)
+                if name in found:
+                    found[name].append((index, path))
+                if isinstance(value, (CoreData, dict)):
+                    walk(index, value, path)
+
+        for index, core in enumerate(cores):
+            walk(index, core, ())
+
+        # later cores override earlier ones like to_dict's update, then shallow paths before deep ones
+        return [(field, sorted(paths, key=lambda x: (-x[0], len(x[1]))))
+                for field, paths in found.items() if paths]
+
+    def fill(self, obj, record):
+        """Set the fields of record found in obj, fields missing from obj keep their value"""
+        cores = [x for x in obj._data.values() if x is not None]
+
+        key = self.shape(cores)
+        plan = self.plans.get(key)
+        if plan is None:
+            with self.lock:
+                plan = self.plans.setdefault(key, self.compile(cores))
+
+        for field, paths in plan:
+            for index, steps in paths:
+                node = cores[index]
+                try:
+                    for is_attr, name in steps:
+                        node = node.__dict__[name] if is_attr else node[name]
+                except (KeyError, TypeError, AttributeError):
+                    continue
+
+                record[field] = node if isinstance(node, SCALARS) else plain(node)
+                break
+
+        return record
+
+
+extractors = {}
+
+
+def extractor(fields):
+    """Shared extractor for a set of fields, plans are reused by every player"""
+    key = tuple(fields)
+    found = extractors.get(key)
+    if found is None:
+        found = extractors.setdefault(key, Extractor(key))
+    return found
@@ -0,0 +1,90 @@
+import hashlib
+import io
+import os
+import threading
+from collections import OrderedDict
+from datetime import datetime, timezone
+
+from PIL import Image
+
+from stores.constants import LOG, ICON_CACHE_BYTES
+
+
+class IconCache:
+    """Raw jpeg bytes of profile icons and their resized variants, bounded by total size"""
+
+    def __init__(self, assets_path, max_bytes=ICON_CACHE_BYTES):
+        self.assets_path = assets_path
+        self.max_bytes = max_bytes
+
+        # (player, size) -> icon entry
+        self.entries = OrderedDict()
+        self.size = 0
+        self.lock = threading.Lock()
+
+    def path(self, player):
+        return os.path.join(self.assets_path, f'{player}.jpeg')
+
+    def exists(self, player):
+        return os.path.exists(self.path(player))
+
+    def get(self, player, size=None):
+        """Return {body, etag, last_modified} or None when the icon isn't on disk or is empty"""
+        key = (player, size)
+
+        with self.lock:
+            if key in self.entries:
+                self.entries.move_to_end(key)
+                return self.entries[key]
+
+        image_path = self.path(player)
+        if not os.path.exists(image_path):
+            return None
+
+        with open(image_path, 'rb') as f:
+            body = f.read()
+        if not body:
+            return None
+
+        # resize once, served as is afterwards
+        if size is not None:
+            output = io.BytesIO()
+            img = Image.open(io.BytesIO(body)).convert('RGB')
+            img.resize((size, size), Image.LANCZOS).save(output, format='JPEG', quality=90)
+            body = output.getvalue()
+
+        entry = {
+            'body': body,
+            'etag': hashlib.sha1(body).hexdigest(),
+            'last_modified': datetime.fromtimestamp(int(os.path.getmtime(image_path)), timezone.utc),
+        }
+
+        with self.lock:
+            if key not in self.entries:
+                self.size += len(body)
+            else:
+                self.size += len(body) - len(self.entries[key]['body'])
+            self.entries[key] = entry
+
+            while self.size > self.max_bytes and len(self.entries) > 1:
+                _, dropped = self.entries.popitem(last=False)
+                self.size -= len(dropped['body'])
+
+        return entry
+
+    def save(self, player, image):
+        """Write a PIL image as the player's icon and drop every cached variant"""
+        image_path = self.path(player)
+        os.makedirs(self.assets_path, exist_ok=True)
+
+        tmp_path = f'{image_path}.tmp'
+        image.convert('RGB').save(tmp_path, format='JPEG')
+        os.replace(tmp_path, image_path)
+
+        self.invalidate(player)
+        LOG.warning(f'(icon cache) - saved new icon for {player}')
+
+    def invalidate(self, player):
+        with self.lock:
+            for key in [x for x in self.entries if x[0] == player]:
+                self.size -= len(self.entries.pop(key)['body'])
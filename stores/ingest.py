@@ -0,0 +1,226 @@
+import heapq
+import queue
+import threading
+import time
+
+from stores.constants import LOG, INGEST_QUEUE_SIZE
+from perf import Profiler
+
+# end of stream marker, one per worker of the next stage
+DONE = object()
+
+
+class Stage:
+    """A step of the pipeline, func takes an item and returns it for the next stage"""
+
+    def __init__(self, name, func, workers=1):
+        self.name = name
+        self.func = func
+        self.workers = workers
+
+        # items waiting for this stage
+        self.queue = None
+
+        self.processed = 0
+        self.busy = 0.0
+        self.max_depth = 0
+        self.lock = threading.Lock()
+
+    def count(self, seconds):
+        with self.lock:
+            self.processed += 1
+            self.busy += seconds
+
+    def put(self, item):
+        self.queue.put(item)
+        if item is DONE:
+            return
+
+        depth = self.queue.qsize()
+        if depth > self.max_depth:
+            self.max_depth = depth
+
+    def stats(self, elapsed):
+        return {
+            'workers': self.workers,
+            'processed': self.processed,
+            'per_s': round(self.processed / elapsed, 2) if elapsed else 0,
+            'busy_s': round(self.busy, 3),
+            'queue_depth': self.queue.qsize() if self.queue is not None else 0,
+            'max_queue_depth': self.max_depth,
+        }
+
+
+class Pipeline:
+    """Runs source items through stages on their own threads, bounded queues between them
+
+    Items reach the sink in source order on the calling thread, the sink returns False to stop the
+    pipeline early. At most limit items are read from the source, the sink calls extend for items it
+    took without counting them. The first error of any stage stops it and is raised from run.
+    """
+
+    def __init__(self, name, source, stages, sink, queue_size=INGEST_QUEUE_SIZE, limit=None):
+        self.name = name
+        self.source = Stage('list', None)
+        self.stages = stages
+        self.sink = Stage('persist', sink)
+        self.queue_size = queue_size
+        self.iterable = source
+
+        self.limit = limit
+        self.sunk = 0
+        self.credit = threading.Condition()
+
+        self.stopped = threading.Event()
+        self.error = None
+        self.started = None
+        self.finished = None
+
+    def stop(self):
+        self.stopped.set()
+        with self.credit:
+            self.credit.notify_all()
+
+    def fail(self, stage, error):
+        if self.error is None:
+            LOG.warning(f'(ingest) - {self.name} {stage.name} failed with {error!r}')
+            self.error = error
+        self.stop()
+
+    def extend(self, count=1):
+        """Let count more items out of the source"""
+        with self.credit:
+            self.limit += count
+            self.credit.notify_all()
+
+    def may_feed(self, fed):
+        """Whether another source item can go in, at the limit it waits for the items in flight to be sunk"""
+        if self.limit is None:
+            return not self.stopped.is_set()
+
+        with self.credit:
+            self.credit.wait_for(lambda: fed < self.limit or self.sunk == fed or self.stopped.is_set())
+            if fed >= self.limit and not self.stopped.is_set():
+                LOG.warning(f'(ingest) - {self.name} reached its limit of {self.limit}, stopping')
+            return fed < self.limit and not self.stopped.is_set()
+
+    def feed(self):
+        first = self.stages[0] if self.stages else self.sink
+        seq = 0
+
+        try:
+            iterator = iter(self.iterable)
+            # nothing is listed past the limit so later stages never work on items the sink will not take
+            while self.may_feed(seq):
+                start = time.perf_counter()
+                item = next(iterator, DONE)
+                if item is DONE:
+                    break
+                self.source.count(time.perf_counter() - start)
+
+                first.put((seq, item))
+                seq += 1
+        except Exception as e:
+            self.fail(self.source, e)
+        finally:
+            for _ in range(first.workers):
+                first.put(DONE)
+
+    def work(self, stage, next_stage, finished):
+        while True:
+            entry = stage.queue.get()
+            if entry is DONE:
+                break
+
+            # drain without working once stopped so upstream puts never block
+            if self.stopped.is_set():
+                continue
+
+            seq, item = entry
+            try:
+                with Profiler('ingest', stage=stage.name) as timer:
+                    item = stage.func(item)
+                stage.count(timer.end_time - timer.start_time)
+            except Exception as e:
+                self.fail(stage, e)
+                continue
+
+            next_stage.put((seq, item))
+
+        # the last worker out closes the next stage
+        with stage.lock:
+            finished[stage.name] += 1
+            last = finished[stage.name] == stage.workers
+        if last:
+            for _ in range(next_stage.workers):
+                next_stage.put(DONE)
+
+    def run(self):
+        self.started = time.perf_counter()
+
+        for stage in self.stages + [self.sink]:
+            stage.queue = queue.Queue(self.queue_size)
+
+        threads = [threading.Thread(target=self.feed, name=f'ingest-{self.name}-list', daemon=True)]
+        finished = {x.name: 0 for x in self.stages}
+        for stage, next_stage in zip(self.stages, self.stages[1:] + [self.sink]):
+            for i in range(stage.workers):
+                threads.append(threading.Thread(target=self.work, args=(stage, next_stage, finished),
+                                                name=f'ingest-{self.name}-{stage.name}-{i}', daemon=True))
+
+        for thread in threads:
+            thread.start()
+
+        try:
+            self.drain()
+        finally:
+            self.stop()
+            for thread in threads:
+                thread.join()
+            self.finished = time.perf_counter()
+
+        if self.error is not None:
+            raise self.error
+
+    def drain(self):
+        # workers finish out of order, items wait here until every earlier one went through
+        pending = []
+        expected = 0
+
+        while True:
+            entry = self.sink.queue.get()
+            if entry is DONE:
+                break
+            if self.stopped.is_set():
+                continue
+
+            heapq.heappush(pending, entry)
+            while pending and pending[0][0] == expected:
+                seq, item = heapq.heappop(pending)
+                expected += 1
+
+                try:
+                    with Profiler('ingest', stage=self.sink.name) as timer:
+                        carry_on = self.sink.func(item)
+                    self.sink.count(timer.end_time - timer.start_time)
+                except Exception as e:
+                    self.fail(self.sink, e)
+                    break
+
+                if carry_on is False:
+                    self.stop()
+                    break
+
+                with self.credit:
+                    self.sunk += 1
+                    self.credit.notify_all()
+
+    def stats(self):
+        end = self.finished or time.perf_counter()
+        elapsed = end - self.started if self.started else 0
+
+        return {
+            'running': self.started is not None and self.finished is None,
+            'elapsed_s': round(elapsed, 3),
+            'stages': {x.name: x.stats(elapsed) for x in [self.source] + self.stages + [self.sink]},
+        }
@@ -0,0 +1,139 @@
+import threading
+import uuid
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+
+from stores.constants import LOG, DATE_FORMAT_HOUR
+
+
+class Job:
+    def __init__(self, name, targets, stats=None, on_done=None, on_update=None):
+        self.id = uuid.uuid4().hex
+        self.name = name
+        self.status = 'queued'
+        self.created = datetime.now().strftime(DATE_FORMAT_HOUR)
+        self.finished = None
+
+        # per target progress
+        self.progress = OrderedDict((target, {'status': 'queued', 'error': None}) for target in targets)
+        self.remaining = len(self.progress)
+        self.lock = threading.Lock()
+
+        # extra numbers reported with the job, frozen once it finishes
+        self.stats = stats
+        self.final_stats = None
+
+        # called with the job once every target finished
+        self.on_done = on_done
+
+        # called with the job and the target after every target change
+        self.on_update = on_update
+
+    @property
+    def done(self):
+        return self.status in ['done', 'failed']
+
+    def set_target(self, target, status, error=None):
+        finished = False
+
+        with self.lock:
+            self.progress[target] = {'status': status, 'error': error}
+
+            if status == 'running':
+                self.status = 'running'
+
+            if status in ['done', 'failed']:
+                self.remaining -= 1
+
+                # all targets finished
+                if self.remaining <= 0:
+                    failed = any(x['status'] == 'failed' for x in self.progress.values())
+                    self.status = 'failed' if failed else 'done'
+                    self.finished = datetime.now().strftime(DATE_FORMAT_HOUR)
+                    self.final_stats = self.stats() if self.stats else {}
+                    finished = True
+
+        if self.on_update:
+            self.on_update(self, target)
+
+        if finished and self.on_done:
+            self.on_done(self)
+
+    def get_stats(self):
+        if self.final_stats is not None:
+            return self.final_stats
+        return self.stats() if self.stats else {}
+
+    def to_json(self):
+        with self.lock:
+            return {
+                'id': self.id,
+                'name': self.name,
+                'status': self.status,
+                'created': self.created,
+                'finished': self.finished,
+                'completed': len(self.progress) - self.remaining,
+                'total': len(self.progress),
+                'progress': {k: dict(v) for k, v in self.progress.items()},
+                'stats': self.get_stats(),
+            }
+
+
+class JobRunner:
+    def __init__(self, max_workers=4, max_kept=20):
+        self.pool = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='job')
+        self.max_kept = max_kept
+
+        self.jobs = OrderedDict()
+        self.lock = threading.Lock()
+
+    def submit(self, name, targets, func, stats=None, on_done=None, on_update=None):
+        """Queue func(target) for every target and return the job tracking them"""
+        job = Job(name, targets, stats, on_done, on_update)
+
+        with self.lock:
+            self.jobs[job.id] = job
+
+            # forget the oldest finished jobs
+            while len(self.jobs) > self.max_kept:
+                oldest = next(iter(self.jobs))
+                if not self.jobs[oldest].done:
+                    break
+                self.jobs.pop(oldest)
+
+        if not job.progress:
+            job.status = 'done'
+            job.finished = job.created
+            job.final_stats = job.get_stats()
+            if on_done:
+                on_done(job)
+
+        for target in job.progress:
+            self.pool.submit(self._run, job, target, func)
+
+        return job
+
+    def _run(self, job, target, func):
+        job.set_target(target, 'running')
+
+        try:
+            func(target)
+        except Exception as e:
+            LOG.warning(f'(job {job.name}) - {target} failed with {e!r}')
+            job.set_target(target, 'failed', repr(e))
+            return
+
+        job.set_target(target, 'done')
+
+    def get(self, job_id):
+        with self.lock:
+            return self.jobs.get(job_id)
+
+    def active(self, name):
+        """Return the unfinished job with this name if any"""
+        with self.lock:
+            for job in reversed(self.jobs.values()):
+                if job.name == name and not job.done:
+                    return job
+        return None
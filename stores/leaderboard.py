@@ -0,0 +1,51 @@
+import threading
+from bisect import bisect_left, insort
+
+
+class Leaderboard:
+    """Players kept sorted by rank for each queue, only touched when a rank changes"""
+
+    def __init__(self, queues, day=None):
+        # ordinal day the nearest ranks were picked on, they move at midnight
+        self.day = day
+
+        # sorted (-rank, username) keys and the entry behind each username
+        self.order = {queue: [] for queue in queues}
+        self.entries = {queue: {} for queue in queues}
+        self.lock = threading.Lock()
+
+    def update(self, username, entry):
+        """entry holds queue, rank, winrate and nearest_rank as in Player.ranked"""
+        queue = entry['queue']
+
+        with self.lock:
+            order = self.order[queue]
+            old = self.entries[queue].get(username)
+
+            if old is not None:
+                index = bisect_left(order, (-old['rank'], username))
+                if index < len(order) and order[index] == (-old['rank'], username):
+                    order.pop(index)
+
+            insort(order, (-entry['rank'], username))
+            self.entries[queue][username] = entry
+
+    def top(self, queue, k=None):
+        with self.lock:
+            keys = self.order[queue][:k]
+            entries = [(username, self.entries[queue][username]) for _, username in keys]
+
+        return [self.format(position, username, entry) for position, (username, entry) in enumerate(entries, 1)]
+
+    @staticmethod
+    def format(position, username, entry):
+        wins, losses = entry['winrate']
+        return {
+            'position': position,
+            'username': username,
+            'rank': entry['rank'],
+            'nearest_rank': entry['nearest_rank'],
+            'delta': entry['rank'] - entry['nearest_rank'][1] if entry['nearest_rank'][1] else 0,
+            'winrate': [wins, losses],
+            'winrate_ratio': round(wins / (wins + losses), 4) if wins + losses else 0,
+        }
@@ -0,0 +1,142 @@
+import json
+import os
+import socket
+import sqlite3
+import threading
+import time
+
+from stores.constants import LOG, LEASE_TTL
+
+
+class Lease:
+    """Named lock shared by every worker process through a sqlite row, lapses ttl seconds after the last renewal
+
+    The holder renews it from a heartbeat thread, so a crashed worker only blocks the others until it lapses.
+    """
+
+    schema = """
+        CREATE TABLE IF NOT EXISTS leases (
+            name TEXT PRIMARY KEY,
+            holder TEXT NOT NULL,
+            info TEXT NOT NULL,
+            acquired REAL NOT NULL,
+            expires REAL NOT NULL
+        );
+    """
+
+    def __init__(self, path, name, ttl=LEASE_TTL):
+        self.path = path
+        self.name = name
+        self.ttl = ttl
+        self.holder = f'{socket.gethostname()}:{os.getpid()}:{id(self):x}'
+
+        # autocommit, transactions are opened by hand
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        self.conn = sqlite3.connect(path, timeout=10, isolation_level=None, check_same_thread=False)
+        self.conn.executescript(self.schema)
+        self.lock = threading.Lock()
+
+        # called on every renewal, its dict is shown to the other workers
+        self.describe = None
+        self.stop_heartbeat = None
+        self.heartbeat = None
+
+    def info(self):
+        return json.dumps(self.describe() if self.describe else {})
+
+    def acquire(self):
+        """Take the lease if it is free, lapsed or already ours, returns whether we hold it"""
+        now = time.time()
+
+        with self.lock:
+            self.conn.execute('BEGIN IMMEDIATE')
+            try:
+                row = self.conn.execute('SELECT holder, expires FROM leases WHERE name = ?', (self.name,)).fetchone()
+
+                if row is not None and row[0] != self.holder and row[1] > now:
+                    self.conn.execute('ROLLBACK')
+                    return False
+
+                # released leases expire at 0, anything else lapsed without a release
+                if row is not None and row[0] != self.holder and row[1] > 0:
+                    LOG.warning(f'(lease) - taking over lapsed {self.name} from {row[0]}')
+
+                self.conn.execute('INSERT OR REPLACE INTO leases VALUES (?, ?, ?, ?, ?)',
+                                  (self.name, self.holder, self.info(), now, now + self.ttl))
+                self.conn.execute('COMMIT')
+            except BaseException:
+                self.conn.execute('ROLLBACK')
+                raise
+
+        self.start_heartbeat()
+        return True
+
+    def renew(self):
+        """Push the expiry back, False when the lease was lost to another worker"""
+        with self.lock:
+            now = time.time()
+            cursor = self.conn.execute('UPDATE leases SET expires = ?, info = ? '
+                                       'WHERE name = ? AND holder = ? AND expires > ?',
+                                       (now + self.ttl, self.info(), self.name, self.holder, now))
+            return cursor.rowcount == 1
+
+    def release(self):
+        """Give the lease up, the row stays so the others can still read the final info"""
+        if self.stop_heartbeat is not None:
+            self.stop_heartbeat.set()
+            self.stop_heartbeat = None
+
+        with self.lock:
+            self.conn.execute('UPDATE leases SET expires = 0, info = ? WHERE name = ? AND holder = ?',
+                              (self.info(), self.name, self.holder))
+
+    def current(self, include_expired=False):
+        """Holder, info and times of the lease, None when nobody holds it"""
+        with self.lock:
+            row = self.conn.execute('SELECT holder, info, acquired, expires FROM leases WHERE name = ?',
+                                    (self.name,)).fetchone()
+
+        if row is None:
+            return None
+
+        expired = row[3] <= time.time()
+        if expired and not include_expired:
+            return None
+
+        return {
+            'name': self.name,
+            'holder': row[0],
+            'mine': row[0] == self.holder,
+            'info': json.loads(row[1]),
+            'acquired': row[2],
+            'expires': row[3],
+            'expired': expired,
+        }
+
+    def start_heartbeat(self):
+        # a heartbeat that gave up on its own is replaced, otherwise the lease lapses mid refresh
+        if self.stop_heartbeat is not None and self.heartbeat is not None and self.heartbeat.is_alive():
+            return
+
+        stop = threading.Event()
+        self.stop_heartbeat = stop
+
+        def beat():
+            try:
+                while not stop.wait(self.ttl / 3):
+                    try:
+                        renewed = self.renew()
+                    except sqlite3.Error as e:
+                        # a busy database is retried on the next beat, the lease still has two beats left
+                        LOG.warning(f'(lease) - could not renew {self.name}: {e}')
+                        continue
+
+                    if not renewed:
+                        LOG.warning(f'(lease) - lost {self.name}')
+                        break
+            finally:
+                if self.stop_heartbeat is stop:
+                    self.stop_heartbeat = None
+
+        self.heartbeat = threading.Thread(target=beat, name=f'lease-{self.name}', daemon=True)
+        self.heartbeat.start()
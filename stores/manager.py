@@ -1,93 +1,541 @@
-import cassiopeia as cass
 from dotenv import load_dotenv
-from tinydb import TinyDB, Query
 import os
 from pprint import pprint
 import time
 from datetime import datetime, date, timedelta
 from collections import defaultdict
-import io
-from PIL import Image
+import json
+import gzip
+import hashlib
+import threading
+import atexit
+from urllib.parse import quote
 
-from stores.constants import DATE_FORMAT, LOG, BASE_PATH
+from stores.constants import DATE_FORMAT, LOG, BASE_PATH, REFRESH_WORKERS, RANK_CACHE_PERSIST, MATCH_PAGE_SIZE, \
+    ICON_PREWARM, RIOT_CACHE_PERSIST, SCHEDULER_ENABLED, MATCHES_URL
 import stores.utils
 from stores.player import Player
+from stores.jobs import JobRunner
+from stores.storage import open_store
+from stores.rank_cache import participant_ranks
+from stores.rate_limiter import riot_limiter
+from stores.icon_cache import IconCache
+from stores.stats_engine import StatsEngine
+from stores.leaderboard import Leaderboard
+from stores.lease import Lease
+from stores.archive import MatchArchive
+from stores.match_store import MatchStore, is_compact, hydrate
+from stores.scheduler import RefreshScheduler
+from stores.events import EventBus
+from stores import riot
 from perf import Profiler
 
-# cassio settings
+# env, cassiopeia settings are applied on first use in stores.riot
 env_path = os.path.join(os.path.dirname(__file__), '../.env')
 load_dotenv(env_path)
 RIOT_KEY = os.environ.get("RIOT_API_KEY")
-
-settings = cass.get_default_config()
-settings['logging']['print_calls'] = True
-cass.apply_settings(settings)
+STORAGE_BACKEND = os.environ.get("STORAGE_BACKEND", "tinydb")
+DATABASE_PATH = os.environ.get("DATABASE_PATH", os.path.join(BASE_PATH, '../database'))
 
 
 class Manager:
     def __init__(self):
-        self.db_path = os.path.join(BASE_PATH, f'../database/players_db.json')
-        self.db = TinyDB(self.db_path, indent=2)
+        self.db_path = DATABASE_PATH
+        self.store = open_store(STORAGE_BACKEND, self.db_path)
+
+        # participant ranks survive restarts
+        if RANK_CACHE_PERSIST:
+            participant_ranks.path = os.path.join(self.db_path, 'rank_cache.json')
+            participant_ranks.load()
+
+        # riot payloads survive restarts, matches never need fetching twice
+        if RIOT_CACHE_PERSIST:
+            os.makedirs(self.db_path, exist_ok=True)
+            riot.CACHE_PATH = os.path.join(self.db_path, 'riot_cache.sqlite3')
+
+        # sides and participant ranks of a match, stored once for every tracked player in it
+        self.shared_matches = MatchStore(os.path.join(self.db_path, 'shared_matches.sqlite3'))
+
+        # refresh progress, rank changes and new matches pushed to /player/events
+        self.events = EventBus()
+        self.events_lock = threading.Lock()
+
+        # matches past the hot history of each player, one compressed file per player
+        self.archive_path = os.path.join(self.db_path, 'archive')
+
+        # buffered writes still reach disk on a clean exit
+        atexit.register(self.flush)
+
+        # other worker processes share the store, their writes make our loaded players stale
+        self.store_generation = self.store.generation()
+        self.events_generation = self.store_generation
+
+        # only one worker process runs a refresh or downloads icons at a time
+        locks_path = os.path.join(self.db_path, 'locks.sqlite3')
+        self.refresh_lease = Lease(locks_path, 'refresh')
+        self.icons_lease = Lease(locks_path, 'icons')
+        self.scheduler_lease = get_scheduler_lease()
 
         self.usernames = ['TURBO Trusty', 'Ckwaceupoulet', 'TURBO OLINGO', 'ATM Kryder', 'Raz0xx', 'FRANZIZKUZ',
                           'TheRedAquaman', 'TURBO ALUCO', 'Grandoullf', 'TURBO BERINGEI', 'Kertor']
         # self.usernames = ['TURBO Trusty', 'FRANZIZKUZ']
 
-        # Prep players
-        self.players = []
+        # Prep players, loaded from the store on first use
+        self.players = {}
+        self.players_lock = threading.Lock()
+
+        # background refresh
+        self.jobs = JobRunner(max_workers=REFRESH_WORKERS)
+        self.refresh_lock = threading.RLock()
+
+        # manual and scheduled refreshes running in this worker, the refresh lease is held while any is
+        self.refresh_holders = 0
+
+        # a scheduled and a manual refresh of the same player wait for each other
+        self.player_locks = {}
 
-        #  Functions
-        self.load_players()
+        # encoded get_all response
+        self.all_cache = None
+        self.all_lock = threading.Lock()
+
+        # columnar stats over every player, built on the first group query
+        self.stats_engine = None
+        self.stats_engine_lock = threading.Lock()
+
+        # matches added while the engine is built, replayed once it is done
+        self.stats_engine_pending = None
+        self.stats_events_lock = threading.Lock()
+
+        # rank index per queue, built on the first leaderboard request
+        self.leaderboard = None
+        self.leaderboard_lock = threading.Lock()
+
+        # profile icons
+        self.icons = IconCache(os.path.join(BASE_PATH, '../assets'))
+
+        if ICON_PREWARM:
+            self.prewarm_icons()
+
+        # per player refreshes, replaces hitting add_rank_to_history from outside
+        self.scheduler = None
+        if SCHEDULER_ENABLED:
+            self.scheduler = RefreshScheduler(self, self.scheduler_lease)
+            self.scheduler.start()
+            atexit.register(self.scheduler.shutdown)
 
         # todo remove this
         # self.add_rank_to_history()
 
-    def load_players(self):
-        for user in self.usernames:
-            username_query = Query().username == user
-            db_entry = self.db.get(username_query)
+    def sync_store(self):
+        """Forget loaded players and everything built from them once another worker wrote to the store"""
+        generation = self.store.generation()
+        if generation == self.store_generation or self.refresh_holders:
+            return
+
+        with self.players_lock:
+            LOG.warning('(sync_store) - store changed in another worker, reloading players')
+            self.players = {}
+            self.all_cache = None
+            self.stats_engine = None
+            self.leaderboard = None
+            self.store_generation = generation
+
+    def get_player(self, username):
+        """Return the player, loading it from the store the first time"""
+        self.sync_store()
+        player = self.players.get(username)
+        if player is not None:
+            return player
 
-            object = Player(user, self.db)
-            object.load_from_json(db_entry)
+        with self.players_lock:
+            if username not in self.players:
+                object = Player(username, self.store, MatchArchive(self.archive_path, username), self.shared_matches)
+                object.load_from_json(self.store.get_player(username))
+                object.listeners.append(self.on_player_event)
+                self.players[username] = object
 
-            self.players.append(object)
+            return self.players[username]
+
+    def all_players(self):
+        self.sync_store()
+        return [self.get_player(x) for x in self.usernames]
+
+    def load_players(self):
+        self.all_players()
 
         # todo removed for performance but might cause issues
         # self.save_players()
 
     def all(self):
-        return [x.save_to_json() for x in self.players]
+        """Every player as stored, match_history only holds the newest MATCH_HOT_SIZE matches"""
+        return [dict(x.save_to_json(), archived_matches=len(x.archive) if x.archive is not None else 0,
+                     matches_url=MATCHES_URL.format(quote(x.username, safe=''))) for x in self.all_players()]
+
+    def all_response(self):
+        """Encoded and gzipped get_all body, only rebuilt when a player was saved since or the day changed"""
+        # nearest_rank is picked relative to today
+        version = (date.today().toordinal(), tuple(x.version for x in self.all_players()))
+
+        with self.all_lock:
+            if self.all_cache is None or self.all_cache['version'] != version:
+                with Profiler('serialize', response='get_all'):
+                    body = json.dumps(self.all(), sort_keys=True, separators=(',', ':')).encode()
+                    self.all_cache = {
+                        'version': version,
+                        'body': body,
+                        'gzip': gzip.compress(body),
+                        'etag': hashlib.sha1(body).hexdigest(),
+                    }
+                LOG.warning(f'(all_response) - rebuilt get_all response, {len(body)} bytes')
+
+            return self.all_cache
+
+    def summary(self):
+        """Only the ranked part of every player"""
+        summary = []
+        for player in self.all_players():
+            player.update_nearest_date()
+            summary.append({'username': player.username, 'ranked': player.ranked_to_json()})
+        return summary
+
+    def get_matches(self, username, since=None, cursor=None, limit=MATCH_PAGE_SIZE, fields=None):
+        """A page of a player's matches newest first with the cursor of the next page"""
+        sections = None if fields is None else list({x.split('.')[0] for x in fields})
+
+        # stored records find their ranks in the shared store through the match_info id
+        if sections is not None and 'match_ranks' in sections and 'match_info' not in sections:
+            sections.append('match_info')
+
+        page = self.store.get_matches(username, since=since, before=cursor, limit=limit, sections=sections)
+
+        # the archive carries on where the hot history ends
+        if len(page) < limit:
+            before = page[-1][0] if page else cursor
+            page += self.get_player(username).archive.get_matches(since=since, before=before,
+                                                                   limit=limit - len(page), sections=sections)
+
+        matches = self.hydrate_matches([x[1] for x in page])
+        if fields is not None:
+            matches = [stores.utils.project_match(x, fields) for x in matches]
+
+        return {
+            'username': username,
+            'matches': matches,
+            'next_cursor': page[-1][0] if len(page) == limit else None,
+        }
+
+    def hydrate_matches(self, matches):
+        """Full records for compact ones read straight from the store"""
+        found = self.shared_matches.get_many([x['match_info']['id'] for x in matches if is_compact(x)])
+        return [hydrate(x, found[x['match_info']['id']]) if is_compact(x) and x['match_info']['id'] in found else x
+                for x in matches]
+
+    def get_stats(self, username, group_by=None, queue=None, champion=None, position=None):
+        player = self.get_player(username)
+        return {
+            'username': username,
+            'group_by': group_by,
+            'stats': player.aggregates.query(group_by, queue=queue, champion=champion, position=position),
+        }
+
+    def get_stats_engine(self):
+        with self.stats_engine_lock:
+            engine = self.stats_engine
+            if engine is not None:
+                return engine
+
+            # ingest carries on during the build, its matches wait in stats_engine_pending
+            with self.stats_events_lock:
+                self.stats_engine_pending = []
+
+            players = self.all_players()
+            engine = StatsEngine(players[0].aggregates.fields)
+            included = set()
+
+            def snapshot(username, matches):
+                for match in matches:
+                    included.add((username, match['match_info']['id']))
+                    yield match
+
+            for player in players:
+                engine.extend(player.username, snapshot(player.username, player.all_matches()))
+
+            # only matches the snapshot missed, then new ones go straight to the engine
+            with self.stats_events_lock:
+                for username, match in self.stats_engine_pending:
+                    if (username, match['match_info']['id']) not in included:
+                        engine.append(username, match)
+                self.stats_engine_pending = None
+                self.stats_engine = engine
+
+            return engine
+
+    def get_group_stats(self, stat, agg='mean', group_by=None, days=None, **filters):
+        engine = self.get_stats_engine()
+        return {
+            'stat': stat,
+            'agg': agg,
+            'group_by': group_by,
+            'results': engine.query(stat, agg=agg, group_by=group_by, days=days, **filters),
+        }
+
+    def get_leaderboard(self, queue, limit=None):
+        # sync_store may drop self.leaderboard at any time, we answer from the one we got
+        today = date.today().toordinal()
+        with self.leaderboard_lock:
+            leaderboard = self.leaderboard
+            if leaderboard is None or leaderboard.day != today:
+                players = self.all_players()
+                leaderboard = Leaderboard(list(players[0].ranked), today)
+                for player in players:
+                    player.update_nearest_date()
+                    for player_queue in player.ranked:
+                        leaderboard.update(player.username, player.rank_entry(player_queue))
+                self.leaderboard = leaderboard
+
+        return {'queue': queue, 'players': leaderboard.top(queue, limit)}
+
+    def on_player_event(self, event, player, payload):
+        if event == 'match_added':
+            with self.stats_events_lock:
+                engine = self.stats_engine
+                if self.stats_engine_pending is not None:
+                    self.stats_engine_pending.append((player.username, payload))
+            if engine is not None:
+                engine.append(player.username, payload)
+
+        leaderboard = self.leaderboard
+        if event == 'rank_changed' and leaderboard is not None:
+            leaderboard.update(player.username, payload)
+
+        if event == 'match_added':
+            match_info = payload['match_info']
+            self.events.publish('match_added', {
+                'username': player.username,
+                'match_id': match_info['id'],
+                'queue': match_info['queue'],
+                'creation': match_info['creation'],
+                'match_win': match_info['match_win'],
+            })
+
+        if event == 'rank_changed':
+            self.events.publish('rank_changed', dict(payload, username=player.username))
+
+    def on_job_update(self, job, target):
+        status = job.progress[target]['status']
+        self.events.publish('job', dict(job_summary(job), target=target, target_status=status))
+
+    def check_store_events(self):
+        """Tell streams when another worker wrote to the store, its events never reach this process"""
+        with self.events_lock:
+            generation = self.store.generation()
+            if generation != self.events_generation:
+                self.events.publish('store_changed', {'generation': generation})
+            self.events_generation = generation
 
     def save_players(self):
-        for player in self.players:
+        for player in self.all_players():
             LOG.warning(f'saving {player.username} to DB')
-            user_query = Query().username == player.username
+            self.store.save_player(player.save_to_json())
+
+        self.flush()
 
-            if self.db.get(user_query):
-                self.db.update(player.save_to_json(), user_query)
-            else:
-                self.db.insert(player.save_to_json())
+    def flush(self):
+        """Write buffered player changes to disk, returns the number of bytes written"""
+        participant_ranks.save()
+        return self.store.flush()
+
+    def ingest_stats(self):
+        """Stage stats of the latest match ingest of every loaded player"""
+        return {x.username: x.ingest.stats() for x in list(self.players.values()) if x.ingest is not None}
+
+    def schedule_stats(self):
+        return self.scheduler.stats() if self.scheduler is not None else {'scheduling': False}
+
+    def cache_stats(self):
+        disk_cache = riot.disk_cache()
+        return {
+            'participant_ranks': participant_ranks.stats(),
+            'riot_limiter': riot_limiter.stats(),
+            'riot_cache': disk_cache.stats() if disk_cache is not None else None,
+            'shared_matches': self.shared_matches.stats(),
+            'events': self.events.stats(),
+        }
 
     # flask funcs
     def add_rank_to_history(self):
-        for player in self.players:
-            player.add_rank_to_history()
-            player.add_match_to_history()
+        """Queue a refresh of every player, returns the job and whether it was newly created
+
+        The job is None when another worker process holds the refresh lease"""
+        with self.refresh_lock:
+            job = self.jobs.active('refresh')
+            if job is not None:
+                return job, False
+
+            if not self.hold_refresh():
+                return None, False
+
+            start_bytes = self.store.bytes_written
+            job = self.jobs.submit('refresh', self.usernames, self.refresh_player,
+                                   stats=lambda: {'bytes_written': self.store.bytes_written - start_bytes},
+                                   on_done=lambda x: self.drop_refresh(), on_update=self.on_job_update)
+
+            # the other workers answer job queries from the lease
+            self.refresh_lease.describe = lambda: job_summary(job)
+            self.refresh_lease.renew()
+            return job, True
+
+    def hold_refresh(self):
+        """Count a refresh running in this worker, False when another worker holds the refresh lease"""
+        with self.refresh_lock:
+            if not self.refresh_holders:
+                self.refresh_lease.describe = None
+                if not self.refresh_lease.acquire():
+                    return False
+
+                # the last holder may have been another worker, refresh from what it wrote and not our copies
+                self.sync_store()
+
+            self.refresh_holders += 1
+            return True
+
+    def drop_refresh(self):
+        with self.refresh_lock:
+            self.refresh_holders -= 1
+            if not self.refresh_holders:
+                self.refresh_lease.release()
+
+    def refresh_player(self, username):
+        with self.players_lock:
+            lock = self.player_locks.setdefault(username, threading.Lock())
+
+        # manual and scheduled refreshes alike
+        with lock:
+            self.events.publish('refresh', {'username': username, 'status': 'running'})
+            try:
+                self.refresh_player_locked(username)
+            except Exception as e:
+                self.events.publish('refresh', {'username': username, 'status': 'failed', 'error': repr(e)})
+                raise
+            self.events.publish('refresh', {'username': username, 'status': 'done'})
+
+    def refresh_player_locked(self, username):
+        player = self.get_player(username)
+
+        try:
+            with Profiler('refresh', step='rank'):
+                player.add_rank_to_history()
+
+            with Profiler('refresh', step='icon'):
+                if player.profile_icon_changed():
+                    self.download_icon(username)
+
+            player.last_refresh = time.time()
+            player.save_current_player()
+
+            with Profiler('refresh', step='matches'):
+                player.add_match_to_history()
+        finally:
+            # one disk write per player instead of one per match
+            with Profiler('refresh', step='flush'):
+                self.flush()
 
-    def get_profile_icon(self, player):
-        index = self.usernames.index(player)
-        image_path = os.path.join(BASE_PATH, f'../assets/{player}.jpeg')
+    def get_job(self, job_id):
+        """Json of a job of this worker or of the refresh another worker runs, None if unknown"""
+        job = self.jobs.get(job_id)
+        if job is not None:
+            return job.to_json()
 
+        lease = self.refresh_lease.current(include_expired=True)
+        if lease is not None and lease['info'].get('id') == job_id:
+            return dict(lease['info'], holder=lease['holder'], lease_expired=lease['expired'])
+
+        return None
+
+    def get_profile_icon(self, player, size=None):
+        """Icon entry of IconCache.get, None when it isn't on disk and the download failed"""
         # if not found download it
-        if not os.path.exists(image_path):
-            self.players[index].cass_summoner.profile_icon.image.save(image_path, format='JPEG')
+        if not self.icons.exists(player):
+            try:
+                self.download_icon(player)
+            except Exception as e:
+                LOG.warning(f'(get_profile_icon) - downloading the icon of {player} failed with {e!r}')
+                return None
+
+        return self.icons.get(player, size)
+
+    def download_icon(self, player):
+        summoner = self.get_player(player).load_summoner()
+        self.icons.save(player, summoner.profile_icon.image)
+
+    def prewarm_icons(self):
+        """Download every missing icon in the background"""
+        missing = [x for x in self.usernames if not self.icons.exists(x)]
+        if not missing or not self.icons_lease.acquire():
+            return None
+
+        return self.jobs.submit('icons', missing, self.download_icon, on_done=lambda x: self.icons_lease.release())
+
+
+def job_summary(job):
+    return {k: v for k, v in job.to_json().items() if k != 'progress'}
+
+
+summ_manager = None
+summ_manager_lock = threading.Lock()
+
+
+def get_manager():
+    """The shared manager, created by the first caller"""
+    global summ_manager
+
+    if summ_manager is None:
+        with summ_manager_lock:
+            if summ_manager is None:
+                summ_manager = Manager()
+
+    return summ_manager
+
+
+# taken at app startup before the manager exists, the manager schedules under the same holder
+scheduler_lease = None
+scheduler_lease_lock = threading.Lock()
+
+
+def get_scheduler_lease():
+    global scheduler_lease
+
+    if scheduler_lease is None:
+        with scheduler_lease_lock:
+            if scheduler_lease is None:
+                scheduler_lease = Lease(os.path.join(DATABASE_PATH, 'locks.sqlite3'), 'scheduler')
+
+    return scheduler_lease
+
+
+def start_scheduler():
+    """Take the scheduler lease at app startup so scheduled refreshes don't wait for the first request
+
+    The worker that gets it builds the manager in the background, imports stay cheap. The others try the
+    lease again every ttl until a request builds their manager, which then takes over the retries.
+    """
+    if not SCHEDULER_ENABLED or summ_manager is not None:
+        return
 
-        # open image bytes
-        output = io.BytesIO()
-        img = Image.open(image_path)
-        img.save(output, format='JPEG')
+    lease = get_scheduler_lease()
+    if lease.acquire():
+        threading.Thread(target=build_scheduling_manager, name='scheduler-startup', daemon=True).start()
+        return
 
-        return output.getvalue()
+    timer = threading.Timer(lease.ttl, start_scheduler)
+    timer.daemon = True
+    timer.start()
 
 
-summ_manager = Manager()
+def build_scheduling_manager():
+    try:
+        get_manager()
+    except Exception as e:
+        # another worker can schedule instead, this one retries on its first request
+        LOG.warning(f'(start_scheduler) - building the manager failed with {e!r}')
+        get_scheduler_lease().release()
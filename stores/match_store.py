@@ -0,0 +1,170 @@
+import json
+import os
+import sqlite3
+import threading
+from collections import OrderedDict
+
+from stores.constants import LOG, SHARED_MATCH_CACHE, SHARED_MATCH_WAIT
+
+
+def shared_part(match):
+    """What every tracked player of a match has in common, the sides and the participant ranks"""
+    return {'sides': match['match_info']['sides'], 'match_ranks': match['match_ranks']}
+
+
+def compact(match):
+    """Player record without the shared part, match_info id is the reference to it"""
+    return {
+        'match_info': {k: v for k, v in match['match_info'].items() if k != 'sides'},
+        'player_stats': match['player_stats'],
+    }
+
+
+def is_compact(match):
+    return 'match_info' in match and 'sides' not in match['match_info']
+
+
+def hydrate(match, shared):
+    """Full record from a compact one, keys in the order players write them"""
+    match = dict(match, match_info=dict(match['match_info'], sides=shared['sides']))
+    match['match_ranks'] = shared['match_ranks']
+    return match
+
+
+class MatchStore:
+    """Shared part of every ingested match by match id, built by the first tracked player that syncs it
+
+    Kept in sqlite, the most used entries stay in memory and are the same objects every player's record points to.
+    """
+
+    schema = """
+        CREATE TABLE IF NOT EXISTS shared_matches (
+            match_id INTEGER PRIMARY KEY,
+            data TEXT NOT NULL
+        );
+    """
+
+    def __init__(self, path, cache_size=SHARED_MATCH_CACHE):
+        self.path = path
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+
+        self.conn = sqlite3.connect(path, timeout=10, check_same_thread=False)
+        self.conn.execute('PRAGMA journal_mode=WAL')
+        self.conn.executescript(self.schema)
+        self.lock = threading.Lock()
+
+        # match id -> shared part, least recently used first
+        self.cache = OrderedDict()
+        self.cache_size = cache_size
+
+        # match id -> event set once the player building it is done
+        self.building = {}
+
+        self.hits = 0
+        self.built = 0
+        self.waits = 0
+
+    def lookup(self, match_id):
+        # callers hold the lock
+        shared = self.cache.get(match_id)
+        if shared is not None:
+            self.cache.move_to_end(match_id)
+            return shared
+
+        row = self.conn.execute('SELECT data FROM shared_matches WHERE match_id = ?', (match_id,)).fetchone()
+        if row is None:
+            return None
+
+        return self.remember(match_id, json.loads(row[0]))
+
+    def remember(self, match_id, shared):
+        self.cache[match_id] = shared
+        self.cache.move_to_end(match_id)
+        while len(self.cache) > self.cache_size:
+            self.cache.popitem(last=False)
+        return shared
+
+    def get(self, match_id):
+        with self.lock:
+            return self.lookup(match_id)
+
+    def get_many(self, match_ids):
+        with self.lock:
+            found = {x: self.cache[x] for x in match_ids if x in self.cache}
+            for match_id in found:
+                self.cache.move_to_end(match_id)
+
+            # sqlite caps the number of bound variables
+            missing = [x for x in match_ids if x not in found]
+            for i in range(0, len(missing), 500):
+                chunk = missing[i:i + 500]
+                for match_id, data in self.conn.execute(
+                        f'SELECT match_id, data FROM shared_matches WHERE match_id IN ({",".join("?" * len(chunk))})',
+                        chunk):
+                    found[match_id] = self.remember(match_id, json.loads(data))
+
+            return found
+
+    def put(self, match_id, shared):
+        """Store the shared part and wake the players waiting for it, returns the stored object"""
+        with self.lock:
+            self.conn.execute('INSERT OR REPLACE INTO shared_matches VALUES (?, ?)', (match_id, json.dumps(shared)))
+            self.conn.commit()
+            self.remember(match_id, shared)
+
+        self.release(match_id)
+        return shared
+
+    def put_many(self, shared_by_id):
+        """Store the shared parts of matches not in the store yet in one transaction, returns the stored ones"""
+        with self.lock:
+            stored = {}
+            with self.conn:
+                for match_id, shared in shared_by_id.items():
+                    found = self.lookup(match_id)
+                    if found is None:
+                        self.conn.execute('INSERT INTO shared_matches VALUES (?, ?)', (match_id, json.dumps(shared)))
+                        found = self.remember(match_id, shared)
+                    stored[match_id] = found
+            return stored
+
+    def claim(self, match_id, timeout=SHARED_MATCH_WAIT):
+        """Shared part of a match, None when the caller is the one to build it and must put or release it
+
+        A player that finds the match being built by another waits for it instead of building it twice.
+        """
+        while True:
+            with self.lock:
+                shared = self.lookup(match_id)
+                if shared is not None:
+                    self.hits += 1
+                    return shared
+
+                event = self.building.get(match_id)
+                if event is None:
+                    self.building[match_id] = threading.Event()
+                    self.built += 1
+                    return None
+
+                self.waits += 1
+
+            if not event.wait(timeout):
+                LOG.warning(f'(match store) - gave up waiting on match {match_id}, building it again')
+                return None
+
+    def release(self, match_id):
+        with self.lock:
+            event = self.building.pop(match_id, None)
+        if event is not None:
+            event.set()
+
+    def stats(self):
+        with self.lock:
+            stored = self.conn.execute('SELECT COUNT(*) FROM shared_matches').fetchone()[0]
+            return {
+                'stored': stored,
+                'cached': len(self.cache),
+                'shared_hits': self.hits,
+                'built': self.built,
+                'waits': self.waits,
+            }
@@ -1,38 +1,72 @@
 import json
 from pprint import pprint
-import cassiopeia as cass
-from tinydb import Query
 from datetime import datetime, date, timedelta
 import os
-import copy
 
-from stores.constants import LOG, DATE_FORMAT, DATE_FORMAT_HOUR
+from stores.constants import LOG, DATE_FORMAT, DATE_FORMAT_HOUR, INGEST_WORKERS, MATCH_SYNC_LIMIT, \
+    MATCH_HOT_SIZE, MATCH_ARCHIVE_BATCH
 import stores.utils as utils
+from stores.rate_limiter import riot_limiter
+from stores.rank_cache import participant_ranks
+from stores.rank_history import RankHistory, date_to_day, day_to_date
+from stores import riot
+from stores.aggregates import MatchAggregates
+from stores.ingest import Pipeline, Stage
+from stores.extract import copier, extractor
+from stores.storage import creation_timestamp
+from stores.match_store import shared_part, compact, is_compact, hydrate
 
 
 class Player:
-    def __init__(self, username, database):
+    def __init__(self, username, database, archive=None, shared_matches=None):
         # Inherent values
         self.username = username
         self.database = database
 
+        # older matches, see stores.archive, without one the whole history stays in memory
+        self.archive = archive
+
+        # sides and participant ranks shared with the other tracked players, see stores.match_store
+        self.shared_matches = shared_matches
+
         self.ranked = {
             "RANKED_SOLO_5x5": {
                 "rank": 0,
                 "winrate": [0, 0],
-                "rank_history": {},
                 "nearest_rank": ["", 0],
             },
             "RANKED_FLEX_SR": {
                 "rank": 0,
                 "winrate": [0, 0],
-                "rank_history": {},
                 "nearest_rank": ["", 0],
             },
         }
+        self.rank_history = {queue: RankHistory() for queue in self.ranked}
         self.match_history = []
         self.invalid_matches = []
 
+        # lookup indexes, kept in sync with the lists above
+        self.match_ids = set()
+        self.invalid_ids = set()
+
+        # newest ingested match, refreshes only list what came after it
+        self.sync_cursor = None
+
+        # icon id of the saved profile icon
+        self.profile_icon_id = None
+
+        # epoch seconds of the last finished refresh, the scheduler plans the next one from it
+        self.last_refresh = None
+
+        # latest match ingest, kept for its stage stats
+        self.ingest = None
+
+        # bumped on every save so cached responses know when to rebuild
+        self.version = 0
+
+        # called as listener(event, player, payload)
+        self.listeners = []
+
         # data format
         self.match_template = {
             "match_info": {
@@ -109,12 +143,46 @@ class Player:
             },
         }
 
+        # match ranks entry, one per participant
+        self.participant_template = {
+            'summonerName': 0,
+            'rank': 0,
+            'winrate': [0, 0],
+            'level': 0,
+            'championName': None,
+            'individualPosition': None,
+            'lane': None,
+            'role': None,
+            'kills': 0,
+            'deaths': 0,
+            'assists': 0,
+            'goldPerMinute': 0,
+            'totalAllyJungleMinionsKilled': 0,
+            'totalEnemyJungleMinionsKilled': 0,
+            'totalMinionsKilled': 0,
+        }
+
+        # fresh copies of the templates, filled by key path extractors from stores.extract
+        self.new_match = copier(self.match_template)
+        self.new_participant = copier(self.participant_template)
+
+        # running stats over the match history, numeric template fields only
+        self.aggregates = MatchAggregates([k for k, v in self.match_template['player_stats'].items() if v == 0])
+
         # dates
-        self.curr_date = datetime.today().strftime(DATE_FORMAT)
+        self.curr_date = None
+        self.curr_day = None
+        self.update_curr_date()
 
-        # Summoner
+        # Summoner, built on the first riot call
         self.region = 'EUW'
-        self.cass_summoner = cass.Summoner(name=self.username, region=self.region)
+        self._cass_summoner = None
+
+    @property
+    def cass_summoner(self):
+        if self._cass_summoner is None:
+            self._cass_summoner = riot.cass().Summoner(name=self.username, region=self.region)
+        return self._cass_summoner
 
     # json functions
     def load_from_json(self, data):
@@ -145,68 +213,183 @@ class Player:
             # deserialize ranked
             if 'ranked' in data:
                 for queue in self.ranked:
-                    for missing in verify_missing_keys(self.ranked[queue], data['ranked'][queue]):
-                        data['ranked'][queue][missing] = self.ranked[queue][missing]
+                    # the document may be the store's own, missing keys are filled on a copy
+                    queue_data = dict(data['ranked'][queue])
+                    for missing in verify_missing_keys(self.ranked[queue], queue_data):
+                        queue_data[missing] = self.ranked[queue][missing]
 
-                self.ranked = data['ranked']
+                    # rank history is kept sorted on its own
+                    self.rank_history[queue] = RankHistory.from_json(queue_data.get('rank_history', {}))
+                    self.ranked[queue] = {k: v for k, v in queue_data.items() if k != 'rank_history'}
 
             # deserialize match hist
             if 'match_history' in data:
-                self.match_history = data['match_history']
+                history = data['match_history']
+
+                # a crash or a load racing the archive leaves archived matches in the document, they count once
+                if self.archive is not None and len(self.archive):
+                    archived = self.archive.match_ids()
+                    history = [x for x in history if x['match_info']['id'] not in archived]
+
+                self.match_history = self.share_matches(history)
+                self.match_ids = {x['match_info']['id'] for x in self.match_history}
+                self.aggregates.rebuild(self.match_history)
+
+            # archived matches only count through their summary
+            if self.archive is not None:
+                self.aggregates.merge(self.archived_buckets())
 
             # deserialize invalid matches
             if 'invalid_matches' in data:
                 self.invalid_matches = data['invalid_matches']
+                self.invalid_ids = set(self.invalid_matches)
+
+            # deserialize sync cursor
+            if 'sync_cursor' in data:
+                self.sync_cursor = data['sync_cursor']
+
+            # deserialize profile icon id
+            if 'profile_icon_id' in data:
+                self.profile_icon_id = data['profile_icon_id']
+
+            # deserialize last refresh
+            if 'last_refresh' in data:
+                self.last_refresh = data['last_refresh']
+
+    def share_matches(self, matches):
+        """Records pointing at the shared store's sides and ranks, full records from older saves are added to it"""
+        if self.shared_matches is None:
+            return matches
+
+        found = self.shared_matches.get_many([x['match_info']['id'] for x in matches if is_compact(x)])
+        found.update(self.shared_matches.put_many(
+            {x['match_info']['id']: shared_part(x) for x in matches if not is_compact(x)}))
+
+        shared_history = []
+        for match in matches:
+            match_id = match['match_info']['id']
+            shared = found.get(match_id)
+            if shared is None:
+                LOG.warning(f'(share_matches) - match {match_id} missing from the shared store')
+                shared = shared_part(self.new_match())
+            shared_history.append(hydrate(match, shared))
+
+        return shared_history
+
+    def ranked_to_json(self):
+        """Ranked info with the rank history in its json layout"""
+        return {queue: dict(self.ranked[queue], rank_history=self.rank_history[queue].to_json())
+                for queue in self.ranked}
 
     def save_to_json(self):
         """Return formatted values to be saved to json"""
         self.update_nearest_date()
         return {
             'username': self.username,
-            'ranked': self.ranked,
+            'ranked': self.ranked_to_json(),
             'match_history': self.match_history,
             'invalid_matches': self.invalid_matches,
+            'sync_cursor': self.sync_cursor,
+            'profile_icon_id': self.profile_icon_id,
+            'last_refresh': self.last_refresh,
         }
 
+    def notify(self, event, payload):
+        for listener in self.listeners:
+            listener(event, self, payload)
+
     # db functions
     def save_current_player(self):
         LOG.warning(f'saving {self.username} to DB')
-        user_query = Query().username == self.username
+        self.version += 1
+
+        # the shared part of each match is stored once for every player
+        data = self.save_to_json()
+        if self.shared_matches is not None:
+            data['match_history'] = [compact(x) for x in self.match_history]
 
-        if self.database.get(user_query):
-            self.database.update(self.save_to_json(), user_query)
-        else:
-            self.database.insert(self.save_to_json())
+        self.database.save_player(data)
+
+    def last_game(self):
+        """Epoch seconds of the newest synced game, None before the first sync"""
+        return self.sync_cursor['creation'] if self.sync_cursor else None
 
     # update functions
+    def update_curr_date(self):
+        # players live as long as the server, which can span several days
+        self.curr_date = datetime.today().strftime(DATE_FORMAT)
+        self.curr_day = date_to_day(self.curr_date)
+
     def update_nearest_date(self):
         # LOG.warning('(update_nearest_date) - updating nearest date')
-        for queue in self.ranked:
-            queue_entry = self.ranked[queue]
+        # yesterday's point becomes a pick once the day changes
+        self.update_curr_date()
 
-            all_dates = list(queue_entry['rank_history'].keys())
+        for queue in self.ranked:
+            history = self.rank_history[queue]
 
             # Check if any dates exist
-            if len(all_dates) > 1:
+            if len(history) > 1:
 
-                # remove today from possible picks
-                if self.curr_date in all_dates:
-                    all_dates.pop(all_dates.index(self.curr_date))
+                # today is never a pick
+                nearest_day, nearest_rank = history.nearest(self.curr_day, exclude=self.curr_day)
+                self.ranked[queue]['nearest_rank'] = [day_to_date(nearest_day), nearest_rank]
 
-                all_dates = [datetime.strptime(x, DATE_FORMAT) for x in all_dates]
-                nearset_date = utils.nearest_date(all_dates, datetime.strptime(self.curr_date, DATE_FORMAT))
-                self.ranked[queue]['nearest_rank'] = [nearset_date, queue_entry['rank_history'][nearset_date]]
-                LOG.warning('(update_nearest_date) - set nearest date')
+    # Riot calls, identical ones in flight are shared, permits are spent when they reach riot (stores.riot)
+    def load_summoner(self):
+        return riot_limiter.call('summoner', self.username, self.cass_summoner.load)
+
+    def reload_summoner(self):
+        """Summoner fetched from riot again, a loaded one never reloads and the caches keep it for a day"""
+        riot.forget_summoner(self.username, self.region)
+        self._cass_summoner = None
+        return self.load_summoner()
+
+    def get_summoner_id(self):
+        return self.load_summoner().id
+
+    def profile_icon_changed(self):
+        """Check the summoner's icon id against the saved one, remembers the new id"""
+        icon_id = self.reload_summoner().profile_icon.id
+
+        if icon_id == self.profile_icon_id:
+            return False
+
+        self.profile_icon_id = icon_id
+        return True
+
+    def get_league_entries(self, summoner):
+        """League entries of any summoner as dicts"""
+        return riot_limiter.call('league', summoner.id,
+                                 lambda: [x.to_dict() for x in summoner.league_entries])
+
+    def get_solo_rank(self, summoner):
+        solo_rank = {'rank': 0, 'winrate': [0, 0]}
+
+        for values in self.get_league_entries(summoner):
+            # check if any rank exists
+            if values['queue'] == 'RANKED_SOLO_5x5' and 'tier' in values:
+                solo_rank = {'rank': utils.convert_to_rank_val(values), 'winrate': [values['wins'], values['losses']]}
+
+        return solo_rank
+
+    def get_match_list(self, count, start_time=None):
+        """Newest first match ids, start_time in epoch seconds drops older games"""
+        puuid = self.load_summoner().puuid
+        return riot_limiter.call('match_list', (puuid, count, start_time), lambda: list(
+            riot.cass().get_match_history(continent=self.cass_summoner.region.continent, puuid=puuid,
+                                   start_time=start_time, start=0, count=count)))
 
     # Cassio functions
     def update_current_rank(self):
         """Update the current ranked info for player"""
         LOG.warning(f'(update_current_rank) - updating rank for {self.username}')
 
-        cass_entries = self.cass_summoner.league_entries
+        # both caches keep league entries for hours, longer than the time between two scheduled refreshes
+        riot.forget_league_entries(self.get_summoner_id(), self.region)
+        cass_entries = self.get_league_entries(self.cass_summoner)
 
-        for entry in cass_entries:
-            values = entry.to_dict()
+        for values in cass_entries:
             queue = values['queue']
 
             if queue not in self.ranked:
@@ -221,9 +404,19 @@ class Player:
                             f' {queue} with winrate {self.ranked[queue]["winrate"]}')
                 self.update_nearest_date()
 
+    def rank_entry(self, queue):
+        return {
+            'queue': queue,
+            'rank': self.ranked[queue]['rank'],
+            'winrate': list(self.ranked[queue]['winrate']),
+            'nearest_rank': list(self.ranked[queue]['nearest_rank']),
+        }
+
     def add_rank_to_history(self):
         """Add current rank info to rank history"""
         LOG.warning(f'(add_rank_to_history) - adding rank to history for {self.username}')
+        before = {queue: self.rank_entry(queue) for queue in self.ranked}
+        self.update_curr_date()
 
         # Refresh current rank
         self.update_current_rank()
@@ -239,132 +432,251 @@ class Player:
 
             # Update
             LOG.info(f'(add_rank_to_history) - updated new rank to {self.ranked[queue]["rank"]}')
-            self.ranked[queue]['rank_history'][self.curr_date] = self.ranked[queue]['rank']
+            self.rank_history[queue].set(self.curr_day, self.ranked[queue]['rank'])
             self.update_nearest_date()
 
+        # listeners get entries with today's point written, a new day also moves nearest_rank
+        for queue in self.ranked:
+            entry = self.rank_entry(queue)
+            if entry != before[queue]:
+                self.notify('rank_changed', entry)
+
     def add_match_to_history(self):
+        """Sync new matches, listed ids go through fetch, transform and enrich stages before being saved"""
 
         def add_id_to_invalid_list(f_id):
             LOG.warning(f'id {f_id} invalid and added to list')
             self.invalid_matches.append(f_id)
+            self.invalid_ids.add(f_id)
             # save to db
             self.save_current_player()
 
-        def recursive_fill_template_from_dict(data: dict, template: dict):
-            for f_key in data:
-                if f_key in template:
-                    template[f_key] = data[f_key]
-                if isinstance(data[f_key], dict):
-                    recursive_fill_template_from_dict(data[f_key], template)
-
-        # adding to match hist
-        match_limit = 40
+        newest_cursor = [self.sync_cursor]
+        start_time = self.sync_cursor['creation'] if self.sync_cursor else None
 
-        for i, match in enumerate(self.cass_summoner.match_history):
+        creations = {}
 
-            # Limit to last n games
-            if i >= match_limit:
-                LOG.warning(f'Hit match limit, stopping')
-                break
+        def synced_creation(match_id):
+            if not creations:
+                creations.update((x['match_info']['id'], creation_timestamp(x)) for x in self.match_history)
+            return creations[match_id]
 
-            # skip if in invalid list
-            if match.id in self.invalid_matches:
-                LOG.warning('Invalid Match id found, skipping')
-                continue
+        def list_matches():
+            # one page holds room for the limit to grow on invalid matches
+            for match in self.get_match_list(100, start_time):
 
-            # skip if already seen
-            if match.id in [x['match_info']['id'] for x in self.match_history]:
-                LOG.warning('Match id found, skipping')
-                continue
+                # everything older than the cursor was synced already, known matches above it come from an
+                # interrupted sync and newer ones can still follow
+                if self.sync_cursor and match.id == self.sync_cursor['id']:
+                    LOG.warning('Reached synced matches, stopping')
+                    break
 
-            # Exclude arena and other invalid game modes
-            try:
-                # skip if mode is not classic
-                if match.queue.name not in ['ranked_flex_fives', 'normal_draft_fives', 'ranked_solo_fives']:
-                    LOG.warning('match not classic')
-                    add_id_to_invalid_list(match.id)
-                    match_limit += 1
+                # only a first sync lists matches old enough to be archived
+                known = match.id in self.match_ids or match.id in self.invalid_ids or (
+                        self.sync_cursor is None and self.archive is not None and match.id in self.archive)
+                if not known:
+                    yield {'match': match, 'status': 'new'}
                     continue
-            except Exception:
-                LOG.warning('match returned an error')
-                add_id_to_invalid_list(match.id)
-                match_limit += 1
-                continue
-
-            # get current player stats from participants
-            LOG.warning(f'{match.id} adding to match history')
-            player_index = [x.summoner.name for x in match.participants].index(self.username)
-            player_info = match.participants[player_index].to_dict()
-
-            match_template = copy.deepcopy(self.match_template)
-
-            # map player match stats
-            recursive_fill_template_from_dict(player_info, match_template['player_stats'])
-
-            # add match info for red and blue side
-            for f_side in match.teams:
-                side_info = f_side.to_dict()
-                recursive_fill_template_from_dict(side_info,
-                                                  match_template['match_info']['sides'][f_side.side.name])
-
-                # Set current player extra details
-                if self.username in [x['summonerName'] for x in side_info['participants']]:
-                    match_template['match_info']['match_win'] = side_info['isWinner']
-                    match_template['match_info']['player_side'] = f_side.side.name
-
-            # add match info general
-            recursive_fill_template_from_dict(match.to_dict(),
-                                              match_template['match_info'])
-
-            match_template['match_info']['queue'] = match.queue.name
-            match_template['match_info']['duration'] = match.duration.seconds
-            match_template['match_info']['creation'] = match.creation.strftime(DATE_FORMAT_HOUR)
-
-            # calc match ranks
-            for player in match.participants:
-
-                participant_stats = {
-                    'summonerName': 0,
-                    'rank': 0,
-                    'winrate': [0, 0],
-                    'level': 0,
-                    'championName': None,
-                    'individualPosition': None,
-                    'lane': None,
-                    'role': None,
-                    'kills': 0,
-                    'deaths': 0,
-                    'assists': 0,
-                    'goldPerMinute': 0,
-                    'totalAllyJungleMinionsKilled': 0,
-                    'totalEnemyJungleMinionsKilled': 0,
-                    'totalMinionsKilled': 0,
-                }
-
-                recursive_fill_template_from_dict(player.to_dict(), participant_stats)
 
-                player_summ = player.summoner
-                recursive_fill_template_from_dict(player_summ.to_dict(), participant_stats)
+                # known matches still move the cursor past themselves
+                item = {'match': match, 'status': 'known'}
+                if match.id in self.match_ids:
+                    item['creation'] = synced_creation(match.id)
+                yield item
 
-                # get solo q rank
-                for entry in player_summ.league_entries:
-                    values = entry.to_dict()
-                    queue = values['queue']
+        def persist(item):
+            match = item['match']
+            if 'creation' in item and (newest_cursor[0] is None or item['creation'] > newest_cursor[0]['creation']):
+                newest_cursor[0] = {'creation': item['creation'], 'id': match.id}
 
-                    if queue == 'RANKED_SOLO_5x5':
-                        # check if any rank exists
-                        if 'tier' in values:
-                            participant_stats['rank'] = utils.convert_to_rank_val(values)
-                            participant_stats['winrate'] = [values['wins'], values['losses']]
+            if item['status'] == 'known':
+                LOG.warning('Match id found, skipping')
+                return True
 
-                # add player to match
-                match_template["match_ranks"][player.side.name].append(participant_stats)
+            if item['status'] == 'invalid':
+                add_id_to_invalid_list(match.id)
+                # invalid matches do not count toward the limit
+                self.ingest.extend()
+                return True
 
             # Add match to list
+            match_template = item['template']
             self.match_history.append(match_template)
+            self.match_ids.add(match.id)
+            self.aggregates.add(match_template)
+            self.notify('match_added', match_template)
 
             # save to db
             self.save_current_player()
+            return True
+
+        stages = [
+            Stage('fetch', self.fetch_match, INGEST_WORKERS['fetch']),
+            Stage('transform', self.transform_match, INGEST_WORKERS['transform']),
+            Stage('enrich', self.enrich_match, INGEST_WORKERS['enrich']),
+        ]
+        # Limit to last n games
+        self.ingest = Pipeline(self.username, list_matches(), stages, persist, limit=MATCH_SYNC_LIMIT)
+        self.ingest.run()
+
+        # only move the cursor once the walk is over so an interrupted sync is retried
+        if newest_cursor[0] != self.sync_cursor:
+            self.sync_cursor = newest_cursor[0]
+            self.save_current_player()
+
+        if self.archive_cold_matches():
+            self.save_current_player()
+
+    def archive_cold_matches(self):
+        """Move the oldest matches past MATCH_HOT_SIZE to the archive, returns how many left the hot history"""
+        if self.archive is None or len(self.match_history) < MATCH_HOT_SIZE + MATCH_ARCHIVE_BATCH:
+            return 0
+
+        by_age = sorted(self.match_history, key=creation_timestamp, reverse=True)
+        cold = by_age[MATCH_HOT_SIZE:]
+        cold_ids = {x['match_info']['id'] for x in cold}
+
+        # matches archived before a crash kept them from leaving the document are only dropped
+        new = [x for x in cold if x['match_info']['id'] not in self.archive]
+        if new:
+            summary = MatchAggregates(self.aggregates.fields)
+            summary.merge(self.archived_buckets())
+            summary.extend(new)
+            written = self.archive.append(new, summary.to_json())
+            LOG.warning(f'(archive) - archived {len(new)} matches of {self.username}, {written} bytes')
+
+        self.match_history = [x for x in self.match_history if x['match_info']['id'] not in cold_ids]
+        self.match_ids -= cold_ids
+        return len(cold)
+
+    def archived_buckets(self):
+        """Aggregate buckets of the archive, counted again from the matches when the summary lags the index"""
+        summary = self.archive.summary()
+        if self.archive.summary_current(summary):
+            return summary['buckets']
+
+        LOG.warning(f'(archive) - summary of {self.username} is behind its index, counting archived matches')
+        buckets = MatchAggregates(self.aggregates.fields)
+        buckets.extend(x for _, x in self.archive.stream())
+        return buckets.to_json()
+
+    def match_fields(self):
+        """Names a match can be projected on, sections and their section.key"""
+        fields = set(self.match_template)
+        fields.update(f'{section}.{key}' for section, keys in self.match_template.items() for key in keys)
+        return fields
+
+    def all_matches(self):
+        """Archived then hot matches, the archive is streamed from disk"""
+        if self.archive is not None:
+            for _, match in self.archive.stream():
+                yield match
+        yield from self.match_history
+
+    # ingest stages, every one passes known and invalid matches through untouched
+    def fetch_match(self, item):
+        if item['status'] != 'new':
+            return item
+
+        # Exclude arena and other invalid game modes
+        match = item['match']
+        try:
+            riot_limiter.call('match', match.id, match.load)
+            item['creation'] = match.creation.int_timestamp
+
+            # skip if mode is not classic
+            if match.queue.name not in ['ranked_flex_fives', 'normal_draft_fives', 'ranked_solo_fives']:
+                LOG.warning('match not classic')
+                item['status'] = 'invalid'
+        except Exception:
+            LOG.warning('match returned an error')
+            item['status'] = 'invalid'
+
+        return item
+
+    def transform_match(self, item):
+        if item['status'] != 'new':
+            return item
+
+        # get current player stats from participants
+        match = item['match']
+        LOG.warning(f'{match.id} adding to match history')
+        player_index = [x.summoner.name for x in match.participants].index(self.username)
+        player_info = match.participants[player_index]
+
+        match_template = self.new_match()
+        match_info = match_template['match_info']
+
+        # map player match stats
+        extractor(match_template['player_stats']).fill(player_info, match_template['player_stats'])
+
+        # add match info for red and blue side
+        for f_side in match.teams:
+            side = match_info['sides'][f_side.side.name]
+            extractor(side).fill(f_side, side)
+
+            # Set current player extra details
+            if f_side.side == player_info.side:
+                match_info['match_win'] = side['isWinner']
+                match_info['player_side'] = f_side.side.name
+
+        # add match info general
+        extractor(match_info).fill(match, match_info)
+
+        match_info['queue'] = match.queue.name
+        match_info['duration'] = match.duration.seconds
+        match_info['creation'] = match.creation.strftime(DATE_FORMAT_HOUR)
+
+        # participant stats from the match, ranks are added by the enrich stage
+        participants = []
+        for player in match.participants:
+            participant_stats = self.new_participant()
+            extractor(self.participant_template).fill(player, participant_stats)
+            participants.append((player, participant_stats))
+
+        item['template'] = match_template
+        item['participants'] = participants
+        return item
+
+    def enrich_match(self, item):
+        if item['status'] != 'new':
+            return item
+
+        match_template = item['template']
+        participants = item.pop('participants')
+
+        # another tracked player in the same game built or is building the ranks already
+        if self.shared_matches is not None:
+            shared = self.shared_matches.claim(item['match'].id)
+            if shared is not None:
+                match_template['match_info']['sides'] = shared['sides']
+                match_template['match_ranks'] = shared['match_ranks']
+                return item
+
+            try:
+                self.add_match_ranks(match_template, participants)
+                self.shared_matches.put(item['match'].id, shared_part(match_template))
+            finally:
+                self.shared_matches.release(item['match'].id)
+            return item
+
+        self.add_match_ranks(match_template, participants)
+        return item
+
+    def add_match_ranks(self, match_template, participants):
+        # calc match ranks
+        for player, participant_stats in participants:
+            player_summ = player.summoner
+            extractor(self.participant_template).fill(
+                riot_limiter.call('summoner', player_summ.id, player_summ.load), participant_stats)
+
+            # get solo q rank, cached across matches and players
+            solo_rank = participant_ranks.get_or_load(player_summ.id, lambda: self.get_solo_rank(player_summ))
+            participant_stats['rank'] = solo_rank['rank']
+            participant_stats['winrate'] = list(solo_rank['winrate'])
+
+            # add player to match
+            match_template["match_ranks"][player.side.name].append(participant_stats)
 
     # Temp functions
     def add_champion_ids(self):
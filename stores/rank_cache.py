@@ -0,0 +1,124 @@
+import json
+import os
+import tempfile
+import threading
+import time
+from collections import OrderedDict
+
+from stores.constants import LOG, RANK_CACHE_SIZE, RANK_CACHE_TTL
+from stores.utils import replace_file
+
+
+class RankCache:
+    """Size bounded LRU of participant solo queue ranks, entries expire after ttl seconds"""
+
+    def __init__(self, max_size=RANK_CACHE_SIZE, ttl=RANK_CACHE_TTL, path=None):
+        self.max_size = max_size
+        self.ttl = ttl
+        self.path = path
+
+        # key -> (expires at, value)
+        self.entries = OrderedDict()
+        self.lock = threading.Lock()
+
+        # entries set since the last save
+        self.dirty = False
+
+        # stats
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key):
+        with self.lock:
+            entry = self.entries.get(key)
+
+            if entry is None or entry[0] <= time.time():
+                self.entries.pop(key, None)
+                self.misses += 1
+                return None
+
+            self.entries.move_to_end(key)
+            self.hits += 1
+            return entry[1]
+
+    def set(self, key, value):
+        with self.lock:
+            self.entries[key] = (time.time() + self.ttl, value)
+            self.entries.move_to_end(key)
+            self.dirty = True
+
+            while len(self.entries) > self.max_size:
+                self.entries.popitem(last=False)
+
+    def get_or_load(self, key, loader):
+        value = self.get(key)
+
+        if value is None:
+            value = loader()
+            self.set(key, value)
+
+        return value
+
+    def stats(self):
+        with self.lock:
+            total = self.hits + self.misses
+            return {
+                'size': len(self.entries),
+                'hits': self.hits,
+                'misses': self.misses,
+                'hit_rate': round(self.hits / total, 3) if total else 0,
+            }
+
+    # persistence
+    def read(self):
+        if self.path is None or not os.path.exists(self.path):
+            return []
+
+        try:
+            with open(self.path) as f:
+                return json.load(f)
+        except ValueError:
+            LOG.warning(f'(rank cache) - could not read {self.path}, starting empty')
+            return []
+
+    def merge(self, data):
+        """Add saved entries, the later expiry wins and entries we don't hold count as least recently used"""
+        # callers hold the lock
+        now = time.time()
+        for key, expires, value in data:
+            if expires <= now:
+                continue
+
+            entry = self.entries.get(key)
+            if entry is None:
+                self.entries[key] = (expires, value)
+                self.entries.move_to_end(key, last=False)
+            elif entry[0] < expires:
+                self.entries[key] = (expires, value)
+
+        while len(self.entries) > self.max_size:
+            self.entries.popitem(last=False)
+
+    def load(self):
+        data = self.read()
+        with self.lock:
+            self.merge(data)
+
+    def save(self):
+        """Write the cache merged with the file, other workers save their own entries to it"""
+        if self.path is None or not self.dirty:
+            return
+
+        saved = self.read()
+        with self.lock:
+            self.merge(saved)
+            data = [[key, expires, value] for key, (expires, value) in self.entries.items()]
+            self.dirty = False
+
+        fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(self.path), suffix='.tmp')
+        with os.fdopen(fd, 'w') as f:
+            json.dump(data, f)
+        replace_file(tmp_path, self.path)
+
+
+participant_ranks = RankCache()
@@ -0,0 +1,76 @@
+from array import array
+from bisect import bisect_left, bisect_right
+from datetime import datetime, date
+
+from stores.constants import DATE_FORMAT
+
+
+def date_to_day(date_str):
+    return datetime.strptime(date_str, DATE_FORMAT).toordinal()
+
+
+def day_to_date(day):
+    return date.fromordinal(day).strftime(DATE_FORMAT)
+
+
+class RankHistory:
+    """Rank points of one queue, ordinal days kept sorted with the ranks in a parallel array"""
+
+    def __init__(self):
+        self.days = array('i')
+        self.ranks = array('i')
+
+    @classmethod
+    def from_json(cls, data):
+        """Build from the json layout, a dict of date strings to ranks"""
+        history = cls()
+        for day, rank in sorted((date_to_day(k), v) for k, v in data.items()):
+            history.days.append(day)
+            history.ranks.append(rank)
+        return history
+
+    def to_json(self):
+        return {day_to_date(day): rank for day, rank in zip(self.days, self.ranks)}
+
+    def __len__(self):
+        return len(self.days)
+
+    def set(self, day, rank):
+        index = bisect_left(self.days, day)
+
+        if index < len(self.days) and self.days[index] == day:
+            self.ranks[index] = rank
+        else:
+            self.days.insert(index, day)
+            self.ranks.insert(index, rank)
+
+    def get(self, day, default=None):
+        index = bisect_left(self.days, day)
+        if index < len(self.days) and self.days[index] == day:
+            return self.ranks[index]
+        return default
+
+    def nearest(self, pivot, exclude=None):
+        """Closest (day, rank) to the pivot day, the earlier one on a tie, None when empty"""
+        index = bisect_left(self.days, pivot)
+
+        # closest candidates on both sides, stepping over the excluded day
+        before = index - 1
+        after = index
+        if before >= 0 and self.days[before] == exclude:
+            before -= 1
+        if after < len(self.days) and self.days[after] == exclude:
+            after += 1
+
+        candidates = [x for x in [before, after] if 0 <= x < len(self.days)]
+        if not candidates:
+            return None
+
+        best = min(candidates, key=lambda x: (abs(self.days[x] - pivot), self.days[x]))
+        return self.days[best], self.ranks[best]
+
+    def between(self, start, end):
+        """(day, rank) points with start <= day <= end"""
+        lo = bisect_left(self.days, start)
+        hi = bisect_right(self.days, end)
+        return list(zip(self.days[lo:hi], self.ranks[lo:hi]))
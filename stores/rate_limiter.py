@@ -0,0 +1,129 @@
+import threading
+import time
+from collections import deque
+from concurrent.futures import Future
+
+from stores.constants import LOG, RIOT_APP_LIMITS, RIOT_METHOD_LIMITS
+from perf import Profiler
+
+
+class RateWindow:
+    """Bucket of permits over a rolling window, a spent permit comes back window seconds after use"""
+
+    def __init__(self, permits, window, margin=0.1):
+        self.permits = permits
+        # requests reach riot a little after we spend the permit
+        self.window = window + margin
+        self.spent = deque()
+
+    def wait_time(self, now):
+        # give back permits that left the window
+        while self.spent and self.spent[0] <= now - self.window:
+            self.spent.popleft()
+
+        if len(self.spent) < self.permits:
+            return 0
+
+        return self.spent[0] + self.window - now
+
+    def take(self, now):
+        self.spent.append(now)
+
+
+class RateLimiter:
+    def __init__(self, app_limits=None, method_limits=None):
+        app_limits = RIOT_APP_LIMITS if app_limits is None else app_limits
+        method_limits = RIOT_METHOD_LIMITS if method_limits is None else method_limits
+
+        self.app_windows = [RateWindow(permits, window) for permits, window in app_limits]
+        self.method_windows = {endpoint: [RateWindow(permits, window) for permits, window in limits]
+                               for endpoint, limits in method_limits.items()}
+        self.blocked_until = 0
+
+        self.lock = threading.Lock()
+        self.in_flight = {}
+
+        # stats
+        self.calls = 0
+        self.coalesced = 0
+        self.waited = 0
+
+    def acquire(self, endpoint):
+        """Block until a permit is free in the app and endpoint windows, then spend it"""
+        windows = self.app_windows + self.method_windows.get(endpoint, [])
+
+        while True:
+            with self.lock:
+                now = time.monotonic()
+                wait = max([self.blocked_until - now] + [x.wait_time(now) for x in windows])
+
+                if wait <= 0:
+                    for window in windows:
+                        window.take(now)
+                    self.calls += 1
+                    return
+
+                self.waited += wait
+
+            time.sleep(wait)
+
+    def request(self, endpoint):
+        """Spend a permit for a request that is about to reach riot"""
+        with Profiler('riot_wait', endpoint=endpoint):
+            self.acquire(endpoint)
+
+    def backoff(self, seconds):
+        """Stop every call for a while, used when Riot answers 429 anyway"""
+        LOG.warning(f'(rate limiter) - backing off for {seconds} seconds')
+        with self.lock:
+            self.blocked_until = max(self.blocked_until, time.monotonic() + seconds)
+
+    def call(self, endpoint, key, func):
+        """Run func once for identical calls already in flight, they share one result
+
+        Permits are spent by request when a call misses the caches and goes out, see stores.riot.
+        """
+        request_key = (endpoint, key)
+
+        with self.lock:
+            future = self.in_flight.get(request_key)
+            owner = future is None
+
+            if owner:
+                future = Future()
+                self.in_flight[request_key] = future
+            else:
+                self.coalesced += 1
+
+        if not owner:
+            return future.result()
+
+        result = error = None
+        try:
+            with Profiler('riot_call', endpoint=endpoint):
+                result = func()
+        except BaseException as e:
+            error = e
+            raise
+        finally:
+            with self.lock:
+                self.in_flight.pop(request_key, None)
+
+            # waiters are released whatever stopped the call, an interrupt included
+            if error is None:
+                future.set_result(result)
+            else:
+                future.set_exception(error)
+
+        return result
+
+    def stats(self):
+        with self.lock:
+            return {
+                'calls': self.calls,
+                'coalesced': self.coalesced,
+                'waited': round(self.waited, 3),
+            }
+
+
+riot_limiter = RateLimiter()
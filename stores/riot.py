@@ -0,0 +1,142 @@
+import threading
+
+from stores.constants import RIOT_CACHE_TTLS
+from stores.rate_limiter import riot_limiter
+
+configured = False
+
+# pipeline stores replacing cassiopeia's defaults when set, the benchmarks point this at a fake source
+PIPELINE = None
+
+# sqlite file of the persistent riot cache, set by the manager
+CACHE_PATH = None
+configure_lock = threading.Lock()
+
+
+def with_disk_cache(pipeline):
+    """The pipeline with the disk cache right after cassiopeia's memory cache"""
+    disk_cache = {'package': 'stores.riot_cache', 'path': CACHE_PATH, 'ttls': RIOT_CACHE_TTLS}
+
+    if 'Cache' not in pipeline:
+        return dict({'DiskCache': disk_cache}, **pipeline)
+
+    stores = {}
+    for name, config in pipeline.items():
+        stores[name] = config
+        if name == 'Cache':
+            stores['DiskCache'] = disk_cache
+    return stores
+
+
+def riot_endpoint(url):
+    """Limiter endpoint of a riot api url, None for calls only under the app limits"""
+    if '/lol/summoner/' in url:
+        return 'summoner'
+    if '/lol/league/' in url:
+        return 'league'
+    if '/matches/by-puuid/' in url:
+        return 'match_list'
+    if '/lol/match/' in url:
+        return 'match'
+    return None
+
+
+class LimitedClient:
+    """HTTP client of the riot api services, only requests that miss every cache spend a permit"""
+
+    def __init__(self, client, limiter=riot_limiter):
+        self.client = client
+        self.limiter = limiter
+
+    def get(self, url, *args, **kwargs):
+        self.limiter.request(riot_endpoint(url))
+        try:
+            return self.client.get(url, *args, **kwargs)
+        except Exception as e:
+            # cassiopeia retries 429s itself, every other caller waits with it
+            if getattr(e, 'code', None) == 429:
+                headers = getattr(e, 'response_headers', None) or {}
+                self.limiter.backoff(int(headers.get('Retry-After', 1)))
+            raise
+
+
+def limit_riot_api(cassiopeia):
+    """Put our limiter in front of the http client of every riot api service of the pipeline"""
+    from datapipelines import CompositeDataSource
+    from cassiopeia.datastores.riotapi.common import RiotAPIService
+
+    for source, _ in cassiopeia.configuration.settings.pipeline._sources:
+        services = [source]
+        if isinstance(source, CompositeDataSource):
+            services = {x for sources in source._sources.values() for x in sources}
+
+        for service in services:
+            if isinstance(service, RiotAPIService) and not isinstance(service._client, LimitedClient):
+                service._client = LimitedClient(service._client)
+
+
+def cass():
+    """cassiopeia with our settings applied, imported on the first riot call"""
+    global configured
+    import cassiopeia
+
+    if not configured:
+        with configure_lock:
+            if not configured:
+                settings = cassiopeia.get_default_config()
+                settings['logging']['print_calls'] = True
+                if PIPELINE is not None:
+                    settings['pipeline'] = PIPELINE
+                if CACHE_PATH is not None:
+                    settings['pipeline'] = with_disk_cache(settings['pipeline'])
+                cassiopeia.apply_settings(settings)
+                limit_riot_api(cassiopeia)
+                configured = True
+
+    return cassiopeia
+
+
+def forget(core_type, key, kind, disk_key):
+    """Drop one entry from the memory and disk caches, the next load asks riot"""
+    from cassiopeia.datastores.cache import Cache
+
+    for source, _ in cass().configuration.settings.pipeline._sources:
+        if isinstance(source, Cache):
+            try:
+                source._cache.delete(core_type, key)
+            except KeyError:
+                pass
+
+    found = disk_cache()
+    if found is not None:
+        found.forget(kind, [disk_key])
+
+
+def forget_summoner(name, region):
+    """Summoner looked up by name"""
+    from cassiopeia import Region
+    from cassiopeia.core.summoner import Summoner
+
+    platform = Region(region).platform.value
+    forget(Summoner, (platform, 'name', name), 'summoner', f'{platform}:name:{name}')
+
+
+def forget_league_entries(summoner_id, region):
+    """League entries of a summoner"""
+    from cassiopeia import Region
+    from cassiopeia.core.league import LeagueSummonerEntries
+
+    platform = Region(region).platform.value
+    forget(LeagueSummonerEntries, (platform, summoner_id), 'league', f'{platform}:{summoner_id}')
+
+
+def disk_cache():
+    """The pipeline's DiskCache, None until the first riot call or when riot payloads aren't persisted"""
+    if not configured or CACHE_PATH is None:
+        return None
+
+    from stores.riot_cache import DiskCache
+    for source, _ in cass().configuration.settings.pipeline._sources:
+        if isinstance(source, DiskCache):
+            return source
+    return None
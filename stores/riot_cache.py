@@ -0,0 +1,140 @@
+"""Persistent cassiopeia source and sink for riot payloads, loaded by the pipeline through stores.riot"""
+import json
+import sqlite3
+import threading
+import time
+from typing import Type, TypeVar, MutableMapping, Any, Iterable
+
+from datapipelines import DataSource, DataSink, PipelineContext, Query, NotFoundError, validate_query
+
+from cassiopeia.data import Platform, Region
+from cassiopeia.datastores.uniquekeys import convert_region_to_platform
+from cassiopeia.dto.summoner import SummonerDto
+from cassiopeia.dto.league import LeagueSummonerEntriesDto
+from cassiopeia.dto.match import MatchDto, TimelineDto
+
+T = TypeVar('T')
+
+
+class DiskCache(DataSource, DataSink):
+    """Riot dtos in sqlite, matches and timelines never expire, kinds listed in ttls expire after their seconds"""
+
+    schema = """
+        CREATE TABLE IF NOT EXISTS riot_cache (
+            kind TEXT NOT NULL,
+            key TEXT NOT NULL,
+            expires REAL,
+            data TEXT NOT NULL,
+            PRIMARY KEY (kind, key)
+        );
+    """
+
+    def __init__(self, path, ttls=None):
+        super().__init__()
+        self.path = path
+        self.ttls = ttls or {}
+
+        self.db = sqlite3.connect(path, check_same_thread=False)
+        self.db.execute('PRAGMA journal_mode=WAL')
+        self.db.executescript(self.schema)
+        self.lock = threading.Lock()
+
+        self.hits = 0
+        self.misses = 0
+
+    def load(self, kind, keys):
+        with self.lock:
+            for key in keys:
+                row = self.db.execute('SELECT expires, data FROM riot_cache WHERE kind = ? AND key = ?',
+                                      (kind, key)).fetchone()
+                if row is not None and (row[0] is None or row[0] > time.time()):
+                    self.hits += 1
+                    return json.loads(row[1])
+
+            self.misses += 1
+
+        raise NotFoundError(f'{kind} not in the disk cache')
+
+    def store(self, kind, keys, item):
+        ttl = self.ttls.get(kind)
+        expires = None if ttl is None else time.time() + ttl
+        data = json.dumps(item)
+
+        with self.lock:
+            self.db.executemany('INSERT OR REPLACE INTO riot_cache (kind, key, expires, data) VALUES (?, ?, ?, ?)',
+                                [(kind, key, expires, data) for key in keys])
+            self.db.commit()
+
+    def forget(self, kind, keys):
+        with self.lock:
+            self.db.executemany('DELETE FROM riot_cache WHERE kind = ? AND key = ?', [(kind, key) for key in keys])
+            self.db.commit()
+
+    def stats(self):
+        with self.lock:
+            rows = self.db.execute('SELECT kind, COUNT(*) FROM riot_cache GROUP BY kind').fetchall()
+            return {'hits': self.hits, 'misses': self.misses, 'rows': dict(rows)}
+
+    @DataSource.dispatch
+    def get(self, type: Type[T], query: MutableMapping[str, Any], context: PipelineContext = None) -> T:
+        pass
+
+    @DataSource.dispatch
+    def get_many(self, type: Type[T], query: MutableMapping[str, Any],
+                 context: PipelineContext = None) -> Iterable[T]:
+        pass
+
+    @DataSink.dispatch
+    def put(self, type: Type[T], item: T, context: PipelineContext = None) -> None:
+        pass
+
+    @DataSink.dispatch
+    def put_many(self, type: Type[T], items: Iterable[T], context: PipelineContext = None) -> None:
+        pass
+
+    # matches and timelines, keyed like riot match ids
+    _validate_match_query = Query.has('id').as_(int).also.has('platform').as_(Platform)
+
+    @get.register(MatchDto)
+    @validate_query(_validate_match_query, convert_region_to_platform)
+    def get_match(self, query: MutableMapping[str, Any], context: PipelineContext = None) -> MatchDto:
+        return MatchDto(self.load('match', [f'{query["platform"].value}_{query["id"]}']))
+
+    @put.register(MatchDto)
+    def put_match(self, item: MatchDto, context: PipelineContext = None) -> None:
+        self.store('match', [f'{item["platformId"]}_{item["matchId"]}'], item)
+
+    @get.register(TimelineDto)
+    @validate_query(_validate_match_query, convert_region_to_platform)
+    def get_timeline(self, query: MutableMapping[str, Any], context: PipelineContext = None) -> TimelineDto:
+        return TimelineDto(self.load('timeline', [f'{query["platform"].value}_{query["id"]}']))
+
+    @put.register(TimelineDto)
+    def put_timeline(self, item: TimelineDto, context: PipelineContext = None) -> None:
+        self.store('timeline', [f'{item["platform"]}_{item["matchId"]}'], item)
+
+    # summoners, stored once per way they can be looked up
+    @get.register(SummonerDto)
+    @validate_query(Query.has('platform').as_(Platform), convert_region_to_platform)
+    def get_summoner(self, query: MutableMapping[str, Any], context: PipelineContext = None) -> SummonerDto:
+        platform = query['platform'].value
+        keys = [f'{platform}:{name}:{query[name]}' for name in ['id', 'puuid', 'accountId', 'name'] if name in query]
+        return SummonerDto(self.load('summoner', keys))
+
+    @put.register(SummonerDto)
+    def put_summoner(self, item: SummonerDto, context: PipelineContext = None) -> None:
+        platform = Region(item['region']).platform.value
+        keys = [f'{platform}:{name}:{item[name]}' for name in ['id', 'puuid', 'accountId', 'name'] if name in item]
+        self.store('summoner', keys, item)
+
+    @get.register(LeagueSummonerEntriesDto)
+    @validate_query(Query.has('summoner.id').as_(str).also.has('platform').as_(Platform),
+                    convert_region_to_platform)
+    def get_league_entries(self, query: MutableMapping[str, Any],
+                           context: PipelineContext = None) -> LeagueSummonerEntriesDto:
+        return LeagueSummonerEntriesDto(self.load('league', [f'{query["platform"].value}:{query["summoner.id"]}']))
+
+    @put.register(LeagueSummonerEntriesDto)
+    def put_league_entries(self, item: LeagueSummonerEntriesDto, context: PipelineContext = None) -> None:
+        platform = Region(item['region']).platform.value
+        self.store('league', [f'{platform}:{item["summonerId"]}'], item)
@@ -0,0 +1,134 @@
+import random
+import threading
+import time
+from datetime import datetime
+
+from stores.constants import LOG, SCHEDULER_MAX_CONCURRENT, SCHEDULER_INTERVALS, SCHEDULER_IDLE_INTERVAL, \
+    SCHEDULER_JITTER, SCHEDULER_RETRY
+
+
+def refresh_interval(last_game, now):
+    """Seconds between two refreshes of a player whose newest game started at last_game"""
+    if last_game is None:
+        return SCHEDULER_IDLE_INTERVAL
+
+    age = now - last_game
+    for max_age, interval in SCHEDULER_INTERVALS:
+        if age <= max_age:
+            return interval
+    return SCHEDULER_IDLE_INTERVAL
+
+
+def jitter(seconds):
+    return seconds * random.uniform(1 - SCHEDULER_JITTER, 1 + SCHEDULER_JITTER)
+
+
+class RefreshScheduler:
+    """Refreshes every player on its own timer, active players often and idle ones rarely
+
+    Only the worker holding the scheduler lease plans refreshes, the others check back every lease ttl
+    in case it died.
+    """
+
+    def __init__(self, manager, lease, max_concurrent=SCHEDULER_MAX_CONCURRENT):
+        self.manager = manager
+        self.lease = lease
+
+        # imported here, apscheduler grows the heap enough to slow the garbage collector down in workers that
+        # never schedule
+        from apscheduler.executors.pool import ThreadPoolExecutor
+        from apscheduler.schedulers.background import BackgroundScheduler
+
+        # the pool size caps how many players refresh at once
+        self.scheduler = BackgroundScheduler(
+            executors={'default': ThreadPoolExecutor(max_concurrent)},
+            job_defaults={'coalesce': True, 'max_instances': 1, 'misfire_grace_time': None})
+
+        # username -> plan and counters
+        self.plans = {}
+        self.lock = threading.Lock()
+
+        self.refreshes = 0
+        self.retries = 0
+
+    def start(self):
+        self.scheduler.start()
+        self.scheduler.add_job(self.elect, 'interval', seconds=self.lease.ttl, id='elect',
+                               next_run_time=datetime.now())
+
+    def shutdown(self):
+        if self.scheduler.running:
+            self.scheduler.shutdown(wait=False)
+        self.lease.release()
+
+    def elect(self):
+        if not self.lease.acquire():
+            return
+
+        # already scheduling, new usernames still get a timer
+        for username in self.manager.usernames:
+            if username not in self.plans:
+                self.plan(username, startup=True)
+
+    def plan(self, username, startup=False, delay=None):
+        """Schedule the next refresh of a player from its activity"""
+        player = self.manager.get_player(username)
+        now = time.time()
+        interval = refresh_interval(player.last_game(), now)
+
+        if delay is not None:
+            run_at = now + delay
+        elif startup:
+            # overdue players are spread over the jitter window instead of all refreshing now
+            due = (player.last_refresh or 0) + interval
+            run_at = due if due > now else now + random.uniform(0, interval * SCHEDULER_JITTER)
+        else:
+            run_at = now + jitter(interval)
+
+        with self.lock:
+            plan = self.plans.setdefault(username, {'runs': 0, 'last_run': None})
+            plan['interval'] = interval
+            plan['next_run'] = run_at
+
+        self.scheduler.add_job(self.run, 'date', run_date=datetime.fromtimestamp(run_at), args=[username],
+                               id=f'refresh:{username}', replace_existing=True)
+
+    def run(self, username):
+        # another worker took over scheduling while this one was stalled
+        if not self.lease.renew():
+            with self.lock:
+                self.plans.pop(username, None)
+            return
+
+        # a manual refresh in another worker is writing
+        if not self.manager.hold_refresh():
+            LOG.warning(f'(scheduler) - refresh lease busy, retrying {username} later')
+            self.retries += 1
+            self.plan(username, delay=jitter(SCHEDULER_RETRY))
+            return
+
+        try:
+            self.manager.refresh_player(username)
+        except Exception as e:
+            LOG.warning(f'(scheduler) - refresh of {username} failed with {e!r}')
+        finally:
+            self.manager.drop_refresh()
+
+        with self.lock:
+            self.refreshes += 1
+            self.plans[username]['runs'] += 1
+            self.plans[username]['last_run'] = time.time()
+
+        self.plan(username)
+
+    def stats(self):
+        with self.lock:
+            plans = {k: dict(v) for k, v in self.plans.items()}
+
+        return {
+            'scheduling': bool(plans),
+            'refreshes': self.refreshes,
+            'retries': self.retries,
+            'refreshes_per_day': round(sum(86400 / x['interval'] for x in plans.values()), 1),
+            'players': plans,
+        }
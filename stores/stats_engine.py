@@ -0,0 +1,127 @@
+import threading
+import time
+
+import numpy as np
+
+from stores.storage import creation_timestamp
+
+CATEGORIES = ['player', 'queue', 'champion', 'position']
+AGGREGATIONS = ['count', 'sum', 'mean', 'min', 'max', 'median']
+
+
+class StatsEngine:
+    """Columnar copy of every tracked player's match stats, one numpy array per stat"""
+
+    def __init__(self, fields, capacity=1024):
+        self.fields = fields
+        self.size = 0
+        self.capacity = capacity
+
+        self.columns = {field: np.zeros(capacity, dtype=np.float64) for field in fields}
+        self.columns['win'] = np.zeros(capacity, dtype=np.bool_)
+        self.columns['creation'] = np.zeros(capacity, dtype=np.int64)
+        self.columns['duration'] = np.zeros(capacity, dtype=np.float64)
+
+        # categorical columns hold codes into their value lists
+        self.codes = {name: {} for name in CATEGORIES}
+        self.values = {name: [] for name in CATEGORIES}
+        for name in CATEGORIES:
+            self.columns[name] = np.zeros(capacity, dtype=np.int32)
+
+        self.lock = threading.Lock()
+
+    def code(self, name, value):
+        codes = self.codes[name]
+        if value not in codes:
+            codes[value] = len(codes)
+            self.values[name].append(value)
+        return codes[value]
+
+    def grow(self):
+        self.capacity *= 2
+        for name, column in self.columns.items():
+            grown = np.zeros(self.capacity, dtype=column.dtype)
+            grown[:self.size] = column[:self.size]
+            self.columns[name] = grown
+
+    def append(self, username, match):
+        info = match['match_info']
+        stats = match['player_stats']
+
+        with self.lock:
+            if self.size == self.capacity:
+                self.grow()
+
+            row = self.size
+            for field in self.fields:
+                self.columns[field][row] = stats.get(field) or 0
+
+            self.columns['win'][row] = bool(info['match_win'])
+            self.columns['creation'][row] = creation_timestamp(match)
+            self.columns['duration'][row] = info['duration'] or 0
+            self.columns['player'][row] = self.code('player', username)
+            self.columns['queue'][row] = self.code('queue', info['queue'])
+            self.columns['champion'][row] = self.code('champion', stats['championName'])
+            self.columns['position'][row] = self.code('position', stats['teamPosition'])
+
+            self.size += 1
+
+    def extend(self, username, matches):
+        for match in matches:
+            self.append(username, match)
+
+    def mask(self, days=None, **filters):
+        """Boolean row mask, filters are category name to value or list of values"""
+        mask = np.ones(self.size, dtype=np.bool_)
+
+        if days is not None:
+            mask &= self.columns['creation'][:self.size] >= time.time() - days * 86400
+
+        for name, wanted in filters.items():
+            if wanted is None:
+                continue
+            wanted = wanted if isinstance(wanted, (list, tuple)) else [wanted]
+            codes = [self.codes[name][x] for x in wanted if x in self.codes[name]]
+            mask &= np.isin(self.columns[name][:self.size], codes)
+
+        return mask
+
+    def query(self, stat, agg='mean', group_by=None, days=None, **filters):
+        """Aggregate one stat over the filtered rows, grouped by a category or as a single total
+
+        agg is one of AGGREGATIONS or pN for the Nth percentile"""
+        with self.lock:
+            mask = self.mask(days, **filters)
+            values = self.columns[stat][:self.size][mask]
+
+            if group_by is None:
+                groups = np.zeros(len(values), dtype=np.int64)
+                labels = ['all']
+            else:
+                codes, groups = np.unique(self.columns[group_by][:self.size][mask], return_inverse=True)
+                labels = [self.values[group_by][x] for x in codes]
+
+        if len(values) == 0:
+            return []
+
+        counts = np.bincount(groups, minlength=len(labels))
+
+        if agg == 'count':
+            results = counts.astype(np.float64)
+        elif agg in ['sum', 'mean']:
+            results = np.bincount(groups, weights=values, minlength=len(labels))
+            if agg == 'mean':
+                results = results / counts
+        elif agg in ['min', 'max']:
+            results = np.full(len(labels), np.inf if agg == 'min' else -np.inf)
+            (np.minimum if agg == 'min' else np.maximum).at(results, groups, values)
+        else:
+            # median and percentiles work on each group's sorted slice
+            percentile = 50 if agg == 'median' else float(agg[1:])
+            order = np.argsort(groups, kind='stable')
+            bounds = np.cumsum(counts)[:-1]
+            results = np.array([np.percentile(x, percentile) for x in np.split(values[order], bounds)])
+
+        return sorted(({'group': label, 'value': round(float(value), 4), 'games': int(count)}
+                       for label, value, count in zip(labels, results, counts)),
+                      key=lambda x: x['value'], reverse=True)
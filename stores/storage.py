@@ -0,0 +1,407 @@
+import json
+import os
+import sqlite3
+import threading
+from datetime import datetime
+
+from tinydb import TinyDB, Query
+
+from stores.constants import LOG, DATE_FORMAT, DATE_FORMAT_HOUR
+from stores.write_behind import AtomicJSONStorage, WriteBehindMiddleware
+from perf import Profiler
+
+
+# top level keys of a match
+MATCH_SECTIONS = ['match_info', 'player_stats', 'match_ranks']
+
+
+def creation_timestamp(match):
+    return int(datetime.strptime(match['match_info']['creation'], DATE_FORMAT_HOUR).timestamp())
+
+
+class PlayerStore:
+    """Everything Manager and Player need from a database, player documents use the json layout"""
+
+    def get_player(self, username):
+        """Return the player document or None"""
+        raise NotImplementedError
+
+    def all_players(self):
+        raise NotImplementedError
+
+    def save_player(self, data):
+        """Insert or replace a player document, may be buffered until flush"""
+        raise NotImplementedError
+
+    def get_matches(self, username, since=None, before=None, limit=None, sections=None):
+        """Matches of a player newest first as (creation, match) pairs, since and before are creation
+        timestamps and sections limits which top level keys get loaded"""
+        raise NotImplementedError
+
+    def flush(self):
+        """Write buffered changes, returns the number of bytes written"""
+        return 0
+
+    def generation(self):
+        """Token that changes when another process wrote to the store, cached players are stale then"""
+        return 0
+
+    @property
+    def bytes_written(self):
+        return 0
+
+    def close(self):
+        self.flush()
+
+
+class TinyDBStore(PlayerStore):
+    def __init__(self, path):
+        self.path = path
+        self.db = TinyDB(path, create_dirs=True, storage=WriteBehindMiddleware(AtomicJSONStorage))
+
+        # tinydb is not thread safe
+        self.lock = threading.RLock()
+
+        # times the file was reloaded after another worker replaced it
+        self.reloads = 0
+
+    @Profiler('db_read', backend='tinydb', op='get_player')
+    def get_player(self, username):
+        with self.lock:
+            return self.db.get(Query().username == username)
+
+    @Profiler('db_read', backend='tinydb', op='all_players')
+    def all_players(self):
+        with self.lock:
+            return self.db.all()
+
+    @Profiler('db_write', backend='tinydb', op='save_player')
+    def save_player(self, data):
+        user_query = Query().username == data['username']
+
+        with self.lock:
+            if self.db.get(user_query):
+                self.db.update(data, user_query)
+            else:
+                self.db.insert(data)
+
+    @Profiler('db_read', backend='tinydb', op='get_matches')
+    def get_matches(self, username, since=None, before=None, limit=None, sections=None):
+        sections = MATCH_SECTIONS if sections is None else sections
+
+        data = self.get_player(username)
+        if data is None:
+            return []
+
+        matches = []
+        for match in data.get('match_history', []):
+            creation = creation_timestamp(match)
+            if since is not None and creation <= since:
+                continue
+            if before is not None and creation >= before:
+                continue
+            matches.append((creation, {k: match[k] for k in sections if k in match}))
+
+        matches.sort(key=lambda x: x[0], reverse=True)
+        return matches[:limit] if limit is not None else matches
+
+    @Profiler('db_write', backend='tinydb', op='flush')
+    def flush(self):
+        with self.lock:
+            return self.db.storage.flush()
+
+    def generation(self):
+        with self.lock:
+            if self.db.storage.reload():
+                self.db.clear_cache()
+                self.reloads += 1
+            return self.reloads
+
+    @property
+    def bytes_written(self):
+        return self.db.storage.bytes_written
+
+    def close(self):
+        with self.lock:
+            self.db.close()
+
+
+class SQLiteStore(PlayerStore):
+    schema = """
+        CREATE TABLE IF NOT EXISTS players (
+            username TEXT PRIMARY KEY,
+            ranked TEXT NOT NULL,
+            invalid_matches TEXT NOT NULL,
+            extra TEXT NOT NULL DEFAULT '{}'
+        );
+        CREATE TABLE IF NOT EXISTS rank_history (
+            username TEXT NOT NULL,
+            queue TEXT NOT NULL,
+            day INTEGER NOT NULL,
+            date TEXT NOT NULL,
+            rank INTEGER NOT NULL,
+            PRIMARY KEY (username, queue, day)
+        );
+        CREATE TABLE IF NOT EXISTS matches (
+            username TEXT NOT NULL,
+            match_id INTEGER NOT NULL,
+            seq INTEGER NOT NULL,
+            creation INTEGER NOT NULL,
+            queue TEXT,
+            match_info TEXT NOT NULL,
+            player_stats TEXT NOT NULL,
+            PRIMARY KEY (username, match_id)
+        );
+        CREATE TABLE IF NOT EXISTS match_participants (
+            match_id INTEGER NOT NULL,
+            side TEXT NOT NULL,
+            slot INTEGER NOT NULL,
+            summoner_name TEXT,
+            stats TEXT NOT NULL,
+            PRIMARY KEY (match_id, side, slot)
+        );
+        CREATE INDEX IF NOT EXISTS idx_matches_match_id ON matches (match_id);
+        CREATE INDEX IF NOT EXISTS idx_matches_creation ON matches (username, creation);
+        CREATE INDEX IF NOT EXISTS idx_participants_name ON match_participants (summoner_name);
+    """
+
+    # player fields with their own column or table
+    player_columns = ['username', 'ranked', 'match_history', 'invalid_matches']
+
+    def __init__(self, path):
+        self.path = path
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+
+        # other workers may hold the write lock for a moment
+        self.conn = sqlite3.connect(path, timeout=10, check_same_thread=False)
+        self.conn.execute('PRAGMA journal_mode=WAL')
+        self.conn.executescript(self.schema)
+        self.upgrade_schema()
+        self.lock = threading.RLock()
+
+        # player documents waiting for flush
+        self.pending = {}
+        self.written = 0
+
+    def upgrade_schema(self):
+        """Add columns that older databases are missing"""
+        columns = [x[1] for x in self.conn.execute('PRAGMA table_info(players)')]
+        if 'extra' not in columns:
+            self.conn.execute("ALTER TABLE players ADD COLUMN extra TEXT NOT NULL DEFAULT '{}'")
+            self.conn.commit()
+
+        # archiving used to hand out seq numbers still taken by older rows, renumber in insertion order
+        duplicated = [x[0] for x in self.conn.execute(
+            'SELECT DISTINCT username FROM matches GROUP BY username, seq HAVING COUNT(*) > 1')]
+        for username in duplicated:
+            LOG.warning(f'(sqlite store) - renumbering match order of {username}')
+            self.conn.execute('UPDATE matches SET seq = (SELECT ordered.position FROM (SELECT rowid AS id, '
+                              'ROW_NUMBER() OVER (ORDER BY rowid) AS position FROM matches WHERE username = ?) '
+                              'AS ordered WHERE ordered.id = matches.rowid) WHERE username = ?', (username, username))
+        if duplicated:
+            self.conn.commit()
+
+    # reads
+    @Profiler('db_read', backend='sqlite', op='get_player')
+    def get_player(self, username):
+        with self.lock:
+            if username in self.pending:
+                return self.pending[username]
+
+            row = self.conn.execute('SELECT ranked, invalid_matches, extra FROM players WHERE username = ?',
+                                    (username,)).fetchone()
+            if row is None:
+                return None
+
+            ranked = json.loads(row[0])
+            for queue in ranked:
+                ranked[queue]['rank_history'] = {}
+            for queue, date, rank in self.conn.execute(
+                    'SELECT queue, date, rank FROM rank_history WHERE username = ? ORDER BY day', (username,)):
+                ranked.setdefault(queue, {'rank_history': {}})['rank_history'][date] = rank
+
+            rows = self.conn.execute('SELECT match_id, creation, match_info, player_stats FROM matches '
+                                     'WHERE username = ? ORDER BY seq', (username,)).fetchall()
+
+            data = json.loads(row[2])
+            data.update({
+                'username': username,
+                'ranked': ranked,
+                'match_history': self.build_matches(rows, MATCH_SECTIONS),
+                'invalid_matches': json.loads(row[1]),
+            })
+            return data
+
+    @Profiler('db_read', backend='sqlite', op='all_players')
+    def all_players(self):
+        with self.lock:
+            usernames = [x[0] for x in self.conn.execute('SELECT username FROM players')]
+            usernames += [x for x in self.pending if x not in usernames]
+            return [self.get_player(x) for x in usernames]
+
+    @Profiler('db_read', backend='sqlite', op='get_matches')
+    def get_matches(self, username, since=None, before=None, limit=None, sections=None):
+        sections = MATCH_SECTIONS if sections is None else sections
+
+        with self.lock:
+            if username in self.pending:
+                self.flush()
+
+            # only read the json columns that were asked for
+            columns = ['match_id', 'creation'] + [x for x in ['match_info', 'player_stats'] if x in sections]
+            sql = f'SELECT {", ".join(columns)} FROM matches WHERE username = ?'
+            args = [username]
+            if since is not None:
+                sql += ' AND creation > ?'
+                args.append(since)
+            if before is not None:
+                sql += ' AND creation < ?'
+                args.append(before)
+            sql += ' ORDER BY creation DESC'
+            if limit is not None:
+                sql += ' LIMIT ?'
+                args.append(limit)
+
+            rows = self.conn.execute(sql, args).fetchall()
+            return [(row[1], match) for row, match in zip(rows, self.build_matches(rows, sections))]
+
+    def build_matches(self, rows, sections):
+        """Rebuild match dicts from (match_id, creation, *json columns) rows and their shared participants"""
+        columns = [x for x in ['match_info', 'player_stats'] if x in sections]
+        matches = [{column: json.loads(value) for column, value in zip(columns, row[2:])} for row in rows]
+
+        if 'match_ranks' not in sections:
+            return matches
+
+        ids = [x[0] for x in rows]
+        ranks = {x: {'red': [], 'blue': []} for x in ids}
+
+        # sqlite caps the number of bound variables
+        for i in range(0, len(ids), 500):
+            chunk = ids[i:i + 500]
+            for match_id, side, stats in self.conn.execute(
+                    f'SELECT match_id, side, stats FROM match_participants WHERE match_id IN '
+                    f'({",".join("?" * len(chunk))}) ORDER BY match_id, side, slot', chunk):
+                ranks[match_id].setdefault(side, []).append(json.loads(stats))
+
+        for match_id, match in zip(ids, matches):
+            match['match_ranks'] = ranks[match_id]
+        return matches
+
+    # writes
+    @Profiler('db_write', backend='sqlite', op='save_player')
+    def save_player(self, data):
+        with self.lock:
+            self.pending[data['username']] = data
+
+    @Profiler('db_write', backend='sqlite', op='flush')
+    def flush(self):
+        with self.lock:
+            if not self.pending:
+                return 0
+
+            written = 0
+            with self.conn:
+                for data in self.pending.values():
+                    written += self.write_player(data)
+            self.pending = {}
+
+            self.written += written
+            LOG.warning(f'(sqlite store) - flushed {written} bytes to disk')
+            return written
+
+    def write_player(self, data):
+        username = data['username']
+
+        ranked = {queue: {k: v for k, v in values.items() if k != 'rank_history'}
+                  for queue, values in data['ranked'].items()}
+        ranked = json.dumps(ranked)
+        invalid = json.dumps(data['invalid_matches'])
+
+        # any other top level field, like the sync cursor
+        extra = json.dumps({k: v for k, v in data.items() if k not in self.player_columns})
+
+        self.conn.execute('INSERT OR REPLACE INTO players VALUES (?, ?, ?, ?)', (username, ranked, invalid, extra))
+        written = len(ranked) + len(invalid) + len(extra)
+
+        # rank history
+        history_rows = []
+        for queue, values in data['ranked'].items():
+            for date, rank in values['rank_history'].items():
+                day = datetime.strptime(date, DATE_FORMAT).toordinal()
+                history_rows.append((username, queue, day, date, rank))
+        self.conn.executemany('INSERT OR REPLACE INTO rank_history VALUES (?, ?, ?, ?, ?)', history_rows)
+
+        # only matches the db doesn't hold yet
+        known = {x[0] for x in self.conn.execute('SELECT match_id FROM matches WHERE username = ?', (username,))}
+
+        # matches that moved to the player's archive, participants go once no player holds the match
+        gone = list(known - {x['match_info']['id'] for x in data['match_history']})
+        for i in range(0, len(gone), 500):
+            chunk = gone[i:i + 500]
+            marks = ",".join("?" * len(chunk))
+            self.conn.execute(f'DELETE FROM matches WHERE username = ? AND match_id IN ({marks})', [username] + chunk)
+            self.conn.execute(f'DELETE FROM match_participants WHERE match_id IN ({marks}) '
+                              f'AND match_id NOT IN (SELECT match_id FROM matches)', chunk)
+
+        # seq keeps the history order, new rows go after every row left so archived ones free no numbers
+        seq = self.conn.execute('SELECT COALESCE(MAX(seq), -1) FROM matches WHERE username = ?',
+                                (username,)).fetchone()[0]
+
+        for match in data['match_history']:
+            match_id = match['match_info']['id']
+            if match_id in known:
+                continue
+            seq += 1
+
+            match_info = json.dumps(match['match_info'])
+            player_stats = json.dumps(match['player_stats'])
+            self.conn.execute('INSERT INTO matches VALUES (?, ?, ?, ?, ?, ?, ?)',
+                              (username, match_id, seq, creation_timestamp(match), match['match_info']['queue'],
+                               match_info, player_stats))
+            written += len(match_info) + len(player_stats)
+
+            # players sharing matches keep the ranks in the shared store instead
+            for side, participants in match.get('match_ranks', {}).items():
+                for slot, participant in enumerate(participants):
+                    stats = json.dumps(participant)
+                    cursor = self.conn.execute('INSERT OR IGNORE INTO match_participants VALUES (?, ?, ?, ?, ?)',
+                                               (match_id, side, slot, participant.get('summonerName'), stats))
+                    written += len(stats) * cursor.rowcount
+
+        return written
+
+    def generation(self):
+        # data_version only moves when another connection commits
+        with self.lock:
+            return self.conn.execute('PRAGMA data_version').fetchone()[0]
+
+    @property
+    def bytes_written(self):
+        return self.written
+
+    def close(self):
+        with self.lock:
+            self.flush()
+            self.conn.close()
+
+
+def open_store(backend, database_dir):
+    if backend == 'sqlite':
+        return SQLiteStore(os.path.join(database_dir, 'players.sqlite3'))
+    if backend == 'tinydb':
+        return TinyDBStore(os.path.join(database_dir, 'players_db.json'))
+    raise ValueError(f'unknown storage backend {backend}')
+
+
+def migrate_json_to_sqlite(json_path, sqlite_path):
+    """Copy every player of a tinydb json file into a sqlite store, returns the number of players"""
+    source = TinyDBStore(json_path)
+    target = SQLiteStore(sqlite_path)
+
+    players = source.all_players()
+    for data in players:
+        target.save_player(data)
+
+    target.close()
+    return len(players)
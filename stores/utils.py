@@ -1,5 +1,9 @@
-from datetime import datetime
-from stores.constants import DATE_FORMAT
+import os
+import stat
+
+# mode bits a plain open() leaves off new files, read once at import while nothing else runs
+UMASK = os.umask(0)
+os.umask(UMASK)
 
 
 def convert_to_rank_val(f_data):
@@ -20,5 +24,29 @@ def convert_to_rank_val(f_data):
     return formatted
 
 
-def nearest_date(items, pivot):
-    return datetime.strftime(min(items, key=lambda x: abs(x - pivot)), DATE_FORMAT)
+def project_match(match, fields):
+    """Copy of a match holding only the fields asked for, either whole sections or section.key"""
+    projected = {}
+
+    for field in fields:
+        section, _, key = field.partition('.')
+        if section not in match:
+            continue
+
+        if not key:
+            projected[section] = match[section]
+        elif isinstance(match[section], dict) and key in match[section]:
+            projected.setdefault(section, {})[key] = match[section][key]
+
+    return projected
+
+
+def replace_file(tmp_path, path):
+    """os.replace keeping the mode of the file replaced, mkstemp files would only be readable by us"""
+    try:
+        mode = stat.S_IMODE(os.stat(path).st_mode)
+    except FileNotFoundError:
+        mode = 0o666 & ~UMASK
+
+    os.chmod(tmp_path, mode)
+    os.replace(tmp_path, path)
@@ -0,0 +1,126 @@
+import json
+import os
+import tempfile
+import threading
+
+from tinydb.middlewares import Middleware
+from tinydb.storages import Storage
+
+from stores.constants import LOG
+from stores.utils import replace_file
+
+
+class AtomicJSONStorage(Storage):
+    """TinyDB json storage that writes a temp file and swaps it in, a crash never leaves half a file"""
+
+    def __init__(self, path, create_dirs=False, encoding=None, **kwargs):
+        super().__init__()
+
+        self.path = path
+        self.encoding = encoding
+        self.kwargs = kwargs
+
+        self.bytes_written = 0
+
+        # file state as of our last read or write, tells us when another process replaced it
+        self.signature = None
+
+        if create_dirs:
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+
+    def file_signature(self):
+        try:
+            stat = os.stat(self.path)
+        except FileNotFoundError:
+            return None
+        return stat.st_mtime_ns, stat.st_size, stat.st_ino
+
+    def changed(self):
+        return self.file_signature() != self.signature
+
+    def read(self):
+        self.signature = self.file_signature()
+        if self.signature is None or self.signature[1] == 0:
+            return None
+
+        with open(self.path, encoding=self.encoding) as f:
+            return json.load(f)
+
+    def write(self, data):
+        serialized = json.dumps(data, **self.kwargs).encode(self.encoding or 'utf-8')
+
+        # temp file in the same dir so the replace stays on one filesystem
+        fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(self.path), suffix='.tmp')
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                f.write(serialized)
+                f.flush()
+                os.fsync(f.fileno())
+            replace_file(tmp_path, self.path)
+            self.signature = self.file_signature()
+        except BaseException:
+            os.remove(tmp_path)
+            raise
+
+        self.bytes_written += len(serialized)
+
+
+class WriteBehindMiddleware(Middleware):
+    """Keep the db in memory and only write it to disk on flush"""
+
+    def __init__(self, storage_cls):
+        super().__init__(storage_cls)
+
+        self.cache = None
+        self.dirty = False
+        self.lock = threading.RLock()
+
+        # stats
+        self.flushes = 0
+
+    def read(self):
+        with self.lock:
+            if self.cache is None:
+                self.cache = self.storage.read()
+            return self.cache
+
+    def write(self, data):
+        with self.lock:
+            self.cache = data
+            self.dirty = True
+
+    def reload(self):
+        """Drop the cache when another process replaced the file, unflushed changes of ours win"""
+        with self.lock:
+            if self.cache is None or not self.storage.changed():
+                return False
+
+            if self.dirty:
+                LOG.warning('(write behind) - file changed on disk with unflushed changes, keeping ours')
+                return False
+
+            self.cache = None
+            return True
+
+    def flush(self):
+        """Write buffered changes to disk, returns the number of bytes written"""
+        with self.lock:
+            if not self.dirty:
+                return 0
+
+            before = self.storage.bytes_written
+            self.storage.write(self.cache)
+            self.dirty = False
+            self.flushes += 1
+
+            written = self.storage.bytes_written - before
+            LOG.warning(f'(write behind) - flushed {written} bytes to disk')
+            return written
+
+    @property
+    def bytes_written(self):
+        return self.storage.bytes_written
+
+    def close(self):
+        self.flush()
+        self.storage.close()
@@ -0,0 +1,43 @@
+import pytest
+
+import stores.manager
+
+
+@pytest.fixture
+def manager(tmp_path, monkeypatch):
+    """A manager over an empty database, nothing runs in the background"""
+    monkeypatch.setattr(stores.manager, 'DATABASE_PATH', str(tmp_path))
+    monkeypatch.setattr(stores.manager, 'STORAGE_BACKEND', 'sqlite')
+    monkeypatch.setattr(stores.manager, 'ICON_PREWARM', False)
+    monkeypatch.setattr(stores.manager, 'SCHEDULER_ENABLED', False)
+    monkeypatch.setattr(stores.manager, 'RANK_CACHE_PERSIST', False)
+    monkeypatch.setattr(stores.manager, 'RIOT_CACHE_PERSIST', False)
+    monkeypatch.setattr(stores.manager, 'summ_manager', None)
+    monkeypatch.setattr(stores.manager, 'scheduler_lease', None)
+
+    manager = stores.manager.get_manager()
+    manager.usernames = ['some player', 'other player']
+    return manager
+
+
+@pytest.fixture
+def client(manager):
+    from main import app
+    return app.test_client()
+
+
+@pytest.fixture
+def fake_source(monkeypatch):
+    """cassiopeia answering from bench.fake_source, the limiter lets everything through"""
+    from bench.fake_source import pipeline
+    from stores import riot
+    from stores.rate_limiter import riot_limiter
+
+    monkeypatch.setattr(riot, 'PIPELINE', pipeline())
+    monkeypatch.setattr(riot, 'CACHE_PATH', None)
+    monkeypatch.setattr(riot, 'configured', False)
+    monkeypatch.setattr(riot_limiter, 'app_windows', [])
+    monkeypatch.setattr(riot_limiter, 'method_windows', {})
+
+    yield riot.PIPELINE
+    riot.configured = False
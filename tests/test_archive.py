@@ -0,0 +1,103 @@
+import json
+from datetime import datetime
+
+from stores.archive import MatchArchive
+from stores.constants import DATE_FORMAT_HOUR
+from stores.player import Player
+
+START = 1700000000
+
+
+def match(n, win=True):
+    return {
+        'match_info': {'id': f'EUW1_{n}',
+                       'creation': datetime.fromtimestamp(START + n * 60).strftime(DATE_FORMAT_HOUR),
+                       'queue': 'ranked_solo_fives', 'match_win': win, 'duration': 1800},
+        'player_stats': {'championName': 'Ahri', 'teamPosition': 'MIDDLE', 'kills': n},
+    }
+
+
+def ids(pairs):
+    return [x['match_info']['id'] for _, x in pairs]
+
+
+class Store:
+    def save_player(self, data):
+        pass
+
+
+def test_stream_is_newest_first_and_filtered(tmp_path):
+    archive = MatchArchive(str(tmp_path), 'some player')
+    archive.append([match(n) for n in range(0, 10)], [])
+    archive.append([match(n) for n in range(10, 20)], [])
+
+    assert ids(archive.stream()) == [f'EUW1_{n}' for n in reversed(range(20))]
+    assert ids(archive.stream(since=START + 14 * 60)) == [f'EUW1_{n}' for n in reversed(range(15, 20))]
+    assert ids(archive.stream(before=START + 5 * 60)) == [f'EUW1_{n}' for n in reversed(range(5))]
+    assert len(archive) == 20 and 'EUW1_3' in archive
+
+
+def test_overlapping_members_are_merged(tmp_path):
+    archive = MatchArchive(str(tmp_path), 'some player')
+    archive.append([match(n) for n in range(10, 20)], [])
+    # a late sync archived matches older than the first batch
+    archive.append([match(n) for n in range(0, 5)] + [match(n) for n in range(20, 25)], [])
+
+    newest_first = [f'EUW1_{n}' for n in reversed(range(25)) if not 5 <= n < 10]
+    assert ids(archive.stream()) == newest_first
+
+    # pages chained through the creation cursor see every match once
+    paged, before = [], None
+    while True:
+        page = archive.get_matches(before=before, limit=4)
+        if not page:
+            break
+        paged += ids(page)
+        before = page[-1][0]
+    assert paged == newest_first
+
+    assert ids(archive.stream(since=START + 20 * 60)) == newest_first[:4]
+
+
+def test_summary_counts_the_members_it_covers(tmp_path):
+    archive = MatchArchive(str(tmp_path), 'some player')
+    archive.append([match(n) for n in range(5)], [['a']])
+    archive.append([match(n) for n in range(5, 8)], [['b']])
+
+    summary = archive.summary()
+    assert summary == {'count': 8, 'members': 2, 'buckets': [['b']]}
+    assert archive.summary_current(summary)
+    assert not archive.summary_current(dict(summary, members=1))
+
+
+def test_archived_matches_left_in_the_document_count_once(tmp_path):
+    archive = MatchArchive(str(tmp_path), 'some player')
+    player = Player('some player', Store(), archive)
+    player.load_from_json({'match_history': [match(n) for n in range(200)]})
+    player.archive_cold_matches()
+    assert len(archive) == 100 and len(player.match_history) == 100
+
+    # a crash before the trimmed document was saved
+    reloaded = Player('some player', Store(), MatchArchive(str(tmp_path), 'some player'))
+    reloaded.load_from_json({'match_history': [match(n) for n in range(200)]})
+
+    assert len(reloaded.match_history) == 100
+    assert reloaded.aggregates.to_json() == player.aggregates.to_json()
+    assert reloaded.aggregates.to_json()[0][3]['games'] == 200
+
+
+def test_summary_behind_the_index_is_counted_again(tmp_path):
+    archive = MatchArchive(str(tmp_path), 'some player')
+    player = Player('some player', Store(), archive)
+    player.load_from_json({'match_history': [match(n) for n in range(200)]})
+    player.archive_cold_matches()
+
+    # a crash between the index line and the summary
+    stale = archive.summary()
+    archive.append([match(n) for n in range(-50, 0)], stale['buckets'])
+    with open(archive.summary_path, 'w') as f:
+        json.dump(stale, f)
+
+    reloaded = Player('some player', Store(), MatchArchive(str(tmp_path), 'some player'))
+    reloaded.load_from_json({'match_history': player.match_history})
+    assert reloaded.aggregates.to_json()[0][3]['games'] == 250
@@ -0,0 +1,41 @@
+from stores.events import EventBus
+
+
+def test_subscribers_resume_from_the_backlog():
+    bus = EventBus(backlog=3)
+    for i in range(5):
+        bus.publish('player', {'i': i})
+
+    subscriber = bus.subscribe(last_id=3)
+    assert [subscriber.get_nowait()[0] for _ in range(2)] == [4, 5]
+
+    # event 1 already left the backlog
+    subscriber = bus.subscribe(last_id=1)
+    assert subscriber.get_nowait() == (None, 'reset', {'last_id': 5})
+    assert bus.missed(2) is False and bus.missed(9) is True
+
+
+def test_slow_subscribers_are_dropped():
+    bus = EventBus(client_queue=2)
+    subscriber = bus.subscribe()
+    for i in range(3):
+        bus.publish('player', {'i': i})
+
+    assert bus.stats()['subscribers'] == 0 and bus.stats()['dropped'] == 1
+    lines = list(bus.stream(subscriber, heartbeat=1))
+    assert lines == ['id: 2\nevent: player\ndata: {"i":1}\n\n']
+
+
+def test_stream_filters_types_and_sends_heartbeats():
+    bus = EventBus()
+    subscriber = bus.subscribe()
+    bus.publish('progress', {'done': 1})
+    bus.publish('player', {'name': 'some player'})
+
+    idle = []
+    stream = bus.stream(subscriber, heartbeat=0.01, types={'player'}, on_idle=lambda: idle.append(1))
+    assert next(stream) == 'id: 2\nevent: player\ndata: {"name":"some player"}\n\n'
+    assert next(stream).startswith(': ') and idle == [1]
+
+    bus.drop(subscriber)
+    assert list(stream) == []
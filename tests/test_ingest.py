@@ -0,0 +1,87 @@
+import random
+import threading
+import time
+
+import pytest
+
+from stores.ingest import Pipeline, Stage
+
+
+def jitter(item):
+    # workers finish out of order
+    time.sleep(random.random() / 500)
+    return item
+
+
+def counted(source, listed):
+    for item in source:
+        listed.append(item)
+        yield item
+
+
+def test_items_reach_the_sink_in_source_order():
+    sunk = []
+    stages = [Stage('double', lambda x: jitter(x * 2), workers=4), Stage('shift', lambda x: jitter(x + 1), workers=3)]
+    Pipeline('order', range(200), stages, sunk.append, queue_size=4).run()
+
+    assert sunk == [x * 2 + 1 for x in range(200)]
+
+
+def test_sink_stops_the_pipeline():
+    sunk = []
+
+    def sink(item):
+        if item == 10:
+            return False
+        sunk.append(item)
+
+    Pipeline('stop', range(1000), [Stage('work', jitter, workers=4)], sink, queue_size=2).run()
+    assert sunk == list(range(10))
+
+
+def test_stage_error_is_raised_from_run():
+    def work(item):
+        if item == 5:
+            raise ValueError(item)
+        return item
+
+    sunk = []
+    with pytest.raises(ValueError):
+        Pipeline('error', range(100), [Stage('work', work, workers=2)], sunk.append).run()
+    assert sunk == list(range(len(sunk)))
+    assert 5 not in sunk
+
+
+def test_limit_bounds_what_is_listed_and_worked():
+    listed, worked, sunk = [], [], []
+    lock = threading.Lock()
+
+    def work(item):
+        with lock:
+            worked.append(item)
+        return jitter(item)
+
+    pipeline = Pipeline('limit', counted(range(100), listed), [Stage('work', work, workers=4)], sunk.append,
+                        limit=10)
+    pipeline.run()
+
+    assert sunk == list(range(10))
+    assert listed == list(range(10))
+    assert sorted(worked) == list(range(10))
+
+
+def test_extend_lets_uncounted_items_through():
+    listed, sunk = [], []
+
+    def sink(item):
+        sunk.append(item)
+        # odd items do not count toward the limit
+        if item % 2:
+            pipeline.extend()
+
+    pipeline = Pipeline('extend', counted(range(100), listed), [Stage('work', jitter, workers=4)], sink, limit=5)
+    pipeline.run()
+
+    assert sunk == list(range(9))
+    assert listed == list(range(9))
+    assert pipeline.stats()['stages']['work']['processed'] == 9
@@ -0,0 +1,55 @@
+import threading
+
+from stores.jobs import JobRunner
+
+
+def test_job_tracks_every_target():
+    runner = JobRunner(max_workers=3)
+    release = threading.Event()
+    finished = threading.Event()
+    done = []
+
+    def refresh(target):
+        release.wait(5)
+        if target == 'broken':
+            raise ValueError(target)
+
+    job = runner.submit('refresh', ['a', 'b', 'broken'], refresh, stats=lambda: {'calls': 3},
+                        on_done=lambda x: (done.append(x.id), finished.set()))
+    assert runner.active('refresh') is job
+    assert not job.done
+
+    release.set()
+    assert finished.wait(5)
+
+    summary = job.to_json()
+    assert done == [job.id]
+    assert summary['status'] == 'failed'
+    assert summary['completed'] == summary['total'] == 3
+    assert summary['progress']['a'] == {'status': 'done', 'error': None}
+    assert summary['progress']['broken']['error'] == "ValueError('broken')"
+    assert summary['stats'] == {'calls': 3}
+    assert runner.active('refresh') is None
+    assert runner.get(job.id) is job
+
+
+def test_job_without_targets_is_done_at_once():
+    done = []
+    job = JobRunner().submit('icons', [], lambda x: None, on_done=done.append)
+    assert job.status == 'done' and done == [job]
+
+
+def test_only_finished_jobs_are_forgotten():
+    runner = JobRunner(max_workers=1, max_kept=2)
+    release = threading.Event()
+
+    first = runner.submit('slow', ['a'], lambda x: release.wait(5))
+    runner.submit('slow', ['b'], lambda x: None)
+    runner.submit('slow', ['c'], lambda x: None)
+    assert runner.get(first.id) is first
+
+    release.set()
+    runner.pool.shutdown(wait=True)
+    runner.submit('late', [], lambda x: None)
+    assert runner.get(first.id) is None
+    assert len(runner.jobs) == 2
@@ -0,0 +1,86 @@
+import sqlite3
+import time
+
+from stores.lease import Lease
+
+
+def wait_for(condition, timeout=5):
+    deadline = time.time() + timeout
+    while not condition():
+        if time.time() > deadline:
+            raise AssertionError('timed out')
+        time.sleep(0.01)
+
+
+def test_only_one_holder(tmp_path):
+    path = str(tmp_path / 'locks.sqlite3')
+    first, second = Lease(path, 'refresh'), Lease(path, 'refresh')
+
+    assert first.acquire()
+    assert not second.acquire()
+    assert second.current()['holder'] == first.holder
+
+    first.release()
+    assert second.current() is None
+    assert second.acquire()
+    second.release()
+
+
+def test_lapsed_lease_is_taken_over(tmp_path):
+    path = str(tmp_path / 'locks.sqlite3')
+    first, second = Lease(path, 'refresh', ttl=0.2), Lease(path, 'refresh', ttl=0.2)
+
+    assert first.acquire()
+    # a crashed holder stops renewing
+    first.stop_heartbeat.set()
+    wait_for(lambda: second.current() is None)
+
+    assert second.acquire()
+    assert not first.renew()
+    second.release()
+
+
+def test_heartbeat_restarts_after_failed_renew(tmp_path):
+    path = str(tmp_path / 'locks.sqlite3')
+    lease = Lease(path, 'refresh', ttl=0.3)
+    renew = lease.renew
+
+    lease.renew = lambda: False
+    assert lease.acquire()
+    wait_for(lambda: not lease.heartbeat.is_alive())
+    assert lease.stop_heartbeat is None
+
+    lease.renew = renew
+    assert lease.acquire()
+    assert lease.heartbeat.is_alive()
+
+    # held well past the ttl only if the new heartbeat renews it
+    time.sleep(0.75)
+    assert lease.current()['mine']
+
+    other = Lease(path, 'refresh', ttl=0.3)
+    assert not other.acquire()
+    lease.release()
+
+
+def test_heartbeat_survives_renew_errors(tmp_path):
+    path = str(tmp_path / 'locks.sqlite3')
+    lease = Lease(path, 'refresh', ttl=0.3)
+    renew = lease.renew
+    failures = []
+
+    def flaky():
+        if len(failures) < 1:
+            failures.append(1)
+            raise sqlite3.OperationalError('database is locked')
+        return renew()
+
+    lease.renew = flaky
+    assert lease.acquire()
+    wait_for(lambda: failures)
+    time.sleep(0.5)
+
+    assert lease.heartbeat.is_alive()
+    assert lease.current()['mine']
+    lease.release()
+    wait_for(lambda: not lease.heartbeat.is_alive())
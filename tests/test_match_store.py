@@ -0,0 +1,50 @@
+import threading
+import time
+
+from stores.match_store import MatchStore, shared_part, compact, is_compact, hydrate
+
+
+def test_compact_records_hydrate_back():
+    match = {
+        'match_info': {'match_id': 1, 'sides': {'blue': [], 'red': []}},
+        'player_stats': {'kills': 3},
+        'match_ranks': {'a': 1400},
+    }
+    record = compact(match)
+    assert is_compact(record) and not is_compact(match)
+    assert hydrate(record, shared_part(match)) == match
+
+
+def test_put_many_keeps_the_first_shared_part(tmp_path):
+    store = MatchStore(str(tmp_path / 'shared.db'), cache_size=1)
+    first = store.put_many({1: {'sides': 1}, 2: {'sides': 2}})
+    again = store.put_many({1: {'sides': 'other'}})
+    assert again[1] == {'sides': 1} and again[1] == first[1]
+
+    # only one entry fits in memory, the rest come back from sqlite
+    assert store.get_many([1, 2]) == {1: {'sides': 1}, 2: {'sides': 2}}
+    assert store.stats()['stored'] == 2 and store.stats()['cached'] == 1
+
+
+def test_claim_waits_for_the_builder(tmp_path):
+    store = MatchStore(str(tmp_path / 'shared.db'))
+    assert store.claim(1) is None
+
+    found = []
+    waiter = threading.Thread(target=lambda: found.append(store.claim(1, timeout=5)))
+    waiter.start()
+    while store.stats()['waits'] == 0:
+        time.sleep(0.01)
+
+    shared = store.put(1, {'sides': 1})
+    waiter.join(5)
+    assert found == [shared]
+    assert store.stats()['built'] == 1
+
+
+def test_claim_builds_again_after_a_release(tmp_path):
+    store = MatchStore(str(tmp_path / 'shared.db'))
+    assert store.claim(1) is None
+    store.release(1)
+    assert store.claim(1) is None
+    assert store.claim(1, timeout=0.01) is None
@@ -0,0 +1,71 @@
+import datetime
+
+from PIL import Image
+
+import stores.manager
+from stores.icon_cache import IconCache
+
+
+def test_get_all_has_an_etag_per_encoding(client):
+    gzipped = client.get('/player/get_all', headers={'Accept-Encoding': 'gzip'})
+    plain = client.get('/player/get_all')
+
+    assert gzipped.headers['Content-Encoding'] == 'gzip'
+    assert gzipped.headers['ETag'] == plain.headers['ETag'][:-1] + '-gz"'
+    assert gzipped.headers['Vary'] == plain.headers['Vary'] == 'Accept-Encoding'
+    assert [x['username'] for x in plain.get_json()] == ['some player', 'other player']
+
+    assert client.get('/player/get_all', headers={'Accept-Encoding': 'gzip',
+                                                  'If-None-Match': gzipped.headers['ETag']}).status_code == 304
+    assert client.get('/player/get_all', headers={'If-None-Match': plain.headers['ETag']}).status_code == 304
+    assert client.get('/player/get_all', headers={'Accept-Encoding': 'gzip',
+                                                  'If-None-Match': plain.headers['ETag']}).status_code == 200
+
+
+def test_get_all_links_the_archive(client):
+    player, = [x for x in client.get('/player/get_all').get_json() if x['username'] == 'some player']
+    assert player['archived_matches'] == 0
+    assert client.get(player['matches_url']).get_json()['matches'] == []
+
+
+def test_get_all_body_is_rebuilt_on_a_new_day(manager, monkeypatch):
+    body = manager.all_response()
+    assert manager.all_response() is body
+
+    class Tomorrow(datetime.date):
+        @classmethod
+        def today(cls):
+            return datetime.date.fromordinal(datetime.date.today().toordinal() + 1)
+
+    monkeypatch.setattr(stores.manager, 'date', Tomorrow)
+    assert manager.all_response() is not body
+
+
+def test_matches_rejects_bad_arguments(client):
+    assert client.get('/player/some%20player/matches?limit=2').status_code == 200
+    assert client.get('/player/some%20player/matches?fields=match_info.id,player_stats').status_code == 200
+
+    for query in ['since=abc', 'cursor=abc', 'limit=abc', 'limit=0', 'fields=match_info.nope', 'fields=nope']:
+        response = client.get(f'/player/some%20player/matches?{query}')
+        assert response.status_code == 400, query
+        assert 'error' in response.get_json()
+
+    assert client.get('/player/nobody/matches').status_code == 404
+
+
+def test_failed_icon_download_is_not_cached(client, manager, tmp_path, monkeypatch):
+    def unreachable(player):
+        raise ConnectionError('riot is down')
+
+    monkeypatch.setattr(manager, 'icons', IconCache(str(tmp_path / 'assets')))
+    monkeypatch.setattr(manager, 'download_icon', unreachable)
+
+    response = client.get('/player/profile_icon?player=some%20player')
+    assert response.status_code == 502
+    assert response.headers['Cache-Control'] == 'no-store'
+    assert 'ETag' not in response.headers
+
+    # an icon saved since is served
+    monkeypatch.setattr(manager, 'download_icon', lambda player: manager.icons.save(player, Image.new('RGB', (8, 8))))
+    response = client.get('/player/profile_icon?player=some%20player')
+    assert response.status_code == 200 and response.mimetype == 'image/jpeg' and response.data
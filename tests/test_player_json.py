@@ -0,0 +1,39 @@
+import copy
+
+from stores.player import Player
+
+
+class Store:
+    def save_player(self, data):
+        pass
+
+
+def test_loading_leaves_the_document_alone():
+    # an older document, nearest_rank came later
+    document = {
+        'username': 'some player',
+        'ranked': {
+            'RANKED_SOLO_5x5': {'rank': 1450, 'winrate': [10, 8], 'rank_history': {'01/05/2023': 1400}},
+            'RANKED_FLEX_SR': {'rank': 0, 'winrate': [0, 0], 'rank_history': {}},
+        },
+        'match_history': [],
+        'invalid_matches': ['EUW1_1'],
+    }
+    saved = copy.deepcopy(document)
+
+    player = Player('some player', Store())
+    player.load_from_json(document)
+
+    assert document == saved
+    assert player.ranked['RANKED_SOLO_5x5']['nearest_rank'] == ['', 0]
+    assert player.rank_history['RANKED_SOLO_5x5'].to_json() == {'01/05/2023': 1400}
+
+
+def test_save_round_trips():
+    player = Player('some player', Store())
+    player.rank_history['RANKED_SOLO_5x5'].set(738000, 1200)
+    player.ranked['RANKED_SOLO_5x5']['rank'] = 1200
+
+    reloaded = Player('some player', Store())
+    reloaded.load_from_json(copy.deepcopy(player.save_to_json()))
+    assert reloaded.save_to_json() == player.save_to_json()
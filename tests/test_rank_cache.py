@@ -0,0 +1,74 @@
+import time
+
+from stores.rank_cache import RankCache
+
+
+def test_entries_expire_and_stay_bounded():
+    cache = RankCache(max_size=2, ttl=0.2)
+    cache.set('a', 1)
+    cache.set('b', 2)
+    assert cache.get('a') == 1
+
+    # b is the least recently used
+    cache.set('c', 3)
+    assert cache.get('b') is None
+    assert cache.get('a') == 1 and cache.get('c') == 3
+
+    time.sleep(0.25)
+    assert cache.get('a') is None
+    assert cache.stats()['size'] == 1
+
+
+def test_get_or_load_only_loads_misses():
+    cache = RankCache()
+    loads = []
+
+    def load():
+        loads.append(1)
+        return 1400
+
+    assert cache.get_or_load('a', load) == 1400
+    assert cache.get_or_load('a', load) == 1400
+    assert len(loads) == 1
+    assert cache.stats()['hits'] == 1 and cache.stats()['misses'] == 1
+
+
+def test_workers_saving_to_one_file_keep_each_others_entries(tmp_path):
+    path = str(tmp_path / 'rank_cache.json')
+    first, second = RankCache(path=path), RankCache(path=path)
+
+    first.set('a', 1)
+    first.save()
+    second.set('b', 2)
+    second.save()
+    first.set('c', 3)
+    first.save()
+
+    reloaded = RankCache(path=path)
+    reloaded.load()
+    assert {k: reloaded.get(k) for k in 'abc'} == {'a': 1, 'b': 2, 'c': 3}
+
+
+def test_later_expiry_wins_and_unknown_entries_are_least_recent(tmp_path):
+    path = str(tmp_path / 'rank_cache.json')
+    other = RankCache(path=path, ttl=100)
+    other.set('a', 'newer')
+    other.set('b', 2)
+    other.save()
+
+    cache = RankCache(path=path, ttl=10, max_size=2)
+    cache.set('a', 'older')
+    cache.set('c', 3)
+    cache.load()
+
+    # b is dropped first, it was never used here
+    assert cache.get('a') == 'newer'
+    assert cache.get('b') is None
+    assert cache.get('c') == 3
+
+
+def test_clean_cache_does_not_write(tmp_path):
+    path = tmp_path / 'rank_cache.json'
+    cache = RankCache(path=str(path))
+    cache.save()
+    assert not path.exists()
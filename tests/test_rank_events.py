@@ -0,0 +1,67 @@
+from datetime import date
+
+import pytest
+
+from stores import riot
+from stores.leaderboard import Leaderboard
+from stores.player import Player
+from stores.rank_history import day_to_date
+
+
+class Store:
+    def save_player(self, data):
+        pass
+
+
+@pytest.fixture
+def player(monkeypatch):
+    monkeypatch.setattr(riot, 'forget_league_entries', lambda summoner_id, region: None)
+
+    player = Player('some player', Store())
+    player._cass_summoner = object()
+    player.get_summoner_id = lambda: 'summoner-id'
+    player.league = {'tier': 'GOLD', 'division': 'II', 'leaguePoints': 50, 'wins': 10, 'losses': 8}
+    player.get_league_entries = lambda summoner: [dict(player.league, queue='RANKED_SOLO_5x5')]
+
+    player.events = []
+    player.listeners.append(lambda event, who, payload: player.events.append((event, payload)))
+    return player
+
+
+def days_ago(n):
+    return day_to_date(date.today().toordinal() - n)
+
+
+def load(player, rank, history, nearest):
+    player.load_from_json({'ranked': {
+        'RANKED_SOLO_5x5': {'rank': rank, 'winrate': [10, 8], 'nearest_rank': nearest, 'rank_history': history},
+        'RANKED_FLEX_SR': {'rank': 0, 'winrate': [0, 0], 'nearest_rank': ['', 0], 'rank_history': {}},
+    }})
+
+
+def test_rank_change_is_sent_with_todays_point(player):
+    # a single point from yesterday, nothing to compare with until today's is written
+    load(player, 1300, {days_ago(1): 1300}, ['', 0])
+    player.add_rank_to_history()
+
+    (event, entry), = player.events
+    assert event == 'rank_changed'
+    assert entry['rank'] == 1450
+    assert entry['nearest_rank'] == [days_ago(1), 1300]
+    assert Leaderboard.format(1, player.username, entry)['delta'] == 150
+
+
+def test_new_day_moves_nearest_rank_without_a_rank_change(player):
+    # picked yesterday, when the newest point was today's
+    load(player, 1450, {days_ago(2): 1200, days_ago(1): 1450}, [days_ago(2), 1200])
+    player.add_rank_to_history()
+
+    (event, entry), = player.events
+    assert entry['rank'] == 1450
+    assert entry['nearest_rank'] == [days_ago(1), 1450]
+
+
+def test_unchanged_rank_sends_nothing(player):
+    load(player, 1450, {days_ago(1): 1450}, [days_ago(1), 1450])
+    player.add_rank_to_history()
+    assert player.events == []
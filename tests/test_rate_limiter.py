@@ -0,0 +1,116 @@
+import threading
+import time
+
+import pytest
+
+from bench.fake_riot import FakeRiot, PATHS, fetch
+from cassiopeia.datastores.common import HTTPClient
+from stores.rate_limiter import RateLimiter
+from stores.riot import LimitedClient
+
+
+@pytest.fixture
+def fake_riot():
+    started = []
+
+    def start(**kwargs):
+        fake = FakeRiot(port=0, **kwargs)
+        started.append(fake)
+        return fake, fake.start()
+
+    yield start
+    for fake in started:
+        fake.stop()
+
+
+def run_threads(count, target):
+    threads = [threading.Thread(target=target) for _ in range(count)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join(10)
+
+
+def test_windows_hold_calls_back():
+    limiter = RateLimiter([(3, 0.3)], {'match': [(2, 0.3)]})
+
+    start = time.monotonic()
+    for _ in range(3):
+        limiter.acquire('league')
+    assert time.monotonic() - start < 0.1
+
+    limiter.acquire('match')
+    assert time.monotonic() - start >= 0.3
+    assert limiter.stats()['calls'] == 4
+
+
+def test_identical_calls_share_one_request(fake_riot):
+    fake, url = fake_riot(latency=0.3)
+    limiter = RateLimiter([], {})
+    client = LimitedClient(HTTPClient(), limiter)
+    codes = []
+
+    run_threads(8, lambda: codes.append(limiter.call('match', 'EUW1_1', lambda: fetch(client, url, 'match', 'EUW1_1'))))
+
+    assert codes == [200] * 8
+    assert fake.requests == {PATHS['match'].format('EUW1_1'): 1}
+    assert limiter.stats() == {'calls': 1, 'coalesced': 7, 'waited': 0}
+
+
+def test_429_backs_off_every_caller(fake_riot):
+    # the server is stricter than the limiter
+    fake, url = fake_riot(app_limits=[(2, 1)], method_limits={}, latency=0)
+    limiter = RateLimiter([], {})
+    client = LimitedClient(HTTPClient(), limiter)
+
+    assert [fetch(client, url, 'league', x) for x in range(3)] == [200, 200, 429]
+    blocked = limiter.blocked_until - time.monotonic()
+    assert blocked >= 0.5
+
+    # the next caller waits out Retry-After before reaching riot
+    start = time.monotonic()
+    assert fetch(client, url, 'match', 'EUW1_1') == 200
+    assert time.monotonic() - start >= blocked - 0.05
+    assert fake.counts == {'ok': 3, 'limited': 1}
+
+
+def test_interrupted_call_releases_waiters():
+    limiter = RateLimiter([], {})
+    started, release = threading.Event(), threading.Event()
+    errors = []
+
+    def interrupted():
+        started.set()
+        release.wait(5)
+        raise KeyboardInterrupt
+
+    def wait():
+        try:
+            limiter.call('summoner', 'name', lambda: 'unused')
+        except BaseException as e:
+            errors.append(e)
+
+    owner_errors = []
+
+    def owner():
+        try:
+            limiter.call('summoner', 'name', interrupted)
+        except BaseException as e:
+            owner_errors.append(e)
+
+    owner_thread = threading.Thread(target=owner)
+    owner_thread.start()
+    started.wait(5)
+
+    waiters = [threading.Thread(target=wait) for _ in range(3)]
+    for thread in waiters:
+        thread.start()
+    while limiter.stats()['coalesced'] < 3:
+        time.sleep(0.01)
+    release.set()
+
+    for thread in [owner_thread] + waiters:
+        thread.join(5)
+        assert not thread.is_alive()
+    assert len(errors) == 3 and all(isinstance(x, KeyboardInterrupt) for x in errors + owner_errors)
+    assert limiter.in_flight == {}
@@ -0,0 +1,39 @@
+import time
+
+import pytest
+from datapipelines import NotFoundError
+
+from stores.riot_cache import DiskCache
+
+
+def test_entries_load_by_any_key(tmp_path):
+    cache = DiskCache(str(tmp_path / 'riot.db'))
+    cache.store('summoner', ['EUW1:id:a', 'EUW1:name:some player'], {'id': 'a'})
+
+    assert cache.load('summoner', ['EUW1:puuid:x', 'EUW1:name:some player']) == {'id': 'a'}
+    with pytest.raises(NotFoundError):
+        cache.load('summoner', ['EUW1:puuid:x'])
+    assert cache.stats() == {'hits': 1, 'misses': 1, 'rows': {'summoner': 2}}
+
+
+def test_listed_kinds_expire(tmp_path):
+    cache = DiskCache(str(tmp_path / 'riot.db'), ttls={'league': 0.1})
+    cache.store('league', ['EUW1:a'], [])
+    cache.store('match', ['EUW1_1'], {'matchId': 1})
+
+    time.sleep(0.15)
+    with pytest.raises(NotFoundError):
+        cache.load('league', ['EUW1:a'])
+    assert cache.load('match', ['EUW1_1']) == {'matchId': 1}
+
+
+def test_forget_and_reopen(tmp_path):
+    path = str(tmp_path / 'riot.db')
+    cache = DiskCache(path)
+    cache.store('match', ['EUW1_1'], {'matchId': 1})
+    cache.store('match', ['EUW1_2'], {'matchId': 2})
+    cache.forget('match', ['EUW1_1'])
+
+    reopened = DiskCache(path)
+    assert reopened.stats()['rows'] == {'match': 1}
+    assert reopened.load('match', ['EUW1_2']) == {'matchId': 2}
@@ -0,0 +1,33 @@
+import threading
+
+import stores.manager
+from stores.lease import Lease
+
+
+def test_only_the_lease_holder_builds_the_manager(tmp_path, monkeypatch):
+    built = threading.Event()
+    timers = []
+
+    monkeypatch.setattr(stores.manager, 'DATABASE_PATH', str(tmp_path))
+    monkeypatch.setattr(stores.manager, 'SCHEDULER_ENABLED', True)
+    monkeypatch.setattr(stores.manager, 'summ_manager', None)
+    monkeypatch.setattr(stores.manager, 'scheduler_lease', None)
+    monkeypatch.setattr(stores.manager, 'get_manager', built.set)
+    monkeypatch.setattr(threading.Timer, 'start', lambda self: timers.append(self))
+
+    other = Lease(str(tmp_path / 'locks.sqlite3'), 'scheduler')
+    assert other.acquire()
+
+    # another worker schedules, nothing is built and the same lease is tried again later
+    stores.manager.start_scheduler()
+    lease = stores.manager.scheduler_lease
+    assert len(timers) == 1
+    assert not built.is_set()
+
+    other.release()
+    timers[0].function()
+    assert built.wait(5)
+    assert stores.manager.scheduler_lease is lease
+    assert lease.current()['mine']
+    assert len(timers) == 1
+    lease.release()
@@ -0,0 +1,169 @@
+import copy
+import sqlite3
+from datetime import datetime
+
+import pytest
+
+from stores.constants import DATE_FORMAT_HOUR
+from stores.storage import open_store, migrate_json_to_sqlite, SQLiteStore, TinyDBStore
+
+START = 1700000000
+
+
+def match(n):
+    return {
+        'match_info': {'id': n, 'creation': datetime.fromtimestamp(START + n * 60).strftime(DATE_FORMAT_HOUR),
+                       'queue': 'ranked_solo_fives', 'match_win': n % 2 == 0, 'duration': 1800},
+        'player_stats': {'championName': 'Ahri', 'teamPosition': 'MIDDLE', 'kills': n},
+        'match_ranks': {'red': [{'summonerName': f'red {n}', 'rank': 1200}],
+                        'blue': [{'summonerName': f'blue {n}', 'rank': 1300}]},
+    }
+
+
+def player(username, matches):
+    return {
+        'username': username,
+        'ranked': {
+            'RANKED_SOLO_5x5': {'rank': 1450, 'winrate': [10, 8], 'nearest_rank': ['01/05/2023', 1400],
+                                'rank_history': {'01/05/2023': 1400, '02/05/2023': 1450}},
+            'RANKED_FLEX_SR': {'rank': 0, 'winrate': [0, 0], 'nearest_rank': ['', 0], 'rank_history': {}},
+        },
+        'match_history': [match(n) for n in matches],
+        'invalid_matches': [9999],
+        'sync_cursor': None,
+    }
+
+
+@pytest.fixture(params=['tinydb', 'sqlite'])
+def store(request, tmp_path):
+    store = open_store(request.param, str(tmp_path))
+    yield store
+    store.close()
+
+
+def test_players_round_trip(store):
+    data = player('some player', range(5))
+    store.save_player(copy.deepcopy(data))
+    assert store.get_player('some player') == data
+
+    store.flush()
+    assert store.get_player('some player') == data
+    assert store.get_player('nobody') is None
+    assert [x['username'] for x in store.all_players()] == ['some player']
+
+
+def test_saves_add_matches(store):
+    store.save_player(player('some player', range(5)))
+    store.flush()
+    store.save_player(player('some player', range(8)))
+    store.flush()
+
+    assert [x['match_info']['id'] for x in store.get_player('some player')['match_history']] == list(range(8))
+
+
+def test_match_pages(store):
+    store.save_player(player('some player', range(10)))
+    store.flush()
+
+    page = store.get_matches('some player', limit=3)
+    assert [x[1]['match_info']['id'] for x in page] == [9, 8, 7]
+    assert page[0][0] == START + 9 * 60
+
+    page = store.get_matches('some player', since=START + 2 * 60, before=page[-1][0])
+    assert [x[1]['match_info']['id'] for x in page] == [6, 5, 4, 3]
+
+    creation, only_stats = store.get_matches('some player', limit=1, sections=['player_stats'])[0]
+    assert only_stats == {'player_stats': match(9)['player_stats']}
+    assert store.get_matches('nobody') == []
+
+
+def test_generation_moves_with_other_writers(tmp_path):
+    for backend in ['tinydb', 'sqlite']:
+        first, second = open_store(backend, str(tmp_path)), open_store(backend, str(tmp_path))
+        first.save_player(player('some player', range(2)))
+        first.flush()
+
+        assert len(second.get_player('some player')['match_history']) == 2
+        generation = second.generation()
+        assert second.generation() == generation
+
+        first.save_player(player('some player', range(4)))
+        first.flush()
+        assert second.generation() != generation
+        assert len(second.get_player('some player')['match_history']) == 4
+
+        first.close()
+        second.close()
+
+
+def test_migrate_json_to_sqlite(tmp_path):
+    source = TinyDBStore(str(tmp_path / 'players_db.json'))
+    players = [player('some player', range(5)), player('other player', range(3, 7))]
+    for data in players:
+        source.save_player(copy.deepcopy(data))
+    source.close()
+
+    assert migrate_json_to_sqlite(str(tmp_path / 'players_db.json'), str(tmp_path / 'players.sqlite3')) == 2
+
+    target = SQLiteStore(str(tmp_path / 'players.sqlite3'))
+    assert sorted(target.all_players(), key=lambda x: x['username']) == sorted(players, key=lambda x: x['username'])
+    target.close()
+
+
+def test_sync_cursor_is_kept(store):
+    data = dict(player('some player', range(3)), sync_cursor={'creation': START + 120, 'id': 2})
+    store.save_player(data)
+    store.flush()
+    assert store.get_player('some player')['sync_cursor'] == {'creation': START + 120, 'id': 2}
+
+
+def test_upgrade_adds_the_extra_column(tmp_path):
+    path = str(tmp_path / 'players.sqlite3')
+    conn = sqlite3.connect(path)
+    conn.executescript("""
+        CREATE TABLE players (username TEXT PRIMARY KEY, ranked TEXT NOT NULL, invalid_matches TEXT NOT NULL);
+        INSERT INTO players VALUES ('some player', '{"RANKED_SOLO_5x5": {"rank": 1450}}', '[]');
+    """)
+    conn.close()
+
+    store = SQLiteStore(path)
+    data = store.get_player('some player')
+    assert 'sync_cursor' not in data
+    assert data['ranked'] == {'RANKED_SOLO_5x5': {'rank': 1450, 'rank_history': {}}}
+    store.close()
+
+
+def test_archived_matches_leave_the_sqlite_store(tmp_path):
+    store = SQLiteStore(str(tmp_path / 'players.sqlite3'))
+    store.save_player(player('some player', range(10)))
+    store.flush()
+
+    # the oldest five went to the archive, new ones keep the history order after the rows left
+    store.save_player(player('some player', list(range(5, 10)) + [10, 11]))
+    store.flush()
+
+    assert [x['match_info']['id'] for x in store.get_player('some player')['match_history']] == list(range(5, 12))
+    seqs = [x[0] for x in store.conn.execute("SELECT seq FROM matches WHERE username = 'some player' ORDER BY seq")]
+    assert len(set(seqs)) == 7
+    assert store.conn.execute('SELECT COUNT(*) FROM match_participants WHERE match_id < 5').fetchone()[0] == 0
+    store.close()
+
+
+def test_upgrade_renumbers_duplicated_seqs(tmp_path):
+    path = str(tmp_path / 'players.sqlite3')
+    store = SQLiteStore(path)
+    store.save_player(player('some player', range(6)))
+    store.save_player(player('other player', range(3)))
+    store.flush()
+
+    # numbers handed out again by older archiving code
+    store.conn.execute("UPDATE matches SET seq = seq % 3 WHERE username = 'some player'")
+    store.conn.commit()
+    store.close()
+
+    store = SQLiteStore(path)
+    seqs = [x[0] for x in store.conn.execute("SELECT seq FROM matches WHERE username = 'some player' ORDER BY rowid")]
+    assert seqs == sorted(set(seqs)) and len(seqs) == 6
+    assert [x['match_info']['id'] for x in store.get_player('some player')['match_history']] == list(range(6))
+    assert [x['match_info']['id'] for x in store.get_player('other player')['match_history']] == list(range(3))
+    store.close()
@@ -0,0 +1,92 @@
+import time
+
+import pytest
+
+from stores.player import Player
+
+
+class Store:
+    def __init__(self):
+        self.saved = None
+
+    def save_player(self, data):
+        self.saved = data
+
+
+@pytest.fixture
+def player(fake_source, monkeypatch):
+    # the fake source makes new games up on every listing, a retried sync has to see the same ones
+    listings = {}
+    get_match_list = Player.get_match_list
+
+    def same_listing(self, count, start_time=None):
+        if start_time not in listings:
+            listings[start_time] = get_match_list(self, count, start_time)
+        return list(listings[start_time])
+
+    monkeypatch.setattr(Player, 'get_match_list', same_listing)
+    return Player('Fake Summoner 3', Store())
+
+
+def ids(player):
+    return [x['match_info']['id'] for x in player.match_history]
+
+
+def first_sync(player):
+    player.add_match_to_history()
+    # new games are dated up to now, they have to be newer than the cursor
+    time.sleep(1)
+
+
+def test_first_sync_walks_the_limit(player):
+    player.add_match_to_history()
+
+    assert len(player.match_history) == 40
+    assert len(set(ids(player))) == 40
+    assert player.sync_cursor is not None
+    assert player.database.saved['sync_cursor'] == player.sync_cursor
+
+    stages = player.ingest.stats()['stages']
+    assert stages['list']['processed'] == stages['fetch']['processed'] == 40
+
+
+def test_next_sync_only_lists_new_matches(player):
+    first_sync(player)
+    cursor = player.sync_cursor
+
+    player.add_match_to_history()
+    assert len(player.match_history) == 45
+    assert player.ingest.stats()['stages']['list']['processed'] == 5
+    assert player.sync_cursor['creation'] > cursor['creation']
+
+
+def test_interrupted_sync_is_resumed(player, monkeypatch):
+    first_sync(player)
+    cursor = player.sync_cursor
+    synced = set(ids(player))
+
+    enrich_match = Player.enrich_match
+    enriched = []
+
+    def failing(self, item):
+        if item['status'] == 'new':
+            enriched.append(item)
+            if len(enriched) == 3:
+                raise RuntimeError('riot went away')
+        return enrich_match(self, item)
+
+    monkeypatch.setattr(Player, 'enrich_match', failing)
+    with pytest.raises(RuntimeError):
+        player.add_match_to_history()
+
+    # matches saved before the failure stay, the cursor waits for a whole walk
+    assert player.sync_cursor == cursor
+    assert len(player.match_history) < 45
+
+    monkeypatch.setattr(Player, 'enrich_match', enrich_match)
+    player.add_match_to_history()
+
+    assert len(player.match_history) == 45
+    assert len(set(ids(player))) == 45
+    assert synced < set(ids(player))
+    assert player.sync_cursor['creation'] > cursor['creation']
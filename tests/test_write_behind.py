@@ -0,0 +1,83 @@
+import os
+import stat
+
+from tinydb import TinyDB, Query
+
+from stores.rank_cache import RankCache
+from stores.utils import UMASK
+from stores.write_behind import AtomicJSONStorage, WriteBehindMiddleware
+
+
+def mode(path):
+    return stat.S_IMODE(os.stat(path).st_mode)
+
+
+def test_atomic_write_keeps_the_file_mode(tmp_path):
+    path = str(tmp_path / 'players_db.json')
+
+    storage = AtomicJSONStorage(path)
+    storage.write({'_default': {}})
+    assert mode(path) == 0o666 & ~UMASK
+
+    os.chmod(path, 0o640)
+    storage.write({'_default': {'1': {'username': 'some player'}}})
+    assert mode(path) == 0o640
+    assert storage.read() == {'_default': {'1': {'username': 'some player'}}}
+    assert os.listdir(tmp_path) == ['players_db.json']
+
+
+def test_rank_cache_save_keeps_the_file_mode(tmp_path):
+    path = str(tmp_path / 'rank_cache.json')
+    cache = RankCache(path=path)
+    cache.set('summoner', 1200)
+    cache.save()
+
+    os.chmod(path, 0o644)
+    cache.set('other', 1300)
+    cache.save()
+    assert mode(path) == 0o644
+
+
+def test_writes_wait_for_flush(tmp_path):
+    path = str(tmp_path / 'players_db.json')
+    db = TinyDB(path, storage=WriteBehindMiddleware(AtomicJSONStorage))
+
+    db.insert({'username': 'some player'})
+    assert not os.path.exists(path)
+
+    assert db.storage.flush() > 0
+    assert db.storage.flush() == 0
+
+    other = TinyDB(path, storage=WriteBehindMiddleware(AtomicJSONStorage))
+    assert other.search(Query().username == 'some player')
+
+
+def test_reload_picks_up_another_writer(tmp_path):
+    path = str(tmp_path / 'players_db.json')
+    first = TinyDB(path, storage=WriteBehindMiddleware(AtomicJSONStorage))
+    second = TinyDB(path, storage=WriteBehindMiddleware(AtomicJSONStorage))
+
+    first.insert({'username': 'some player'})
+    first.storage.flush()
+    assert len(second) == 1
+
+    first.insert({'username': 'other player'})
+    first.storage.flush()
+    assert len(second) == 1
+    assert second.storage.reload()
+    assert len(second) == 2
+
+
+def test_reload_keeps_unflushed_changes(tmp_path):
+    path = str(tmp_path / 'players_db.json')
+    first = TinyDB(path, storage=WriteBehindMiddleware(AtomicJSONStorage))
+    second = TinyDB(path, storage=WriteBehindMiddleware(AtomicJSONStorage))
+
+    first.insert({'username': 'some player'})
+    first.storage.flush()
+    second.insert({'username': 'mine'})
+
+    first.insert({'username': 'other player'})
+    first.storage.flush()
+    assert not second.storage.reload()
+    assert [x['username'] for x in second.all()] == ['some player', 'mine']